@@ -1,13 +1,15 @@
 import sys
 import os
 
-from .pattern import Pattern
+from .pattern import Pattern, PatternStack
 
 
 def _module_path():
     return os.path.dirname(__file__)
 
 
+from .composition import Composition
+from .stop_condition import StopCondition
 from .calc import *
 from .utility import *
 from .optimization import *
@@ -1,11 +1,15 @@
 # -*- coding: utf-8 -*-
+from __future__ import annotations
 from typing import Optional
 import numpy as np
+from scipy.fft import dct, dst, fft, ifft, next_fast_len
 import lmfit
 
 from . import Pattern
-from .utility import calculate_incoherent_scattering, calculate_f_squared_mean, calculate_f_mean_squared, \
-    convert_density_to_atoms_per_cubic_angstrom
+from .pattern import PatternStack, create_pattern_like
+from .composition import as_composition
+from .sine_kernel import get_sine_kernel, sine_transform_integral, trapezoid_weights
+from .utility import convert_density_to_atoms_per_cubic_angstrom
 
 from .methods import SqMethod, NormalizationMethod, FourierTransformMethod
 
@@ -14,22 +18,23 @@ __all__ = ['calculate_normalization_factor_raw', 'calculate_normalization_factor
            'calculate_fr', 'calculate_gr_raw', 'calculate_gr']
 
 
-def calculate_normalization_factor_raw(sample_pattern: Pattern, atomic_density: float, f_squared_mean: np.ndarray,
-                                       f_mean_squared: np.ndarray, incoherent_scattering: Optional[np.ndarray] = None,
-                                       attenuation_factor: float = 0.001) -> float:
+def calculate_normalization_factor_raw(sample_pattern: Pattern | PatternStack, atomic_density: float,
+                                       f_squared_mean: np.ndarray, f_mean_squared: np.ndarray,
+                                       incoherent_scattering: Optional[np.ndarray] = None,
+                                       attenuation_factor: float = 0.001) -> float | np.ndarray:
     """
     Calculates the normalization factor for a sample pattern given all the parameters. If you do not have them
     already calculated please consider using calculate_normalization_factor, which has an easier interface since it
     just requires density and composition as parameters.
 
-    :param sample_pattern:     background subtracted sample pattern
+    :param sample_pattern:     background subtracted sample pattern or PatternStack
     :param atomic_density:      density in atoms per cubic Angstrom
     :param f_squared_mean:      <f^2>
     :param f_mean_squared:      <f>^2
     :param incoherent_scattering: compton scattering from sample, if set to None, it will not be used
     :param attenuation_factor:  attenuation factor used in the exponential, in order to correct for the q cutoff
 
-    :return:                    normalization factor
+    :return:                    normalization factor, for a PatternStack an array with one factor per pattern
     """
     q, intensity = sample_pattern.data
     # calculate values for integrals
@@ -57,12 +62,10 @@ def calculate_normalization_factor(sample_pattern: Pattern, density: float, comp
     :return: normalization factor
     """
     q, intensity = sample_pattern.data
+    composition = as_composition(composition)
 
-    f_squared_mean = calculate_f_squared_mean(composition, q)
-    f_mean_squared = calculate_f_mean_squared(composition, q)
-    if use_incoherent_scattering:
-        incoherent_scattering = calculate_incoherent_scattering(composition, q)
-    else:
+    _, f_mean_squared, f_squared_mean, incoherent_scattering = composition.form_factors(q)
+    if not use_incoherent_scattering:
         incoherent_scattering = None
     atomic_density = convert_density_to_atoms_per_cubic_angstrom(composition, density)
 
@@ -72,7 +75,7 @@ def calculate_normalization_factor(sample_pattern: Pattern, density: float, comp
 
 def fit_normalization_factor(sample_pattern: Pattern, composition: dict[str, float], q_cutoff: float = 3,
                              method: str = "linear", use_incoherent_scattering: bool = True,
-                             sf_source: str = 'hajdu') -> float:
+                             sf_source: str = 'hajdu', solver: str = 'lstsq') -> float:
     """
     Estimates the normalization factor n for calculating S(Q) by fitting
         (Intensity*n-Multiple Scattering) * Q^2
@@ -87,6 +90,10 @@ def fit_normalization_factor(sample_pattern: Pattern, composition: dict[str, flo
     :param use_incoherent_scattering:
                                 whether to use incoherent scattering, in some cases it is already subtracted
     :param sf_source:           source of the scattering factors. Possible sources are 'hajdu' and 'brown_hubbell'.
+    :param solver:              determines how the fit is performed, possible values are:
+                                    - 'lstsq' solves the bounded linear least squares problem (n >= 0,
+                                      multiple >= 0) directly
+                                    - 'lmfit' uses an iterative lmfit minimization of the squared residuals
 
     :return: normalization factor
     """
@@ -99,9 +106,16 @@ def fit_normalization_factor(sample_pattern: Pattern, composition: dict[str, flo
     else:
         raise NotImplementedError("{} is not an allowed method for fit_normalization_factor".format(method))
 
-    theory = calculate_f_squared_mean(composition, q, sf_source) * x
+    _, _, f_squared_mean, incoherent_scattering = as_composition(composition).form_factors(q, sf_source)
+    theory = f_squared_mean * x
     if use_incoherent_scattering:
-        theory += x * calculate_incoherent_scattering(composition, q, sf_source)
+        theory += x * incoherent_scattering
+
+    if solver == 'lstsq':
+        n, _ = _nonnegative_least_squares_2d(intensity * x, -x, theory)
+        return n
+    elif solver != 'lmfit':
+        raise NotImplementedError("{} is not an allowed solver for fit_normalization_factor".format(solver))
 
     params = lmfit.Parameters()
     params.add("n", value=1, min=0)
@@ -110,15 +124,49 @@ def fit_normalization_factor(sample_pattern: Pattern, composition: dict[str, flo
     def optimization_fcn(params, x, sample_intensity, theory_intensity):
         n = params['n'].value
         multiple = params['multiple'].value
-        return ((sample_intensity * n - multiple) * x - theory_intensity) ** 2
+        return (sample_intensity * n - multiple) * x - theory_intensity
 
-    out = lmfit.minimize(optimization_fcn, params, args=(x, intensity, theory))
+    out = lmfit.minimize(optimization_fcn, params, args=(x, intensity, theory), xtol=1e-12, ftol=1e-12)
     return out.params['n'].value
 
 
-def calculate_sq_raw(sample_pattern: Pattern, f_squared_mean: np.ndarray, f_mean_squared: np.ndarray,
-                     incoherent_scattering: Optional[np.ndarray] = None, normalization_factor: float = 1,
-                     method: str = 'FZ') -> Pattern:
+def _nonnegative_least_squares_2d(a: np.ndarray, b: np.ndarray, target: np.ndarray) -> tuple[float, float]:
+    """
+    Solves min ||c1 * a + c2 * b - target||^2 subject to c1 >= 0 and c2 >= 0 in closed form. The solution is either
+    the unconstrained solution of the 2x2 normal equations or lies on one of the bounds, where the problem reduces to a
+    one-dimensional least squares problem. The feasible candidate with the lowest residual is returned.
+
+    :param a: basis vector for the first coefficient
+    :param b: basis vector for the second coefficient
+    :param target: vector to be fitted
+    :return: tuple of the two coefficients (c1, c2)
+    """
+    aa, bb, ab = np.dot(a, a), np.dot(b, b), np.dot(a, b)
+    at, bt = np.dot(a, target), np.dot(b, target)
+
+    candidates = [(0.0, 0.0)]
+    if aa > 0:
+        candidates.append((max(at / aa, 0.0), 0.0))
+    if bb > 0:
+        candidates.append((0.0, max(bt / bb, 0.0)))
+    determinant = aa * bb - ab ** 2
+    if determinant > 0:
+        c1 = (bb * at - ab * bt) / determinant
+        c2 = (aa * bt - ab * at) / determinant
+        if c1 >= 0 and c2 >= 0:
+            return float(c1), float(c2)
+
+    # squared residual ||c1 * a + c2 * b - target||^2 without the constant term ||target||^2
+    def cost(c):
+        return c[0] ** 2 * aa + c[1] ** 2 * bb + 2 * c[0] * c[1] * ab - 2 * c[0] * at - 2 * c[1] * bt
+
+    c1, c2 = min(candidates, key=cost)
+    return float(c1), float(c2)
+
+
+def calculate_sq_raw(sample_pattern: Pattern | PatternStack, f_squared_mean: np.ndarray, f_mean_squared: np.ndarray,
+                     incoherent_scattering: Optional[np.ndarray] = None,
+                     normalization_factor: float | np.ndarray = 1, method: str = 'FZ') -> Pattern | PatternStack:
     """
     Calculates the structure factor of a material with the given parameters. Using the equation:
 
@@ -126,20 +174,23 @@ def calculate_sq_raw(sample_pattern: Pattern, f_squared_mean: np.ndarray, f_mean
 
     where n is the normalization factor and f are the scattering factors.
 
-    :param sample_pattern:       background subtracted sample pattern with A^-1 as x unit
+    :param sample_pattern:       background subtracted sample pattern or PatternStack with A^-1 as x unit
     :param f_squared_mean:        <f^2>
     :param f_mean_squared:        <f>^2
     :param incoherent_scattering: compton scattering from sample
-    :param normalization_factor:  previously calculated normalization factor, if None, it will not be subtracted
+    :param normalization_factor:  previously calculated normalization factor, if None, it will not be subtracted.
+                                  For a PatternStack this can be an array with one factor per pattern.
     :param method:                describing the method to calculate the structure factor, possible values are
                                     - 'AL' - Ashcroft-Langreth
                                     - 'FZ' - Faber-Ziman
 
-    :return: S(Q) pattern
+    :return: S(Q) pattern (PatternStack if a PatternStack was given)
     """
     q, intensity = sample_pattern.data
     if incoherent_scattering is None:
         incoherent_scattering = np.zeros_like(q)
+    # allows one normalization factor per pattern for PatternStacks
+    normalization_factor = np.asarray(normalization_factor)[..., np.newaxis]
 
     if method == 'FZ' or method == SqMethod.FZ:
         sq = (normalization_factor * intensity - incoherent_scattering - f_squared_mean + f_mean_squared) / \
@@ -148,7 +199,7 @@ def calculate_sq_raw(sample_pattern: Pattern, f_squared_mean: np.ndarray, f_mean
         sq = (normalization_factor * intensity - incoherent_scattering) / f_squared_mean
     else:
         raise NotImplementedError('{} method is not implemented'.format(method))
-    return Pattern(q, sq)
+    return create_pattern_like(sample_pattern, q, sq)
 
 
 def calculate_sq(sample_pattern: Pattern, density: float, composition: dict[str, float],
@@ -182,11 +233,9 @@ def calculate_sq(sample_pattern: Pattern, density: float, composition: dict[str,
     :return: S(Q) pattern
     """
     q, intensity = sample_pattern.data
-    f_squared_mean = calculate_f_squared_mean(composition, q, sf_source)
-    f_mean_squared = calculate_f_mean_squared(composition, q, sf_source)
-    if use_incoherent_scattering:
-        incoherent_scattering = calculate_incoherent_scattering(composition, q, sf_source)
-    else:
+    composition = as_composition(composition)
+    _, f_mean_squared, f_squared_mean, incoherent_scattering = composition.form_factors(q, sf_source)
+    if not use_incoherent_scattering:
         incoherent_scattering = None
 
     atomic_density = convert_density_to_atoms_per_cubic_angstrom(composition, density)
@@ -210,8 +259,9 @@ def calculate_sq(sample_pattern: Pattern, density: float, composition: dict[str,
                             method)
 
 
-def calculate_fr(sq_pattern: Pattern, r: Optional[np.ndarray] = None, use_modification_fcn: bool = False,
-                 method: str = 'integral') -> Pattern:
+def calculate_fr(sq_pattern: Pattern | PatternStack, r: Optional[np.ndarray] = None,
+                 use_modification_fcn: bool = False, method: str = 'integral',
+                 max_memory: Optional[int] = None) -> Pattern | PatternStack:
     """
     Calculates F(r) from a given S(Q) pattern for r values.
     If r is None, a range from 0 to 10 with step 0.01 is used.
@@ -221,47 +271,35 @@ def calculate_fr(sq_pattern: Pattern, r: Optional[np.ndarray] = None, use_modifi
 
     can be used to address issues with a low q_max. This will broaden the sharp peaks in g(r)
 
-    :param sq_pattern:              Structure factor S(Q) with lim_inf S(Q) = 1 and unit(q)=A^-1
+    :param sq_pattern:              Structure factor S(Q) with lim_inf S(Q) = 1 and unit(q)=A^-1, can also be a
+                                    PatternStack, then F(r) is calculated for all patterns at once
     :param r:                       numpy array giving the r-values for which F(r) will be calculated,
                                     default is 0 to 10 with 0.01 as a step. units should be in Angstrom.
     :param use_modification_fcn:    boolean flag whether to use the Lorch modification function
     :param method:                  determines the method used for calculating fr, possible values are:
                                             - 'integral' solves the Fourier integral, by calculating the integral
                                             - 'fft' solves the Fourier integral by using fast fourier transformation
-
-    :return: F(r) pattern
+                                            - 'dst' solves the Fourier integral by using a real discrete sine
+                                              transformation, q needs to be a uniform grid
+                                            - 'czt' solves the Fourier integral by using a chirp-z transformation,
+                                              which evaluates the trapezoidal integral directly on the r values
+                                              without interpolation, q and r need to be uniform grids
+    :param max_memory:              maximum memory in bytes used for the sine kernel of the 'integral' method. If the
+                                    kernel for all q and r values is larger, F(r) is calculated in blocks of r values.
+                                    The default (None) uses the memory limit of the sine kernel cache.
+
+    :return: F(r) pattern (PatternStack if a PatternStack was given)
     """
     if r is None:
         r = np.linspace(0.01, 10, 1000)
 
     q, sq = sq_pattern.data
-    if use_modification_fcn:
-        modification = np.sin(q * np.pi / np.max(q)) / (q * np.pi / np.max(q))
-    else:
-        modification = 1
+    fr = _transform_sq_to_fr(q, sq, r, use_modification_fcn, method, max_memory)
+    return create_pattern_like(sq_pattern, r, fr)
 
-    if method == 'integral' or method == FourierTransformMethod.INTEGRAL:
-        fr = 2.0 / np.pi * np.trapz(modification * q * (sq - 1) * np.array(np.sin(np.outer(q.T, r))).T, q)
-    elif method == 'fft' or method == FourierTransformMethod.FFT:
-        q_step = q[1] - q[0]
-        r_step = r[1] - r[0]
 
-        n_out = np.max([len(q), int(np.pi / (r_step * q_step))])
-        q_max_for_ifft = 2 * n_out * q_step
-        y_for_ifft = np.concatenate((modification * q * (sq - 1), np.zeros(2 * n_out - len(q))))
-
-        ifft_result = np.fft.ifft(y_for_ifft) * 2 / np.pi * q_max_for_ifft
-        ifft_imag = np.imag(ifft_result)[:n_out]
-        ifft_x_step = 2 * np.pi / q_max_for_ifft
-        ifft_x = np.arange(n_out) * ifft_x_step
-
-        fr = np.interp(r, ifft_x, ifft_imag)
-    else:
-        raise NotImplementedError("{} is not an allowed method for calculate_fr".format(method))
-    return Pattern(r, fr)
-
-
-def calculate_sq_from_fr(fr_pattern: Pattern, q: np.ndarray, method: str = 'integral') -> Pattern:
+def calculate_sq_from_fr(fr_pattern: Pattern, q: np.ndarray, method: str = 'integral',
+                         max_memory: Optional[int] = None) -> Pattern:
     """
     Calculates S(Q) from an F(r) pattern for given q values.
 
@@ -270,15 +308,22 @@ def calculate_sq_from_fr(fr_pattern: Pattern, q: np.ndarray, method: str = 'inte
     :param method:                  determines the method use for calculating fr, possible values are:
                                             - 'integral' solves the Fourier integral, by calculating the integral
                                             - 'fft' solves the Fourier integral by using fast fourier transformation
+                                            - 'dst' solves the Fourier integral by using a real discrete sine
+                                              transformation, r needs to be a uniform grid
+                                            - 'czt' solves the Fourier integral by using a chirp-z transformation,
+                                              r and q need to be uniform grids
+    :param max_memory:              maximum memory in bytes used for the sine kernel of the 'integral' method. If the
+                                    kernel for all r and q values is larger, S(Q) is calculated in blocks of q values.
+                                    The default (None) uses the memory limit of the sine kernel cache.
 
     :return: F(r) pattern
     """
     r, fr = fr_pattern.data
 
-    if method == 'integral':
-        sq = np.trapz(fr * np.array(np.sin(np.outer(r.T, q))).T, r) / q + 1
+    if method == 'integral' or method == FourierTransformMethod.INTEGRAL:
+        sq = sine_transform_integral(r, fr, q, max_memory) / q + 1
 
-    elif method == 'fft':
+    elif method == 'fft' or method == FourierTransformMethod.FFT:
         q_step = q[1] - q[0]
         r_step = r[1] - r[0]
 
@@ -293,6 +338,10 @@ def calculate_sq_from_fr(fr_pattern: Pattern, q: np.ndarray, method: str = 'inte
         ifft_imag = np.imag(ifft_result)[:n_out]
 
         sq = np.interp(q, ifft_x, ifft_imag) / q + 1
+    elif method == 'dst' or method == FourierTransformMethod.DST:
+        sq = _sine_transform_dst(r, fr, q) / q + 1
+    elif method == 'czt' or method == FourierTransformMethod.CZT:
+        sq = _sine_transform_czt(r, fr, q) / q + 1
     else:
         raise NotImplementedError("{} is not an allowed method for calculate_sq_from_fr".format(method))
 
@@ -311,6 +360,8 @@ def calculate_sq_from_gr(gr_pattern: Pattern, q: np.ndarray, density: float, com
     :param method:          determines the method used for calculating fr, possible values are:
                                 - 'integral' solves the Fourier integral, by calculating the integral
                                 - 'fft' solves the Fourier integral by using fast fourier transformation
+                                - 'dst' solves the Fourier integral by using a real discrete sine transformation
+                                - 'czt' solves the Fourier integral by using a chirp-z transformation
 
     :return: S(Q) pattern
     """
@@ -319,23 +370,192 @@ def calculate_sq_from_gr(gr_pattern: Pattern, q: np.ndarray, density: float, com
 
     # removing the nan value at the first index, which is caused by the division by zero when r started from zero
     if np.isnan(gr[0]):
+        gr = np.copy(gr)
         gr[0] = 0
     fr_pattern = Pattern(r, (gr - 1) * (4.0 * np.pi * r * atomic_density))
     return calculate_sq_from_fr(fr_pattern, q, method)
 
 
-def calculate_gr_raw(fr_pattern: Pattern, atomic_density: float) -> Pattern:
+def calculate_gr_raw(fr_pattern: Pattern | PatternStack, atomic_density: float | np.ndarray) -> Pattern | PatternStack:
     """
     Calculates a g(r) pattern from a given F(r) pattern and the atomic density
 
-    :param fr_pattern:     F(r) pattern
-    :param atomic_density:  atomic density in atoms/A^3
+    :param fr_pattern:     F(r) pattern or PatternStack
+    :param atomic_density:  atomic density in atoms/A^3, for a PatternStack this can be an array with one density
+                            per pattern
 
-    :return: g(r) pattern
+    :return: g(r) pattern (PatternStack if a PatternStack was given)
     """
     r, f_r = fr_pattern.data
-    g_r = 1 + f_r / (4.0 * np.pi * r * atomic_density)
-    return Pattern(r, g_r)
+    g_r = 1 + f_r / (4.0 * np.pi * r * np.asarray(atomic_density)[..., np.newaxis])
+    return create_pattern_like(fr_pattern, r, g_r)
+
+
+def _transform_sq_to_fr(q: np.ndarray, sq: np.ndarray, r: np.ndarray, use_modification_fcn: bool = False,
+                        method: str = 'integral', max_memory: Optional[int] = None) -> np.ndarray:
+    """
+    Calculates the F(r) values for the S(Q) values sq on the q grid, see calculate_fr for the description of the
+    parameters.
+
+    :return: F(r) values with the shape sq.shape[:-1] + (len(r),)
+    """
+    if use_modification_fcn:
+        modification = np.sin(q * np.pi / np.max(q)) / (q * np.pi / np.max(q))
+    else:
+        modification = 1
+
+    if method == 'integral' or method == FourierTransformMethod.INTEGRAL:
+        fr = 2.0 / np.pi * sine_transform_integral(q, modification * q * (sq - 1), r, max_memory)
+    elif method == 'fft' or method == FourierTransformMethod.FFT:
+        q_step = q[1] - q[0]
+        r_step = r[1] - r[0]
+
+        n_out = np.max([len(q), int(np.pi / (r_step * q_step))])
+        q_max_for_ifft = 2 * n_out * q_step
+        y = modification * q * (sq - 1)
+        y_for_ifft = np.concatenate((y, np.zeros(y.shape[:-1] + (2 * n_out - len(q),))), axis=-1)
+
+        ifft_result = np.fft.ifft(y_for_ifft) * 2 / np.pi * q_max_for_ifft
+        ifft_imag = np.imag(ifft_result)[..., :n_out]
+        ifft_x_step = 2 * np.pi / q_max_for_ifft
+        ifft_x = np.arange(n_out) * ifft_x_step
+
+        fr = _interp(r, ifft_x, ifft_imag)
+    elif method == 'dst' or method == FourierTransformMethod.DST:
+        fr = 2.0 / np.pi * _sine_transform_dst(q, modification * q * (sq - 1), r)
+    elif method == 'czt' or method == FourierTransformMethod.CZT:
+        fr = 2.0 / np.pi * _sine_transform_czt(q, modification * q * (sq - 1), r)
+    else:
+        raise NotImplementedError("{} is not an allowed method for calculate_fr".format(method))
+    return fr
+
+
+def _sine_transform_operator(q: np.ndarray, r: np.ndarray, method: str = 'integral') -> Optional[np.ndarray]:
+    """
+    Returns the matrix M with the shape (len(q), len(r)), for which the F(r) values calculated by _transform_sq_to_fr
+    with the given method are fr = (m(q) * q * (sq - 1)) @ M, where m(q) is the modification function (or 1). The
+    matrix is only available for the 'integral' method, for all other methods (which are based on fast transforms)
+    None is returned.
+    """
+    if method == 'integral' or method == FourierTransformMethod.INTEGRAL:
+        return 2.0 / np.pi * trapezoid_weights(q)[:, np.newaxis] * get_sine_kernel(q, r)
+    return None
+
+
+def _interp(x: np.ndarray, xp: np.ndarray, fp: np.ndarray) -> np.ndarray:
+    """
+    Linear interpolation like np.interp, but fp can have additional leading dimensions (e.g. for PatternStacks). The
+    interpolation is performed along the last axis.
+    """
+    if fp.ndim == 1:
+        return np.interp(x, xp, fp)
+    ind = np.clip(np.searchsorted(xp, x, side='right') - 1, 0, len(xp) - 2)
+    weight = np.clip((x - xp[ind]) / (xp[ind + 1] - xp[ind]), 0, 1)
+    return fp[..., ind] * (1 - weight) + fp[..., ind + 1] * weight
+
+
+def _sine_transform_dst(x: np.ndarray, y: np.ndarray, k: np.ndarray) -> np.ndarray:
+    """
+    Calculates the integral of y(x) * sin(k * x) over x with the trapezoidal rule using type-I discrete sine (and
+    cosine) transforms. The values of x need to be on a uniform grid. A grid which is not positioned at integer
+    multiples of the x step (e.g. starting at q = 0.37 with a step of 0.02) is shifted onto such a grid and the shift s
+    is taken into account by sin(k * (x + s)) = sin(k * x) * cos(k * s) + cos(k * x) * sin(k * s). Grid points below
+    the first non-negative multiple of the x step (e.g. a slightly negative q after an extrapolation) are ignored.
+
+    The data is zero padded to a fast transform length n, so that the spacing dk = pi / (n * x_step) of the
+    transformed grid is at most the step of k. The transformed grid is fixed to multiples of dk, which in general does
+    not contain the k values (pi / (k_step * x_step) is not an integer), therefore the result is interpolated onto k
+    with cubic Hermite polynomials using the exact derivatives, which are transformed as well. The interpolation error
+    is bounded by dk^4 / 384 * sum(|w_n * y_n| * x_n^4), with w_n the trapezoidal weights. Use the 'czt' method to
+    evaluate the transform directly on k.
+
+    :param x: uniform grid of the integration variable (e.g. q)
+    :param y: values to be transformed, the last axis corresponds to x
+    :param k: uniform grid for which the transform is calculated (e.g. r)
+    :return: transformed values with the shape y.shape[:-1] + (len(k),)
+    """
+    x_step = x[1] - x[0]
+    k_step = k[1] - k[0]
+
+    # x_n = (m_0 + n) * x_step + shift with 0 <= shift < x_step
+    m_0 = int(np.floor(x[0] / x_step + 1e-6))
+    shift = x[0] - m_0 * x_step
+    if abs(shift) < 1e-6 * x_step:
+        shift = 0
+
+    n = next_fast_len(int(max(m_0 + len(x) + 1, np.ceil(np.pi / (k_step * x_step)))))
+    dst_k = np.arange(n) * np.pi / (n * x_step)
+
+    def transform(values, sine=True, cosine=True):
+        # sums of values * sin(dst_k * m * x_step) and values * cos(dst_k * m * x_step) over the unshifted grid
+        padded = np.zeros(np.shape(values)[:-1] + (n + 1,))
+        padded[..., max(m_0, 0):m_0 + len(x)] = values[..., max(-m_0, 0):]
+        sin_sums, cos_sums = None, None
+        if sine:
+            # scipy's DST-I is 2 * sum(y_m * sin(pi * (j + 1) * (m + 1) / n)) for m = 0..n - 2, i.e. it sums over the
+            # grid points m * x_step with m = 1..n - 1, the value at x = 0 does not contribute since sin(0) = 0
+            sin_sums = np.concatenate((np.zeros(np.shape(values)[:-1] + (1,)),
+                                       dst(padded[..., 1:n], type=1, axis=-1) * 0.5), axis=-1)
+        if cosine:
+            # scipy's DCT-I is y_0 + (-1)^j * y_n + 2 * sum(y_m * cos(pi * j * m / n)) for m = 1..n - 1, with y_n = 0
+            cos_sums = (dct(padded, type=1, axis=-1)[..., :n] + padded[..., :1]) * 0.5
+        return sin_sums, cos_sums
+
+    weighted_y = y * trapezoid_weights(x)
+    sin_y, cos_y = transform(weighted_y, cosine=shift != 0)
+    sin_xy, cos_xy = transform(weighted_y * x, sine=shift != 0)
+    if shift == 0:
+        result = sin_y
+        derivative = cos_xy
+    else:
+        cos_shift, sin_shift = np.cos(dst_k * shift), np.sin(dst_k * shift)
+        result = sin_y * cos_shift + cos_y * sin_shift
+        derivative = cos_xy * cos_shift - sin_xy * sin_shift
+    return _hermite_interp(k, dst_k, result, derivative)
+
+
+def _hermite_interp(x: np.ndarray, xp: np.ndarray, fp: np.ndarray, dfp: np.ndarray) -> np.ndarray:
+    """
+    Cubic Hermite interpolation on the uniform grid xp with the values fp and the derivatives dfp, which can have
+    additional leading dimensions. The interpolation is performed along the last axis.
+    """
+    step = xp[1] - xp[0]
+    ind = np.clip(np.floor((x - xp[0]) / step).astype(int), 0, len(xp) - 2)
+    t = np.clip((x - xp[ind]) / step, 0, 1)
+    t2, t3 = t ** 2, t ** 3
+    return fp[..., ind] * (2 * t3 - 3 * t2 + 1) + dfp[..., ind] * (t3 - 2 * t2 + t) * step + \
+        fp[..., ind + 1] * (3 * t2 - 2 * t3) + dfp[..., ind + 1] * (t3 - t2) * step
+
+
+def _sine_transform_czt(x: np.ndarray, y: np.ndarray, k: np.ndarray) -> np.ndarray:
+    """
+    Calculates the integral of y(x) * sin(k * x) over x with the trapezoidal rule using a chirp-z transform. The
+    result is the same as for sine_transform_integral, but is calculated in O((Nx + Nk) log(Nx + Nk)) operations
+    directly on the k values, which can be an arbitrary (e.g. narrow and finely sampled) window. Both, x and k need to
+    be uniform grids.
+
+    :param x: uniform grid of the integration variable (e.g. q)
+    :param y: values to be transformed, the last axis corresponds to x
+    :param k: uniform grid for which the transform is calculated (e.g. r)
+    :return: transformed values with the shape y.shape[:-1] + (len(k),)
+    """
+    x_step = x[1] - x[0]
+    k_step = k[1] - k[0] if len(k) > 1 else 0
+
+    # sum_n y_n * exp(i * k_m * x_n) with x_n = x_0 + n * x_step and k_m = k_0 + m * k_step is written as a
+    # convolution (Bluestein's algorithm) by using m * n = (m^2 + n^2 - (m - n)^2) / 2, which is evaluated with FFTs
+    n_x, n_k = len(x), len(k)
+    theta = k_step * x_step
+    n = np.arange(n_x)
+    m = np.arange(n_k)
+
+    u = y * trapezoid_weights(x) * np.exp(1j * (k[0] * x_step * n + theta * n ** 2 / 2))
+    j = np.arange(-(n_x - 1), n_k)
+    v = np.exp(-1j * theta * j ** 2 / 2)
+
+    fft_len = next_fast_len(n_x + n_k - 1)
+    convolution = ifft(fft(u, fft_len, axis=-1) * fft(v, fft_len), axis=-1)[..., n_x - 1:n_x - 1 + n_k]
+    return np.imag(convolution * np.exp(1j * (theta * m ** 2 / 2 + k * x[0])))
 
 
 def calculate_gr(fr_pattern: Pattern, density: float, composition: dict[str, float]) -> Pattern:
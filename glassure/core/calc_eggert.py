@@ -6,12 +6,12 @@ import numpy as np
 from scipy.integrate import simps
 
 from . import calculate_gr_raw
-from .scattering_factors import calculate_coherent_scattering_factor, calculate_incoherent_scattered_intensity, \
-    ScatteringFactorCalculatorHajdu
+from .scattering_factors import calculate_coherent_scattering_factor
+from .composition import as_composition
 from .soller_correction import SollerCorrection
 from .pattern import Pattern
-
-scattering_factor_param = ScatteringFactorCalculatorHajdu().coherent_param
+from .sine_kernel import get_sine_kernel
+from .stop_condition import StopCondition, check_tolerance_criterion, residual_rms, minimize_until_stopped
 
 
 def calculate_atomic_number_sum(composition: dict[str, float]):
@@ -21,10 +21,7 @@ def calculate_atomic_number_sum(composition: dict[str, float]):
     :param composition: composition as a dictionary with the elements as keys and the abundances as values
     :return: sum of the atomic numbers
     """
-    z_tot = 0
-    for element, n in composition.items():
-        z_tot += scattering_factor_param['Z'][element] * n
-    return z_tot
+    return as_composition(composition).atomic_number_sum
 
 
 def calculate_effective_form_factors(composition: dict[str, float], q: np.ndarray) -> np.ndarray:
@@ -35,13 +32,11 @@ def calculate_effective_form_factors(composition: dict[str, float], q: np.ndarra
     :param q: Q value or numpy array with a unit of A^-1
     :return: effective form factors numpy array
     """
-    z_tot = calculate_atomic_number_sum(composition)
-
-    f_effective = np.zeros_like(q)
-    for element, n in composition.items():
-        f_effective += calculate_coherent_scattering_factor(element, q) * n
+    composition = as_composition(composition)
+    f = composition.form_factors(q)[0]
+    f_effective = np.sum(composition.abundances[:, np.newaxis] * f, axis=0)
 
-    return f_effective / float(z_tot)
+    return f_effective / composition.atomic_number_sum
 
 
 def calculate_incoherent_scattering(composition: dict[str, float], q: np.ndarray) -> np.ndarray:
@@ -52,11 +47,8 @@ def calculate_incoherent_scattering(composition: dict[str, float], q: np.ndarray
     :param q: Q value or numpy array with a unit of A^-1
     :return: incoherent scattering numpy array
     """
-    inc = np.zeros_like(q)
-    for element, n in composition.items():
-        inc += calculate_incoherent_scattered_intensity(element, q) * n
-
-    return inc
+    composition = as_composition(composition)
+    return composition.incoherent_scattering(q) * np.sum(composition.abundances)
 
 
 def calculate_j(incoherent_scattering: np.ndarray, z_tot: float, f_effective: np.ndarray) -> np.ndarray:
@@ -95,9 +87,9 @@ def calculate_s_inf(composition: dict[str, float], z_tot: float, f_effective: np
     :param q: q numpy array with units of A^-1
     :return: S_inf value
     """
-    sum_kp_squared = 0
-    for element, n in composition.items():
-        sum_kp_squared += n * calculate_kp(element, f_effective, q) ** 2
+    composition = as_composition(composition)
+    kp = np.mean(composition.form_factors(q)[0] / f_effective, axis=1)
+    sum_kp_squared = np.sum(composition.abundances * kp ** 2)
 
     return sum_kp_squared / z_tot ** 2
 
@@ -182,23 +174,23 @@ def calculate_fr(iq_pattern: Pattern, r: Optional[np.ndarray] = None, use_modifi
         r = np.arange(0, 10, 0.01)
 
     q, iq = iq_pattern.data
-    if use_modification_fcn:
-        modification = np.sin(q * np.pi / np.max(q)) / (q * np.pi / np.max(q))
-    else:
-        modification = 1
-
-    fr = 2.0 / np.pi * simps(modification * q * iq * np.array(np.sin(np.outer(q.T, r))).T, q)
+    kernel = get_sine_kernel(q, r, use_modification_fcn)
+    fr = 2.0 / np.pi * simps(q * iq * kernel.T, q)
 
     return Pattern(r, fr)
 
 
 def optimize_iq(iq_pattern, r_cutoff, iterations, atomic_density, j, s_inf=1, use_modification_fcn=False,
-                attenuation_factor=1, fcn_callback=None, callback_period=2):
+                attenuation_factor=1, fcn_callback=None, callback_period=2, tolerance=None, tolerance_criterion='fr',
+                return_info=False, stop_condition=None):
     """
     Performs an optimization of the structure factor based on an r_cutoff value as described in Eggert et al. 2002 PRB,
     65, 174105. This basically does back and forward transforms between S(Q) and f(r) until the region below the
     r_cutoff value is a flat line without any oscillations.
 
+    If a tolerance is given, the optimization stops as soon as the residual of an iteration is below the tolerance,
+    and iterations is only the maximum number of iterations.
+
     :param iq_pattern:
         original i(Q) pattern = S(Q)-S_inf
     :param r_cutoff:
@@ -222,33 +214,61 @@ def optimize_iq(iq_pattern, r_cutoff, iterations, atomic_density, j, s_inf=1, us
     :param fcn_callback:
         Function which will be called at an iteration period defined by the callback_period parameter.
         The function should take 3 arguments: sq_pattern, fr_pattern and gr_pattern. Additionally the function
-        should return a boolean value, where True continues the optimization and False will stop the optimization
-        procedure
+        can return False to stop the optimization procedure, any other value continues it.
     :param callback_period:
         determines how frequently the fcn_callback will be called.
+    :param tolerance:
+        residual below which the optimization is considered converged. None (default) always performs the given
+        number of iterations
+    :param tolerance_criterion:
+        residual used for the convergence check, either 'fr' for the root mean square of delta F(r) below r_cutoff or
+        'sq' for the root mean square of the i(Q) update of an iteration
+    :param return_info:
+        whether to additionally return the number of performed iterations and the residual history
+    :param stop_condition:
+        StopCondition for stopping the optimization early (cancellation, wall-clock budget or maximum number of
+        iterations), in which case the current i(Q) is returned
 
     :return:
-        optimized S(Q) pattern
+        optimized S(Q) pattern, or if return_info is True a tuple of the optimized S(Q) pattern, the number of performed
+        iterations and an array with the residual (see tolerance_criterion) of each iteration
     """
+    check_tolerance_criterion(tolerance_criterion)
     r = np.arange(0, r_cutoff, 0.02)
     iq_pattern = deepcopy(iq_pattern)
+    if stop_condition is None:
+        stop_condition = StopCondition()
+    stop_condition.start()
+
+    residuals = []
     for iteration in range(iterations):
+        if stop_condition.stopped:
+            break
         fr_pattern = calculate_fr(iq_pattern, r, use_modification_fcn)
         q, iq_int = iq_pattern.data
         r, fr_int = fr_pattern.data
 
         delta_fr = fr_int + 4 * np.pi * r * atomic_density
 
-        in_integral = np.array(np.sin(np.outer(q.T, r))) * delta_fr
+        in_integral = get_sine_kernel(q, r) * delta_fr
         integral = np.trapz(in_integral, r) / attenuation_factor
-        iq_optimized = iq_int - 1. / q * (iq_int / (s_inf + j) + 1) * integral
+        iq_update = 1. / q * (iq_int / (s_inf + j) + 1) * integral
+        iq_optimized = iq_int - iq_update
+        residuals.append(residual_rms(delta_fr) if tolerance_criterion == 'fr' else residual_rms(iq_update))
+        stop_condition.count_evaluation()
 
         iq_pattern = Pattern(q, iq_optimized)
 
         if fcn_callback is not None and iteration % callback_period == 0:
             fr_pattern = calculate_fr(iq_pattern, use_modification_fcn=use_modification_fcn)
             gr_pattern = calculate_gr_raw(fr_pattern, atomic_density)
-            fcn_callback(iq_pattern, fr_pattern, gr_pattern)
+            stop_condition.check_callback_result(fcn_callback(iq_pattern, fr_pattern, gr_pattern))
+
+        if tolerance is not None and residuals[-1] < tolerance:
+            break
+
+    if return_info:
+        return iq_pattern, len(residuals), np.array(residuals)
     return iq_pattern
 
 
@@ -267,6 +287,7 @@ def calculate_chi2_map(data_pattern, bkg_pattern, composition,
     :return: 2-dimensional array of chi2 values
     """
 
+    composition = as_composition(composition)
     n = sum([composition[x] for x in composition])
     q = data_pattern.extend_to(0, 0).x
 
@@ -303,7 +324,7 @@ def calculate_chi2_map(data_pattern, bkg_pattern, composition,
 
                 delta_fr = fr_int + 4 * np.pi * r * density
 
-                in_integral = np.array(np.sin(np.outer(q.T, r))) * delta_fr
+                in_integral = get_sine_kernel(q, r) * delta_fr
                 integral = np.trapz(in_integral, r)
                 iq_optimized = iq_int - 1. / q * (iq_int / (s_inf + j) + 1) * integral
 
@@ -315,7 +336,8 @@ def calculate_chi2_map(data_pattern, bkg_pattern, composition,
 
 def optimize_density_and_bkg_scaling(data_pattern: Pattern, bkg_pattern: Pattern, composition: dict[str, float],
                                      initial_density: float, initial_bkg_scaling: float, r_cutoff: float,
-                                     iterations: int = 2, use_modification_fcn: bool = False) \
+                                     iterations: int = 2, use_modification_fcn: bool = False,
+                                     stop_condition: Optional[StopCondition] = None) \
         -> tuple[float, float, float, float]:
     """
     This function tries to find the optimum density in background scaling with the given parameters. The equations
@@ -329,9 +351,13 @@ def optimize_density_and_bkg_scaling(data_pattern: Pattern, bkg_pattern: Pattern
     :param r_cutoff: cutoff value below which there is no signal expected (below the first peak in g(r))
     :param iterations: number of iterations for optimization, described in equations 47-49 in Eggert et al. 2002
     :param use_modification_fcn: Whether or not to use the Lorch modification function during the Fourier transform.
+    :param stop_condition: StopCondition for stopping the optimization early (cancellation, wall-clock budget or
+                           maximum number of objective function evaluations), in which case the best parameters so far
+                           are returned without standard errors
     :return: tuple with optimized parameters (density, density_error, bkg_scaling, bkg_scaling_error)
     """
 
+    composition = as_composition(composition)
     N = sum([composition[x] for x in composition])
     q = data_pattern.extend_to(0, 0).x
 
@@ -363,7 +389,7 @@ def optimize_density_and_bkg_scaling(data_pattern: Pattern, bkg_pattern: Pattern
         delta_fr = fr_int + 4 * np.pi * r * density
 
         for iteration in range(iterations):
-            in_integral = np.array(np.sin(np.outer(q.T, r))) * delta_fr
+            in_integral = get_sine_kernel(q, r) * delta_fr
             integral = np.trapz(in_integral, r)
             iq_optimized = iq_int - 1. / q * (iq_int / (s_inf + j) + 1) * integral
 
@@ -377,13 +403,13 @@ def optimize_density_and_bkg_scaling(data_pattern: Pattern, bkg_pattern: Pattern
 
         return delta_fr
 
-    from lmfit import Parameters, minimize
+    from lmfit import Parameters
 
     params = Parameters()
     params.add('density', value=initial_density, )
     params.add('bkg_scaling', value=initial_bkg_scaling)
 
-    result = minimize(optimization_fcn, params)
+    result = minimize_until_stopped(optimization_fcn, params, stop_condition)
 
     return result.params['density'].value, result.params['density'].stderr, \
         result.params['bkg_scaling'].value, result.params['density'].stderr
@@ -393,7 +419,8 @@ def optimize_soller_dac(data_pattern: Pattern, bkg_pattern: Pattern, composition
                         initial_density: float, initial_bkg_scaling: float, initial_thickness: float,
                         sample_thickness: float, wavelength: float, initial_carbon_content: float = 1,
                         r_cutoff: float = 2.28, iterations: int = 1, use_modification_fcn: bool = False,
-                        vary: tuple[bool, bool, bool] = (True, True, True)) \
+                        vary: tuple[bool, bool, bool] = (True, True, True),
+                        stop_condition: Optional[StopCondition] = None) \
         -> tuple[float, float, float, float, float, float, float]:
     """
     Optimizes density, background scaling and diamond content for a list of sample thickness with a given initial
@@ -414,8 +441,12 @@ def optimize_soller_dac(data_pattern: Pattern, bkg_pattern: Pattern, composition
     :param iterations: number of iterations for optimization, described in equations 47-49 in Eggert et al. 2002
     :param use_modification_fcn: Whether or not to use the Lorch modification function during the Fourier transform.
     :param vary: 3 boolean flags whether to vary: density, bkg_scaling, carbon_content during the optimization
+    :param stop_condition: StopCondition for stopping the optimization early (cancellation, wall-clock budget or
+                           maximum number of objective function evaluations), in which case the best parameters so far
+                           are returned without standard errors
     :return:
     """
+    composition = as_composition(composition)
     n = sum([composition[x] for x in composition])
     q = data_pattern.extend_to(0, 0).x
 
@@ -462,7 +493,7 @@ def optimize_soller_dac(data_pattern: Pattern, bkg_pattern: Pattern, composition
         delta_fr = fr_int + 4 * np.pi * r * density
 
         for iteration in range(iterations):
-            in_integral = np.array(np.sin(np.outer(q.T, r))) * delta_fr
+            in_integral = get_sine_kernel(q, r) * delta_fr
             integral = np.trapz(in_integral, r)
             iq_optimized = iq_int - 1. / q * (iq_int / (s_inf + j) + 1) * integral
 
@@ -476,14 +507,14 @@ def optimize_soller_dac(data_pattern: Pattern, bkg_pattern: Pattern, composition
 
         return delta_fr
 
-    from lmfit import Parameters, minimize, report_fit
+    from lmfit import Parameters, report_fit
 
     params = Parameters()
     params.add('density', value=initial_density, min=0, vary=vary[0])
     params.add('bkg_scaling', value=initial_bkg_scaling, vary=vary[1])
     params.add('diamond_content', value=initial_carbon_content, min=0, vary=vary[2])
 
-    result = minimize(optimization_fcn, params)
+    result = minimize_until_stopped(optimization_fcn, params, stop_condition)
 
     report_fit(result)
 
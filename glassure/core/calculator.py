@@ -4,6 +4,7 @@ import numpy as np
 from scipy import interpolate
 
 from .pattern import Pattern
+from .composition import as_composition
 from .utility import convert_density_to_atoms_per_cubic_angstrom, calculate_incoherent_scattering, \
     calculate_f_mean_squared, calculate_f_squared_mean, extrapolate_to_zero_linear
 
@@ -18,6 +19,7 @@ class GlassureCalculator(object):
         self.original_pattern = original_pattern
         self.background_pattern = background_pattern
         self.sample_pattern = self.original_pattern - self.background_pattern
+        composition = as_composition(composition)
         self.elemental_abundances = composition
         self.density = density
         self.atomic_density = convert_density_to_atoms_per_cubic_angstrom(composition, density)
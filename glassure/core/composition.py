@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+import re
+from collections import OrderedDict
+
+import numpy as np
+
+from .scattering_factors import get_calculator, get_atomic_weights, ElementNotImplementedException
+
+__all__ = ['Composition', 'as_composition']
+
+
+class Composition(dict):
+    """
+    Chemical composition with the elements as keys and the abundances as relative numbers, e.g.:
+
+        Composition({'Si': 1, 'O': 2})
+
+    Composition is a dictionary and can be used everywhere a composition dictionary is expected. The composition is
+    validated and normalized once, the atomic weights and atomic numbers of the elements are cached and the form
+    factors are memoized for the most recently used q grids and scattering factor sources. Therefore, passing the same
+    Composition to several functions (or several times to the same function, e.g. during an optimization) avoids
+    recalculating the composition dependent quantities. Modifying the composition clears the cached values.
+
+    The arrays returned by the memoized methods are read-only.
+    """
+
+    max_cached_grids = 8
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._validate()
+        self._clear_cache()
+
+    def _validate(self):
+        for element, abundance in self.items():
+            if not isinstance(element, str):
+                raise ValueError("Element {} needs to be given as string.".format(element))
+            if not np.isscalar(abundance) or not np.isreal(abundance) or abundance < 0:
+                raise ValueError("Abundance of {} needs to be a non-negative number.".format(element))
+        if len(self) > 0 and sum(self.values()) <= 0:
+            raise ValueError("The sum of the abundances needs to be larger than zero.")
+
+    def _clear_cache(self):
+        self._cache = {}
+        self._form_factor_cache = OrderedDict()
+
+    def _modified(self):
+        self._validate()
+        self._clear_cache()
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._modified()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._modified()
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self._modified()
+
+    def setdefault(self, key, default=None):
+        value = super().setdefault(key, default)
+        self._modified()
+        return value
+
+    def pop(self, *args):
+        value = super().pop(*args)
+        self._modified()
+        return value
+
+    def popitem(self):
+        item = super().popitem()
+        self._modified()
+        return item
+
+    def clear(self):
+        super().clear()
+        self._modified()
+
+    def copy(self) -> Composition:
+        return self.__class__(self)
+
+    def __copy__(self) -> Composition:
+        return self.copy()
+
+    def __reduce__(self):
+        return self.__class__, (dict(self),)
+
+    def __repr__(self):
+        return '{}({})'.format(self.__class__.__name__, dict.__repr__(self))
+
+    def _cached(self, key, calculate):
+        if key not in self._cache:
+            self._cache[key] = calculate()
+        return self._cache[key]
+
+    @property
+    def elements(self) -> list[str]:
+        """
+        Returns the elements of the composition.
+        """
+        return self._cached('elements', lambda: list(self.keys()))
+
+    @property
+    def abundances(self) -> np.ndarray:
+        """
+        Returns the (not normalized) abundances of the elements as read-only array.
+        """
+        return self._cached('abundances', lambda: _read_only(np.array(list(self.values()), dtype=float)))
+
+    @property
+    def fractions(self) -> np.ndarray:
+        """
+        Returns the abundances of the elements normalized to 1 as read-only array.
+        """
+        return self._cached('fractions', lambda: _read_only(self.abundances / sum(self.values())))
+
+    @property
+    def normalized(self) -> dict[str, float]:
+        """
+        Returns a dictionary with the abundances normalized to 1.
+        """
+        return dict(zip(self.elements, self.fractions.tolist()))
+
+    @property
+    def atomic_weights(self) -> np.ndarray:
+        """
+        Returns the atomic weights of the elements as read-only array. Charges of ions are ignored.
+        """
+
+        def calculate():
+            weights = get_atomic_weights()
+            elements = [re.findall('[A-zA-Z]*', element)[0] for element in self.elements]
+            for element in elements:
+                if element not in weights:
+                    raise ElementNotImplementedException(element)
+            return _read_only(np.array([weights[element] for element in elements], dtype=float))
+
+        return self._cached('atomic_weights', calculate)
+
+    @property
+    def mean_atomic_weight(self) -> float:
+        """
+        Returns the mean atomic weight of the composition in g/mol.
+        """
+        return self._cached('mean_atomic_weight', lambda: float(np.sum(self.fractions * self.atomic_weights)))
+
+    @property
+    def atomic_numbers(self) -> np.ndarray:
+        """
+        Returns the atomic numbers Z of the elements (as tabulated by Hajdu et al.) as read-only array.
+        """
+
+        def calculate():
+            table = get_calculator('hajdu').incoherent_param
+            z = dict(zip(table['Element'].tolist(), table['Z'].tolist()))
+            for element in self.elements:
+                if element not in z:
+                    raise ElementNotImplementedException(element)
+            return _read_only(np.array([z[element] for element in self.elements], dtype=float))
+
+        return self._cached('atomic_numbers', calculate)
+
+    @property
+    def atomic_number_sum(self) -> float:
+        """
+        Returns the sum of the atomic numbers of all elements weighted with their (not normalized) abundances.
+        """
+        return self._cached('atomic_number_sum', lambda: float(np.sum(self.abundances * self.atomic_numbers)))
+
+    def form_factors(self, q: np.ndarray, sf_source: str = 'hajdu') \
+            -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Calculates the coherent scattering factors of all elements, the square of the mean form factor <f>^2, the
+        mean of the squared form factors <f^2> and the mean incoherent scattering intensity for the given q values.
+        The results are memoized for the most recently used q grids.
+
+        :param q: q array in A^-1
+        :param sf_source: source of the scattering factors. Possible sources are 'hajdu' and 'brown_hubbell'.
+        :return: tuple of read-only arrays (f with the shape (n_elements, len(q)), <f>^2, <f^2>, incoherent intensity)
+        """
+        q = np.asarray(q, dtype=float)
+        key = (sf_source, q.shape, q.tobytes())
+        result = self._form_factor_cache.get(key)
+        if result is not None:
+            self._form_factor_cache.move_to_end(key)
+            return result
+
+        result = tuple(_read_only(values) for values in get_calculator(sf_source).calculate_form_factors(self, q))
+        self._form_factor_cache[key] = result
+        while len(self._form_factor_cache) > self.max_cached_grids:
+            self._form_factor_cache.popitem(last=False)
+        return result
+
+    def f_mean_squared(self, q: np.ndarray, sf_source: str = 'hajdu') -> np.ndarray:
+        """
+        Returns the square of the mean form factor <f>^2 for the given q values.
+        """
+        return self.form_factors(q, sf_source)[1]
+
+    def f_squared_mean(self, q: np.ndarray, sf_source: str = 'hajdu') -> np.ndarray:
+        """
+        Returns the mean of the squared form factors <f^2> for the given q values.
+        """
+        return self.form_factors(q, sf_source)[2]
+
+    def incoherent_scattering(self, q: np.ndarray, sf_source: str = 'hajdu') -> np.ndarray:
+        """
+        Returns the mean incoherent scattering intensity for the given q values.
+        """
+        return self.form_factors(q, sf_source)[3]
+
+
+def as_composition(composition: dict[str, float] | Composition) -> Composition:
+    """
+    Converts a composition dictionary into a Composition. A Composition is returned unchanged, so that its cached
+    values are reused.
+
+    :param composition: dictionary with elements as key and abundances as relative numbers
+    :return: Composition
+    """
+    if isinstance(composition, Composition):
+        return composition
+    return Composition(composition)
+
+
+def _read_only(values: np.ndarray) -> np.ndarray:
+    values.flags.writeable = False
+    return values
@@ -0,0 +1,61 @@
+"""
+Converts the csv tables of the scattering factors and atomic weights into NumPy structured arrays saved as .npz files,
+which are loaded by glassure.core.scattering_factors. Needs to be rerun after changing any of the csv tables.
+
+For the tabulated Brown-Hubbell incoherent intensities, the knots and coefficients of the cubic interpolating splines
+are precomputed and saved as well.
+"""
+import os
+import csv
+
+import numpy as np
+from scipy.interpolate import make_interp_spline
+
+# the tables are read from and written to the directory of this script, independent of the working directory
+data_path = os.path.dirname(os.path.abspath(__file__))
+
+
+def read_csv_table(filename):
+    with open(os.path.join(data_path, filename), encoding='utf-8-sig') as f:
+        rows = list(csv.reader(f))
+    header, rows = rows[0], rows[1:]
+    columns = list(zip(*rows))
+
+    dtype = []
+    for name, values in zip(header, columns):
+        try:
+            [float(value) for value in values]
+            dtype.append((name, 'f8'))
+        except ValueError:
+            dtype.append((name, 'U{}'.format(max(len(value) for value in values))))
+    return np.array([tuple(row) for row in rows], dtype=dtype)
+
+
+def create_spline_coefficients(table, x_name):
+    """
+    Creates the cubic (not-a-knot) interpolating splines of all columns in a table, which is the same spline as used by
+    scipy.interpolate.interp1d(kind='cubic'). Returns the knots and the coefficients as structured array with the same
+    column names as the table.
+    """
+    y_names = [name for name in table.dtype.names if name != x_name]
+    y = np.stack([table[name] for name in y_names], axis=1)
+    spline = make_interp_spline(table[x_name], y, k=3, axis=0)
+    coefficients = np.array([tuple(row) for row in spline.c], dtype=[(name, 'f8') for name in y_names])
+    return spline.t, coefficients
+
+
+np.savez_compressed(os.path.join(data_path, 'atomic_weights.npz'),
+                    atomic_weights=read_csv_table('atomic_weights.csv'))
+
+np.savez_compressed(os.path.join(data_path, 'hajdu', 'scattering_factors.npz'),
+                    coherent=read_csv_table(os.path.join('hajdu', 'param_coherent_scattering_factors.csv')),
+                    incoherent=read_csv_table(os.path.join('hajdu', 'param_incoherent_scattering_intensities.csv')))
+
+brown_hubbell_incoherent = read_csv_table(os.path.join('brown_hubbell', 'incoherent_scattering_intensities.csv'))
+brown_hubbell_knots, brown_hubbell_coefficients = create_spline_coefficients(brown_hubbell_incoherent, 'q')
+
+np.savez_compressed(os.path.join(data_path, 'brown_hubbell', 'scattering_factors.npz'),
+                    coherent=read_csv_table(os.path.join('brown_hubbell', 'param_coherent_scattering_factors.csv')),
+                    incoherent=brown_hubbell_incoherent,
+                    incoherent_spline_knots=brown_hubbell_knots,
+                    incoherent_spline_coefficients=brown_hubbell_coefficients)
@@ -23,3 +23,5 @@ class FourierTransformMethod(Enum):
     """
     FFT = 'fft'
     INTEGRAL = 'integral'
+    DST = 'dst'
+    CZT = 'czt'
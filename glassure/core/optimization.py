@@ -1,30 +1,44 @@
 # -*- coding: utf-8 -*-
+from __future__ import annotations
 
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from copy import deepcopy
+from typing import Optional
 
 import numpy as np
 import lmfit
 
 from . import Pattern
-from .calc import calculate_fr, calculate_gr_raw, calculate_sq, calculate_sq_raw, calculate_normalization_factor_raw, \
-    fit_normalization_factor
-from .utility import convert_density_to_atoms_per_cubic_angstrom, calculate_incoherent_scattering, \
-    calculate_f_mean_squared, calculate_f_squared_mean
+from .pattern import PatternStack, BkgNotInRangeError
+from .calc import calculate_fr, calculate_gr_raw, calculate_sq_raw, calculate_normalization_factor_raw, \
+    fit_normalization_factor, _transform_sq_to_fr, _sine_transform_operator
+from .utility import convert_density_to_atoms_per_cubic_angstrom, calculate_incoherent_scattering
 from .utility import extrapolate_to_zero_poly
 from .soller_correction import SollerCorrection
+from .sine_kernel import get_sine_kernel, trapezoid_weights
+from .composition import Composition, as_composition
+from .stop_condition import StopCondition, check_tolerance_criterion, residual_rms, minimize_until_stopped
 
-__all__ = ['optimize_sq', 'optimize_density', 'optimize_incoherent_container_scattering',
-           'optimize_soller_dac']
+__all__ = ['optimize_sq', 'SqOptimizer', 'DensityObjective', 'optimize_density', 'calculate_chi2_map',
+           'optimize_density_series', 'density_series_dtype', 'optimize_incoherent_container_scattering',
+           'optimize_soller_dac', 'optimize_soller_dac_sweep', 'soller_sweep_dtype']
 
 
 def optimize_sq(sq_pattern: Pattern, r_cutoff: float, iterations: int, atomic_density: float,
                 use_modification_fcn: bool = False, attenuation_factor: float = 1,
-                fcn_callback=None, callback_period: int = 2, fourier_transform_method: str = 'fft'):
+                fcn_callback=None, callback_period: int = 2, fourier_transform_method: str = 'fft',
+                tolerance: float = None, tolerance_criterion: str = 'fr', return_info: bool = False,
+                anderson_history: int = 0, stop_condition: StopCondition = None):
     """
     Performs an optimization of the structure factor based on an r_cutoff value as described in Eggert et al. 2002 PRB,
     65, 174105. This basically does back and forward transforms between S(Q) and f(r) until the region below the
     r_cutoff value is a flat line without any oscillations.
 
+    If a tolerance is given, the optimization stops as soon as the residual of an iteration is below the tolerance,
+    and iterations is only the maximum number of iterations.
+
     :param sq_pattern:
         original S(Q)
     :param r_cutoff:
@@ -43,47 +57,464 @@ def optimize_sq(sq_pattern: Pattern, r_cutoff: float, iterations: int, atomic_de
     :param fcn_callback:
         Function which will be called at an iteration period defined by the callback_period parameter.
         The function should take three arguments: sq_pattern, fr_pattern and gr_pattern.
-        Additionally, the function should return a boolean value, where True continues the optimization and False will
-        stop the optimization.
+        Additionally, the function can return False to stop the optimization, any other value continues it.
     :param callback_period:
         determines how frequently the fcn_callback will be called.
     :param fourier_transform_method:
-        determines which method will be used for the Fourier transform. Possible values are 'fft' and 'integral'
+        determines which method will be used for the Fourier transform. Possible values are 'fft', 'dst', 'czt'
+        and 'integral'
+    :param tolerance:
+        residual below which the optimization is considered converged. None (default) always performs the given
+        number of iterations
+    :param tolerance_criterion:
+        residual used for the convergence check, either 'fr' for the root mean square of delta F(r) below r_cutoff or
+        'sq' for the root mean square of the S(Q) update of an iteration
+    :param return_info:
+        whether to additionally return the number of performed iterations and the residual history
+    :param anderson_history:
+        number of previous iterates used for the Anderson acceleration of the iteration. 0 (default) disables the
+        acceleration and performs the plain (damped) iteration. With a history of about 5 iterates, the flat low r
+        region in F(r) is usually reached in considerably fewer iterations, especially with the Lorch modification
+        function. Combine it with a tolerance to benefit from the faster convergence.
+    :param stop_condition:
+        StopCondition for stopping the optimization early (cancellation, wall-clock budget or maximum number of
+        iterations), in which case the current S(Q) is returned
 
     :return:
-        optimized S(Q) pattern
+        optimized S(Q) pattern, or if return_info is True a tuple of the optimized S(Q) pattern, the number of performed
+        iterations and an array with the residual (see tolerance_criterion) of each iteration
     """
+    check_tolerance_criterion(tolerance_criterion)
+    q, sq_int = sq_pattern.data
     r = np.arange(0, r_cutoff, 0.02)
-    sq_pattern = deepcopy(sq_pattern)
-    for iteration in range(iterations):
-        fr_pattern = calculate_fr(sq_pattern, r, use_modification_fcn, method=fourier_transform_method)
-        q, sq_int = sq_pattern.data
-        r, fr_int = fr_pattern.data
-
-        delta_fr = fr_int + 4 * np.pi * r * atomic_density
+    optimizer = SqOptimizer(q, r, atomic_density, use_modification_fcn, attenuation_factor, fourier_transform_method,
+                            anderson_history)
 
-        in_integral = np.array(np.sin(np.outer(q.T, r))) * delta_fr
-        integral = np.trapz(in_integral, r) / attenuation_factor
-        sq_optimized = sq_int * (1 - 1. / q * integral)
+    if stop_condition is None:
+        stop_condition = StopCondition()
+    stop_condition.start()
 
-        sq_pattern = Pattern(q, sq_optimized)
+    sq = np.array(sq_int, dtype=float)
+    residuals = []
+    for iteration in range(iterations):
+        if stop_condition.stopped:
+            break
+        fr_residual, sq_residual = optimizer.step(sq)
+        stop_condition.count_evaluation()
+        residuals.append(fr_residual if tolerance_criterion == 'fr' else sq_residual)
 
         if fcn_callback is not None and iteration % callback_period == 0:
+            sq_pattern = Pattern(q, sq.copy())
             fr_pattern = calculate_fr(sq_pattern,
                                       use_modification_fcn=use_modification_fcn,
                                       method=fourier_transform_method)
             gr_pattern = calculate_gr_raw(fr_pattern, atomic_density)
-            fcn_callback(sq_pattern, fr_pattern, gr_pattern)
-    return sq_pattern
+            stop_condition.check_callback_result(fcn_callback(sq_pattern, fr_pattern, gr_pattern))
+
+        if tolerance is not None and residuals[-1] < tolerance:
+            break
+
+    if return_info:
+        return Pattern(q, sq), len(residuals), np.array(residuals)
+    return Pattern(q, sq)
+
+
+def _forward_operator(q: np.ndarray, r: np.ndarray, use_modification_fcn: bool, method: str) -> Optional[np.ndarray]:
+    """
+    Returns the matrix M for which F(r) = (S(Q) - 1) @ M, or None if it is not available for the method.
+    """
+    operator = _sine_transform_operator(q, r, method)
+    if operator is not None:
+        weights = q.copy()
+        if use_modification_fcn:
+            weights *= np.sin(q * np.pi / np.max(q)) / (q * np.pi / np.max(q))
+        operator *= weights[:, np.newaxis]
+    return operator
+
+
+class SqOptimizer(object):
+    """
+    Iteration engine for the S(Q) optimization described in Eggert et al. 2002 PRB, 65, 174105 (see optimize_sq).
+
+    The forward (S(Q) -> F(r)) and backward (delta F(r) -> S(Q) correction) transform operators are precomputed for the
+    fixed q and r grids when the optimizer is created. Each iteration then only consists of the forward transform
+    (a matrix product for the 'integral' method), one matrix product for the backward transform and in-place
+    array operations on preallocated buffers.
+
+    Optionally, the iteration is accelerated by Anderson mixing: the next S(Q) is the combination of the most recent
+    iterates whose fixed point residuals (S(Q) updates) best cancel each other in the least squares sense.
+
+    :param q: q values of S(Q) in A^-1
+    :param r: r values below r_cutoff in A, for which F(r) should be flat
+    :param atomic_density: density in atoms/A^3
+    :param use_modification_fcn: Whether to use the Lorch modification function during the forward Fourier transform
+    :param attenuation_factor: reduces the amount of change during each iteration
+    :param fourier_transform_method: method used for the forward Fourier transform. Possible values are 'fft', 'dst',
+                                     'czt' and 'integral'
+    :param anderson_history: number of previous iterates used for the Anderson acceleration, 0 disables it
+    """
+
+    def __init__(self, q: np.ndarray, r: np.ndarray, atomic_density: float, use_modification_fcn: bool = False,
+                 attenuation_factor: float = 1, fourier_transform_method: str = 'fft', anderson_history: int = 0):
+        self.q = np.asarray(q, dtype=float)
+        self.r = np.asarray(r, dtype=float)
+        self.atomic_density = atomic_density
+        self.use_modification_fcn = use_modification_fcn
+        self.fourier_transform_method = fourier_transform_method
+
+        # 1/q * trapz(sin(q*r) * delta_fr, r) / attenuation_factor as matrix product: delta_fr @ backward_operator
+        self._backward_operator = trapezoid_weights(self.r)[:, np.newaxis] * get_sine_kernel(self.q, self.r).T / \
+                                  (self.q * attenuation_factor)
+
+        # F(r) as matrix product (S(Q) - 1) @ forward_operator, only available for the 'integral' method
+        self._forward_operator = _forward_operator(self.q, self.r, use_modification_fcn, fourier_transform_method)
+
+        self._sq_buffer = np.empty(len(self.q))
+        self._fr_buffer = np.empty(len(self.r))
+
+        if anderson_history < 0:
+            raise ValueError("anderson_history needs to be zero or positive.")
+        self.anderson_history = anderson_history
+        # differences of consecutive residuals and iterates for the Anderson acceleration
+        self._residual_differences = deque(maxlen=anderson_history)
+        self._iterate_differences = deque(maxlen=anderson_history)
+        self._previous_residual = None
+        self._previous_iterate = None
+
+    @property
+    def atomic_density(self) -> float:
+        """
+        Returns the atomic density in atoms/A^3. Changing it does not require recalculating the transform operators.
+        """
+        return self._atomic_density
+
+    @atomic_density.setter
+    def atomic_density(self, value: float):
+        self._atomic_density = value
+        self._density_term = 4 * np.pi * self.r * value
+
+    @property
+    def forward_operator(self) -> Optional[np.ndarray]:
+        """
+        Returns the matrix with the shape (len(q), len(r)) for which F(r) = (S(Q) - 1) @ forward_operator, or None if it
+        is not available for the Fourier transform method.
+        """
+        return self._forward_operator
+
+    @property
+    def backward_operator(self) -> np.ndarray:
+        """
+        Returns the matrix with the shape (len(r), len(q)) for which the relative S(Q) correction of an iteration is
+        delta_fr @ backward_operator.
+        """
+        return self._backward_operator
+
+    def calculate_fr(self, sq: np.ndarray) -> np.ndarray:
+        """
+        Calculates F(r) for the r values of the optimizer.
+
+        :param sq: S(Q) values for the q values of the optimizer, or a 2-dimensional array with one S(Q) per row
+        :return: F(r) values, for a 1-dimensional sq the returned array is reused by the optimizer
+        """
+        if sq.ndim > 1:
+            if self._forward_operator is None:
+                return _transform_sq_to_fr(self.q, sq, self.r, self.use_modification_fcn,
+                                           self.fourier_transform_method)
+            return np.dot(sq - 1, self._forward_operator)
+
+        if self._forward_operator is None:
+            self._fr_buffer[:] = _transform_sq_to_fr(self.q, sq, self.r, self.use_modification_fcn,
+                                                     self.fourier_transform_method)
+        else:
+            np.subtract(sq, 1, out=self._sq_buffer)
+            np.dot(self._sq_buffer, self._forward_operator, out=self._fr_buffer)
+        return self._fr_buffer
+
+    def step(self, sq: np.ndarray, fr: Optional[np.ndarray] = None) -> tuple[float, float]:
+        """
+        Performs one iteration of the optimization, sq is updated in place.
+
+        :param sq: S(Q) values for the q values of the optimizer
+        :param fr: F(r) of sq if it is already known (e.g. combined from precomputed transforms), otherwise it is
+                   calculated
+        :return: root mean square of the deviation of F(r) from the expected -4*pi*r*rho_0 (delta F(r)) before the
+                 update and root mean square of the (not accelerated) S(Q) update
+        """
+        if fr is None:
+            delta_fr = self.calculate_fr(sq)
+        else:
+            delta_fr = self._fr_buffer
+            delta_fr[:] = fr
+        delta_fr += self._density_term
+
+        update = np.dot(delta_fr, self._backward_operator, out=self._sq_buffer)
+        update *= sq
+        sq -= update
+        residuals = residual_rms(delta_fr), residual_rms(update)
+
+        if self.anderson_history > 0:
+            self._anderson_mixing(sq, -update)
+        return residuals
+
+    def _anderson_mixing(self, sq: np.ndarray, residual: np.ndarray):
+        """
+        Replaces the plain iterate sq (in place) by the Anderson mixture of the recent iterates.
+        """
+        if self._previous_residual is not None:
+            self._residual_differences.append(residual - self._previous_residual)
+            self._iterate_differences.append(sq - self._previous_iterate)
+        self._previous_residual = residual
+        self._previous_iterate = sq.copy()
+
+        if len(self._residual_differences) == 0:
+            return
+        try:
+            gamma = np.linalg.lstsq(np.transpose(self._residual_differences), residual, rcond=None)[0]
+        except np.linalg.LinAlgError:
+            return
+        if np.all(np.isfinite(gamma)):
+            sq -= np.dot(gamma, self._iterate_differences)
+
+    def reset(self):
+        """
+        Clears the iterate history of the Anderson acceleration, needed when the optimizer is used for a new S(Q).
+        """
+        self._residual_differences.clear()
+        self._iterate_differences.clear()
+        self._previous_residual = None
+        self._previous_iterate = None
+
+
+class DensityObjective(object):
+    """
+    Objective function for the optimization of the density and the background scaling (see optimize_density), using the
+    figure of merit of the low r region in F(r) as described in Eggert et al. (2002) PRB, 65, 174105.
+
+    Before the extrapolation, S(Q) is affine in the background scaling s:
+
+        S(Q) = n * (I_data - s * I_bkg) / <f>^2 + (<f>^2 - <f^2> - incoherent) / <f>^2
+
+    where the normalization factor n only depends on the density and on integrals, which are linear in I_data and I_bkg.
+    Therefore, the background interpolation, the form factors, the normalization integrals and the Fourier transforms of
+    the data, background and form factor contributions are calculated once. For each density and background scaling,
+    only the normalization factor, the extrapolation to zero and the Eggert iteration are recalculated. The final F(r)
+    used for chi2 is always calculated with a precomputed 'integral' operator (combined from the precomputed transforms
+    without iterations), whatever the fourier_transform_method is. The F(r) at the start of the iteration is only
+    combined from precomputed transforms for the 'integral' method, for the other methods it is recalculated with that
+    method in every evaluation.
+
+    :param data_pattern:        raw data pattern in Q space (A^-1)
+    :param background_pattern:  raw background pattern in Q space (A^-1), its scaling is ignored
+    :param composition:         composition of the sample as a dictionary with elements as keys and abundances as values
+    :param r_cutoff:            cutoff value below which there is no signal expected (below the first peak in g(r))
+    :param iterations:          number of iterations of S(Q) (see optimize_sq(...)) prior to calculating chi2
+    :param use_modification_fcn:
+                                Whether to use the Lorch modification function during the Fourier transform.
+    :param extrapolation_cutoff:
+                                Determines up to which q value the S(Q) will be extrapolated to zero. The default
+                                (None) will use the minimum q value plus 0.2 A^-1
+    :param r_step:              Step size for the r-space for calculating f(r) for the figure of merit
+    :param fourier_transform_method:
+                                Fourier transform method used during the iterations (see optimize_sq(...)), the
+                                iteration transforms are only precomputed for 'integral'. The final F(r) for chi2
+                                always uses the precomputed 'integral' operator.
+    :param tolerance:           tolerance for stopping the iterations early (see optimize_sq(...))
+    :param tolerance_criterion: residual used for the tolerance check, 'fr' or 'sq' (see optimize_sq(...))
+    :param template:            another DensityObjective (e.g. of the previous pattern of a series), whose q grid
+                                dependent Fourier transform operators are reused if the q values and the transform
+                                settings are the same
+    """
+
+    def __init__(self, data_pattern: Pattern, background_pattern: Pattern, composition: dict[str, float],
+                 r_cutoff: float, iterations: int, use_modification_fcn: bool = False,
+                 extrapolation_cutoff: float = None, r_step: float = 0.01, fourier_transform_method: str = 'fft',
+                 tolerance: float = None, tolerance_criterion: str = 'fr', template: DensityObjective = None):
+        check_tolerance_criterion(tolerance_criterion)
+        self.composition = as_composition(composition)
+        self.r_cutoff = r_cutoff
+        self.iterations = iterations
+        self.use_modification_fcn = use_modification_fcn
+        self.r_step = r_step
+        self.fourier_transform_method = fourier_transform_method
+        self.tolerance = tolerance
+        self.tolerance_criterion = tolerance_criterion
+
+        q, data_intensity = data_pattern.data
+        bkg_q, bkg_offset, bkg_intensity = _background_components(background_pattern)
+        if q.shape != bkg_q.shape:
+            # the background is interpolated onto the overlapping q values, the same way as in Pattern.__sub__
+            ind = (q <= np.max(bkg_q)) & (q >= np.min(bkg_q))
+            if not np.any(ind):
+                raise BkgNotInRangeError(data_pattern.name)
+            q, data_intensity = q[ind], data_intensity[ind]
+            bkg_offset = np.interp(q, bkg_q, bkg_offset)
+            bkg_intensity = np.interp(q, bkg_q, bkg_intensity)
+        self.q = q
+        data_intensity = data_intensity - bkg_offset
+
+        _, f_mean_squared, f_squared_mean, incoherent_scattering = self.composition.form_factors(q)
+
+        # normalization factor (see calculate_normalization_factor_raw) with integrals linear in the intensity
+        weights = q ** 2 * np.exp(-0.001 * q ** 2) / f_mean_squared
+        self._normalization_numerator = np.trapz(q, weights * (f_squared_mean + incoherent_scattering))
+        self._normalization_data = np.trapz(q, weights * data_intensity)
+        self._normalization_bkg = np.trapz(q, weights * bkg_intensity)
+
+        # S(Q) = n * (data_sq - s * bkg_sq) + offset_sq (Faber-Ziman, see calculate_sq_raw)
+        self._data_sq = data_intensity / f_mean_squared
+        self._bkg_sq = bkg_intensity / f_mean_squared
+        self._offset_sq = (f_mean_squared - f_squared_mean - incoherent_scattering) / f_mean_squared
+
+        self.extrapolation_max = extrapolation_cutoff or np.min(q) + 0.2
+        self.r = np.arange(0, r_cutoff + r_step / 2., r_step)
+
+        if template is not None and self._has_same_operators(template):
+            # the optimizer is only used for its operators and stateless transforms, so it can be shared
+            self._optimizer = template._optimizer
+            self._final_operator = template._final_operator
+        else:
+            # the extrapolated q grid only depends on the q values of the data
+            q_extrapolated = extrapolate_to_zero_poly(Pattern(q, self._offset_sq), self.extrapolation_max).x
+            self._optimizer = SqOptimizer(q_extrapolated, np.arange(0, r_cutoff, 0.02), 0, use_modification_fcn,
+                                          fourier_transform_method=fourier_transform_method)
+            self._final_operator = _forward_operator(q_extrapolated, self.r, use_modification_fcn, 'integral')
+
+        self._iteration_transforms = None
+        if self._optimizer.forward_operator is not None:
+            self._iteration_transforms = self._component_transforms(self._optimizer.forward_operator)
+        self._final_transforms = self._component_transforms(self._final_operator)
+
+    def _has_same_operators(self, other: DensityObjective) -> bool:
+        return np.array_equal(self.q, other.q) and np.array_equal(self.r, other.r) and \
+            self.extrapolation_max == other.extrapolation_max and \
+            self.use_modification_fcn == other.use_modification_fcn and \
+            self.fourier_transform_method == other.fourier_transform_method
+
+    def _component_transforms(self, operator: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Splits the F(r) operator into the part for the extrapolated region and the transforms of the data, background
+        and offset contributions of S(Q) - 1.
+        """
+        n_low = len(operator) - len(self.q)
+        operator_data = operator[n_low:]
+        return operator[:n_low], np.dot(self._data_sq, operator_data), np.dot(self._bkg_sq, operator_data), \
+            np.dot(self._offset_sq - 1, operator_data)
+
+    @staticmethod
+    def _combine_transforms(transforms, sq_low: np.ndarray, normalization_factors: np.ndarray,
+                            background_scalings: np.ndarray) -> np.ndarray:
+        operator_low, data_fr, bkg_fr, offset_fr = transforms
+        return np.dot(sq_low - 1, operator_low) + offset_fr + \
+            normalization_factors[:, np.newaxis] * (data_fr - background_scalings[:, np.newaxis] * bkg_fr)
+
+    def calculate_sq(self, density: float, background_scalings: float | np.ndarray) \
+            -> tuple[Pattern | PatternStack, float | np.ndarray]:
+        """
+        Calculates the (not extrapolated) S(Q) for the given density and background scaling(s).
+
+        :param density: density in g/cm^3
+        :param background_scalings: background scaling or array of background scalings, negative values are treated
+                                    as 0 (as for Pattern.scaling)
+        :return: S(Q) pattern and normalization factor, for an array of background scalings a PatternStack and an
+                 array of normalization factors
+        """
+        scalings = np.maximum(np.atleast_1d(np.asarray(background_scalings, dtype=float)), 0)
+        atomic_density = convert_density_to_atoms_per_cubic_angstrom(self.composition, density)
+        normalization_factors = (-2 * np.pi ** 2 * atomic_density + self._normalization_numerator) / \
+                                (self._normalization_data - scalings * self._normalization_bkg)
+        sq = normalization_factors[:, np.newaxis] * (self._data_sq - scalings[:, np.newaxis] * self._bkg_sq) + \
+            self._offset_sq
+        if np.ndim(background_scalings) == 0:
+            return Pattern(self.q, sq[0]), normalization_factors[0]
+        return PatternStack(self.q, sq), normalization_factors
+
+    def evaluate(self, density: float, background_scalings: float | np.ndarray) -> tuple[np.ndarray, PatternStack]:
+        """
+        Calculates the figure of merit and the optimized S(Q) for one density and several background scalings at once.
+        The objective is not modified, so it can be evaluated from several threads at the same time.
+
+        :param density: density in g/cm^3
+        :param background_scalings: array of background scalings
+        :return: array of (F(r) + 4 * pi * rho * r)^2 * r_step for the r values up to r_cutoff with one row per
+                 background scaling, PatternStack with the extrapolated and optimized S(Q)
+        """
+        scalings = np.atleast_1d(np.asarray(background_scalings, dtype=float))
+        sq_stack, normalization_factors = self.calculate_sq(density, scalings)
+        scalings = np.maximum(scalings, 0)
+        atomic_density = convert_density_to_atoms_per_cubic_angstrom(self.composition, density)
+
+        q, sq = extrapolate_to_zero_poly(sq_stack, self.extrapolation_max).data
+        sq = np.array(sq, dtype=float)
+        sq_low = sq[:, :len(q) - len(self.q)]
+
+        if self.iterations > 0:
+            fr = None
+            if self._iteration_transforms is not None:
+                fr = self._combine_transforms(self._iteration_transforms, sq_low, normalization_factors, scalings)
+            self._iterate(sq, fr, atomic_density)
+            fr = np.dot(sq - 1, self._final_operator)
+        else:
+            fr = self._combine_transforms(self._final_transforms, sq_low, normalization_factors, scalings)
+
+        return (fr + 4 * np.pi * atomic_density * self.r) ** 2 * self.r_step, PatternStack(q, sq)
+
+    def _iterate(self, sq: np.ndarray, fr: Optional[np.ndarray], atomic_density: float):
+        """
+        Performs the iterations of SqOptimizer.step for all rows of sq (in place), without changing the state of the
+        optimizer. Each row stops separately when reaching the tolerance.
+        """
+        optimizer = self._optimizer
+        density_term = 4 * np.pi * optimizer.r * atomic_density
+        active = np.arange(len(sq))
+        for _ in range(self.iterations):
+            if fr is None:
+                fr = optimizer.calculate_fr(sq[active])
+            delta_fr = fr + density_term
+            update = np.dot(delta_fr, optimizer.backward_operator) * sq[active]
+            sq[active] -= update
+            fr = None
+
+            if self.tolerance is not None:
+                residuals = residual_rms(delta_fr) if self.tolerance_criterion == 'fr' else residual_rms(update)
+                active = active[residuals >= self.tolerance]
+                if len(active) == 0:
+                    break
+
+    def __call__(self, density: float, background_scaling: float) -> np.ndarray:
+        """
+        Calculates the figure of merit for the given density and background scaling.
+
+        :param density: density in g/cm^3
+        :param background_scaling: background scaling
+        :return: array of (F(r) + 4 * pi * rho * r)^2 * r_step for the r values up to r_cutoff
+        """
+        return self.evaluate(density, background_scaling)[0][0]
+
+
+def _background_components(background_pattern: Pattern) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Splits the data of the background pattern into the part independent of its scaling and the part proportional to
+    its scaling.
+
+    :return: x values, constant part, part proportional to the scaling
+    """
+    background_pattern = deepcopy(background_pattern)
+    background_pattern.scaling = 0
+    x, offset = background_pattern.data
+    background_pattern.scaling = 1
+    _, intensity = background_pattern.data
+    return x, offset, intensity - offset
 
 
 def optimize_density(data_pattern, background_pattern, initial_background_scaling, composition,
                      initial_density, background_min, background_max, density_min, density_max,
                      iterations, r_cutoff, use_modification_fcn=False, extrapolation_cutoff=None,
-                     r_step=0.01, fcn_callback=None):
+                     r_step=0.01, fcn_callback=None, tolerance=None, tolerance_criterion='fr', stop_condition=None,
+                     fourier_transform_method='fft'):
     """
     Performs an optimization of the background scaling and density using a figure of merit function defined by the low
-    r region in F(r) as described in Eggert et al. (2002) PRB, 65, 174105.
+    r region in F(r) as described in Eggert et al. (2002) PRB, 65, 174105. The figure of merit is evaluated by a
+    DensityObjective, which precomputes everything not depending on the density and background scaling.
 
     :param data_pattern:       raw data pattern in Q space (A^-1)
     :param background_pattern: raw background pattern in Q space (A^-1)
@@ -107,53 +538,247 @@ def optimize_density(data_pattern, background_pattern, initial_background_scalin
     :param r_step:              Step size for the r-space for calculating f(r) during each iteration.
     :param fcn_callback:        Function which will be called after each iteration. The function should take four
                                 arguments: iteration number, chi2, density, and background scaling. Additionally, the
-                                function should return a boolean value, where True continues the optimization and False
-                                will stop the optimization procedure
+                                function can return False to stop the optimization, any other value continues it.
+    :param tolerance:           tolerance for stopping the S(Q) optimization early (see optimize_sq(...)), in which
+                                case iterations is the maximum number of iterations
+    :param tolerance_criterion: residual used for the tolerance check, 'fr' or 'sq' (see optimize_sq(...))
+    :param stop_condition:      StopCondition for stopping the optimization early (cancellation, wall-clock budget or
+                                maximum number of objective function evaluations), in which case the best parameters so
+                                far are returned without standard errors
+    :param fourier_transform_method:
+                                Fourier transform method used for the iterations of S(Q) (see optimize_sq(...))
 
     :return: (tuple) - density, density standard error, background scaling, background scaling standard error
     """
+    objective = DensityObjective(data_pattern, background_pattern, composition, r_cutoff, iterations,
+                                 use_modification_fcn, extrapolation_cutoff, r_step, fourier_transform_method,
+                                 tolerance, tolerance_criterion)
+    result = _minimize_density(objective, initial_density, initial_background_scaling, background_min,
+                               background_max, density_min, density_max, fcn_callback, stop_condition)
+    lmfit.report_fit(result.params)
+
+    return result.params['density'].value, result.params['density'].stderr, \
+        result.params['background_scaling'].value, result.params['background_scaling'].stderr
+
+
+def _minimize_density(objective: DensityObjective, initial_density: float, initial_background_scaling: float,
+                      background_min: float, background_max: float, density_min: float, density_max: float,
+                      fcn_callback=None, stop_condition: StopCondition = None) -> lmfit.minimizer.MinimizerResult:
     params = lmfit.Parameters()
     params.add("density", value=initial_density, min=density_min, max=density_max)
     params.add("background_scaling", value=initial_background_scaling, min=background_min, max=background_max)
 
-    r = np.arange(0, r_cutoff + r_step / 2., r_step)
+    if stop_condition is None:
+        stop_condition = StopCondition()
 
-    def optimization_fcn(params, extrapolation_max, r, r_cutoff, use_modification_fcn):
+    def optimization_fcn(params):
         density = params['density'].value
-        atomic_density = convert_density_to_atoms_per_cubic_angstrom(composition, density)
-        background_pattern.scaling = params['background_scaling'].value
-
-        sq = calculate_sq(data_pattern - background_pattern, density, composition)
-        extrapolation_max = extrapolation_max or np.min(sq._x[0]) + 0.2
-        sq = extrapolate_to_zero_poly(sq, extrapolation_max)
-        sq_optimized = optimize_sq(sq, r_cutoff, iterations, atomic_density, use_modification_fcn)
-        fr = calculate_fr(sq_optimized, r=r, use_modification_fcn=use_modification_fcn)
-
-        min_r, min_fr = fr.data
-
-        output = (min_fr + 4 * np.pi * atomic_density * min_r) ** 2 * r_step
+        output = objective(density, params['background_scaling'].value)
 
         if fcn_callback is not None:
-            if not fcn_callback(optimization_fcn.iteration,
-                                np.sum(output),
-                                density,
-                                params['background_scaling'].value):
-                return None
+            stop_condition.check_callback_result(fcn_callback(optimization_fcn.iteration,
+                                                              np.sum(output),
+                                                              density,
+                                                              params['background_scaling'].value))
         optimization_fcn.iteration += 1
         return output
 
     optimization_fcn.iteration = 1
 
-    lmfit.minimize(optimization_fcn, params, args=(extrapolation_cutoff, r, r_cutoff, use_modification_fcn))
-    lmfit.report_fit(params)
+    return minimize_until_stopped(optimization_fcn, params, stop_condition)
+
+
+def calculate_chi2_map(data_pattern, background_pattern, composition, densities, background_scalings, r_cutoff,
+                       iterations=2, use_modification_fcn=False, extrapolation_cutoff=None, r_step=0.01,
+                       fourier_transform_method='fft', tolerance=None, tolerance_criterion='fr', workers=None,
+                       use_processes=False):
+    """
+    Calculates the figure of merit of optimize_density(...) (chi2) on a grid of densities and background scalings.
+    All background scalings of one density are evaluated together in one batch by a DensityObjective, and the
+    densities are distributed over a pool of threads or processes.
+
+    :param data_pattern:       raw data pattern in Q space (A^-1)
+    :param background_pattern: raw background pattern in Q space (A^-1)
+    :param composition:         composition of the sample as a dictionary with elements as keys and abundances as values
+    :param densities:           1-dimensional array of densities in g/cm^3
+    :param background_scalings: 1-dimensional array of background scalings
+    :param r_cutoff:            cutoff value below which there is no signal expected (below the first peak in g(r))
+    :param iterations:          number of iterations of S(Q) (see optimize_sq(...)) prior to calculating chi2
+    :param use_modification_fcn:
+                                Whether to use the Lorch modification function during the Fourier transform.
+    :param extrapolation_cutoff:
+                                Determines up to which q value the S(Q) will be extrapolated to zero. The default
+                                (None) will use the minimum q value plus 0.2 A^-1
+    :param r_step:              Step size of the r values up to r_cutoff used for chi2
+    :param fourier_transform_method:
+                                Fourier transform method used for the iterations of S(Q) (see optimize_sq(...))
+    :param tolerance:           tolerance for stopping the S(Q) optimization early (see optimize_sq(...))
+    :param tolerance_criterion: residual used for the tolerance check, 'fr' or 'sq' (see optimize_sq(...))
+    :param workers:             maximum number of worker threads or processes, None uses the default of
+                                concurrent.futures, 1 evaluates the grid in the calling thread
+    :param use_processes:       use a process pool instead of a thread pool
+
+    :return: (tuple) - 2-dimensional array of chi2 values with the shape (len(densities), len(background_scalings)),
+             list with a PatternStack of the optimized (and extrapolated) S(Q) for each density, with one row per
+             background scaling
+    """
+    objective = DensityObjective(data_pattern, background_pattern, composition, r_cutoff, iterations,
+                                 use_modification_fcn, extrapolation_cutoff, r_step, fourier_transform_method,
+                                 tolerance, tolerance_criterion)
+    densities = np.atleast_1d(np.asarray(densities, dtype=float))
+    background_scalings = np.atleast_1d(np.asarray(background_scalings, dtype=float))
+
+    if workers == 1:
+        results = [objective.evaluate(density, background_scalings) for density in densities]
+    elif use_processes:
+        with ProcessPoolExecutor(workers, initializer=_set_chi2_map_objective, initargs=(objective,)) as executor:
+            results = list(executor.map(_evaluate_chi2_map_row, densities,
+                                        [background_scalings] * len(densities)))
+    else:
+        with ThreadPoolExecutor(workers) as executor:
+            results = list(executor.map(objective.evaluate, densities, [background_scalings] * len(densities)))
+
+    chi2 = np.array([np.sum(output, axis=1) for output, _ in results]).reshape(len(densities),
+                                                                               len(background_scalings))
+    return chi2, [sq_stack for _, sq_stack in results]
 
-    return params['density'].value, params['density'].stderr, params['background_scaling'].value, \
-        params['background_scaling'].stderr
+
+_chi2_map_objective = None
+
+
+def _set_chi2_map_objective(objective: DensityObjective):
+    # the objective is sent once to each worker process instead of once per density
+    global _chi2_map_objective
+    _chi2_map_objective = objective
+
+
+def _evaluate_chi2_map_row(density: float, background_scalings: np.ndarray) -> tuple[np.ndarray, PatternStack]:
+    return _chi2_map_objective.evaluate(density, background_scalings)
+
+
+density_series_dtype = np.dtype([('density', 'f8'), ('density_error', 'f8'),
+                                  ('background_scaling', 'f8'), ('background_scaling_error', 'f8'),
+                                  ('initial_density', 'f8'), ('initial_background_scaling', 'f8'),
+                                  ('chi2', 'f8'), ('evaluations', 'i8'), ('time', 'f8')])
+
+
+def optimize_density_series(data_patterns, background_patterns, initial_background_scaling, composition,
+                            initial_density, background_min, background_max, density_min, density_max,
+                            iterations, r_cutoff, use_modification_fcn=False, extrapolation_cutoff=None,
+                            r_step=0.01, tolerance=None, tolerance_criterion='fr', fourier_transform_method='fft',
+                            warm_start=True, chunk_size=None, workers=None):
+    """
+    Optimizes the density and background scaling (see optimize_density(...)) for each pattern of an ordered series,
+    e.g. a compression series. The q grid dependent Fourier transform operators are calculated once and reused for all
+    patterns with the same q values (see DensityObjective) and, with warm_start, each fit starts from the optimum of the
+    previous pattern of the series.
+
+    The series can be split into chunks of consecutive patterns, which are optimized independently of each other in a
+    process pool. Within a chunk the patterns are still optimized in order, the first pattern of each chunk starts from
+    the initial values.
+
+    :param data_patterns:       ordered list of raw data patterns in Q space (A^-1)
+    :param background_patterns: list of raw background patterns (one for each data pattern) or a single background
+                                pattern used for all data patterns
+    :param initial_background_scaling:
+                                start value for the background scaling optimization of the first pattern
+    :param composition:         composition of the sample as a dictionary with elements as keys and abundances as values
+    :param initial_density:     start value for the density optimization of the first pattern in g/cm^3
+    :param background_min:      minimum value for the background scaling
+    :param background_max:      maximum value for the background scaling
+    :param density_min:         minimum value for the density
+    :param density_max:         maximum value for the density
+    :param iterations:          number of iterations of S(Q) (see optimize_sq(...) prior to calculating chi2
+    :param r_cutoff:            cutoff value below which there is no signal expected (below the first peak in g(r))
+    :param use_modification_fcn:
+                                Whether to use the Lorch modification function during the Fourier transform.
+    :param extrapolation_cutoff:
+                                Determines up to which q value the S(Q) will be extrapolated to zero. The default
+                                (None) will use the minimum q value plus 0.2 A^-1
+    :param r_step:              Step size for the r-space for calculating f(r) during each iteration.
+    :param tolerance:           tolerance for stopping the S(Q) optimization early (see optimize_sq(...))
+    :param tolerance_criterion: residual used for the tolerance check, 'fr' or 'sq' (see optimize_sq(...))
+    :param fourier_transform_method:
+                                Fourier transform method used for the iterations of S(Q) (see optimize_sq(...))
+    :param warm_start:          start each fit from the optimized density and background scaling of the previous
+                                pattern, otherwise all fits start from the initial values
+    :param chunk_size:          number of consecutive patterns per chunk, None optimizes the whole series as one chunk
+    :param workers:             maximum number of worker processes for the chunks, None uses the default of
+                                concurrent.futures, 1 optimizes all chunks in the calling process
+
+    :return: structured array with one row per pattern and the fields (see density_series_dtype): density,
+             density_error, background_scaling, background_scaling_error (nan if not available), initial_density,
+             initial_background_scaling, chi2, evaluations (number of objective function evaluations) and time
+             (wall-clock time of the fit in seconds)
+    """
+    data_patterns = list(data_patterns)
+    if isinstance(background_patterns, Pattern):
+        background_patterns = [background_patterns] * len(data_patterns)
+    background_patterns = list(background_patterns)
+    if len(background_patterns) != len(data_patterns):
+        raise ValueError("The number of background patterns ({}) does not match the number of data patterns "
+                         "({}).".format(len(background_patterns), len(data_patterns)))
+
+    objective_kwargs = dict(composition=as_composition(composition), r_cutoff=r_cutoff, iterations=iterations,
+                            use_modification_fcn=use_modification_fcn, extrapolation_cutoff=extrapolation_cutoff,
+                            r_step=r_step, fourier_transform_method=fourier_transform_method, tolerance=tolerance,
+                            tolerance_criterion=tolerance_criterion)
+    bounds = (background_min, background_max, density_min, density_max)
+
+    chunk_size = chunk_size or max(len(data_patterns), 1)
+    chunks = [(data_patterns[start:start + chunk_size], background_patterns[start:start + chunk_size])
+              for start in range(0, len(data_patterns), chunk_size)]
+    chunk_args = (initial_density, initial_background_scaling, bounds, objective_kwargs, warm_start)
+
+    if workers == 1 or len(chunks) <= 1:
+        results = [_optimize_density_chunk(*chunk, *chunk_args) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(workers) as executor:
+            futures = [executor.submit(_optimize_density_chunk, *chunk, *chunk_args) for chunk in chunks]
+            results = [future.result() for future in futures]
+
+    if len(results) == 0:
+        return np.zeros(0, dtype=density_series_dtype)
+    return np.concatenate(results)
+
+
+def _optimize_density_chunk(data_patterns, background_patterns, initial_density, initial_background_scaling, bounds,
+                            objective_kwargs, warm_start) -> np.ndarray:
+    background_min, background_max, density_min, density_max = bounds
+    results = np.zeros(len(data_patterns), dtype=density_series_dtype)
+    density, background_scaling = initial_density, initial_background_scaling
+    objective = None
+
+    for ind, (data_pattern, background_pattern) in enumerate(zip(data_patterns, background_patterns)):
+        if not warm_start:
+            density, background_scaling = initial_density, initial_background_scaling
+        start_time = time.perf_counter()
+        objective = DensityObjective(data_pattern, background_pattern, template=objective, **objective_kwargs)
+        result = _minimize_density(objective, density, background_scaling, *bounds)
+
+        params = result.params
+        results[ind] = (params['density'].value, _stderr(params['density']),
+                        params['background_scaling'].value, _stderr(params['background_scaling']),
+                        density, background_scaling, result.chisqr, result.nfev, time.perf_counter() - start_time)
+        # the optimum of this pattern is the start value for the next one
+        density = _warm_start_value(params['density'].value, density_min, density_max)
+        background_scaling = _warm_start_value(params['background_scaling'].value, background_min, background_max)
+    return results
+
+
+def _warm_start_value(value: float, minimum: float, maximum: float) -> float:
+    # lmfit cannot move a parameter starting exactly at a bound, therefore the start value is kept slightly inside
+    margin = 0.01 * (maximum - minimum)
+    return float(np.clip(value, minimum + margin, maximum - margin))
+
+
+def _stderr(param: lmfit.Parameter) -> float:
+    return np.nan if param.stderr is None else param.stderr
 
 
 def optimize_incoherent_container_scattering(sample_pattern, sample_density, sample_composition, container_composition,
                                              r_cutoff, initial_content=10, use_extrapolation=True,
-                                             extrapolation_q_max=None, callback_fcn=None):
+                                             extrapolation_q_max=None, callback_fcn=None, stop_condition=None):
     """
     Finds the amount of extra scattering from a sample container which was not included in the
     background measurement. A typical use-case are diamond anvil cell experiments were the background is usually
@@ -185,6 +810,10 @@ def optimize_incoherent_container_scattering(sample_pattern, sample_density, sam
                                       - sq - S(Q) calculated using the scaled incoherent background
                                       - fr - F(r) calculated using the scaled incoherent background
                                       - gr - g(r) calculated using the scaled incoherent background
+                                The function can return False to stop the optimization.
+    :param stop_condition:      StopCondition for stopping the optimization early (cancellation, wall-clock budget or
+                                maximum number of objective function evaluations), in which case the best content so
+                                far is returned
 
     :return: (tuple) background_content as dimensionless number, scaled incoherent background pattern
     """
@@ -194,13 +823,16 @@ def optimize_incoherent_container_scattering(sample_pattern, sample_density, sam
     params = lmfit.Parameters()
     params.add("content", value=initial_content, min=0)
 
+    if stop_condition is None:
+        stop_condition = StopCondition()
+
     if extrapolation_q_max is None:
         extrapolation_q_max = np.min(q) + 0.2
 
+    sample_composition = as_composition(sample_composition)
     sample_atomic_density = convert_density_to_atoms_per_cubic_angstrom(sample_composition, sample_density)
-    sample_incoherent_scattering = calculate_incoherent_scattering(sample_composition, q)
-    sample_f_mean_squared = calculate_f_mean_squared(sample_composition, q)
-    sample_f_squared_mean = calculate_f_squared_mean(sample_composition, q)
+    _, sample_f_mean_squared, sample_f_squared_mean, sample_incoherent_scattering = \
+        sample_composition.form_factors(q)
 
     def optimization_fcn(params):
         background_content = params['content'].value
@@ -230,25 +862,28 @@ def optimize_incoherent_container_scattering(sample_pattern, sample_density, sam
 
         low_r_gr = gr.limit(0, r_cutoff)
         if callback_fcn is not None:
-            callback_fcn(background_content, incoherent_background_pattern, sq, fr, gr)
+            stop_condition.check_callback_result(
+                callback_fcn(background_content, incoherent_background_pattern, sq, fr, gr))
 
         return low_r_gr.data[1]
 
-    lmfit.minimize(optimization_fcn, params)
-    incoherent_background_pattern.scaling = params['content'].value
+    result = minimize_until_stopped(optimization_fcn, params, stop_condition)
+    incoherent_background_pattern.scaling = result.params['content'].value
 
-    return params['content'].value, incoherent_background_pattern
+    return result.params['content'].value, incoherent_background_pattern
 
 
 def optimize_soller_dac(data_pattern, bkg_pattern, composition, initial_density, initial_bkg_scaling,
                         initial_thickness, sample_thickness, wavelength,
                         initial_carbon_content=1, r_cutoff=2.28, iterations=1,
                         use_modification_fcn=False, vary=(True, True, True),
-                        normalization_method='int', verbose=False):
+                        normalization_method='int', verbose=False, tolerance=None, tolerance_criterion='fr',
+                        stop_condition=None, soller_correction=None):
     """
-    Optimizes density, background scaling and diamond content for a list of sample thickness with a given initial
+    Optimizes density, background scaling and diamond content for a sample thickness with a given initial
     gasket thickness in the diamond anvil cell (DAC). The calculation is done by utilizing the soller slit transfer
-    function and assuming that the DAC has been centered to the rotation center of the soller slit.
+    function and assuming that the DAC has been centered to the rotation center of the soller slit. For a list of
+    sample thicknesses see optimize_soller_dac_sweep(...).
 
     :param data_pattern: original data pattern
     :param bkg_pattern: original background pattern
@@ -267,18 +902,134 @@ def optimize_soller_dac(data_pattern, bkg_pattern, composition, initial_density,
     :param normalization_method: determines the method used for estimating the normalization method. possible values are
                                  'int' for an integral or 'fit' for fitting the high q region form factors.
     :param verbose: boolean flag whether to print out a fit report or not
-    :return:
+    :param tolerance: tolerance for stopping the iterations early (see optimize_sq(...)), in which case iterations is the
+                      maximum number of iterations
+    :param tolerance_criterion: residual used for the tolerance check, 'fr' or 'sq' (see optimize_sq(...))
+    :param stop_condition: StopCondition for stopping the optimization early (cancellation, wall-clock budget or
+                           maximum number of objective function evaluations), in which case the best parameters so far
+                           are returned without standard errors
+    :param soller_correction: SollerCorrection for the two theta values of the data pattern with a max_thickness of at
+                              least initial_thickness, which can be reused for several calls. By default a new one is
+                              created for the initial thickness.
+    :return: (tuple) - chi2, density, density standard error, background scaling, background scaling standard error,
+             diamond content, diamond content standard error
     """
+    check_tolerance_criterion(tolerance_criterion)
 
-    q = data_pattern.extend_to(0, 0).x
+    if soller_correction is None:
+        soller_correction = SollerCorrection(_calculate_two_theta(data_pattern.x, wavelength), initial_thickness)
+    sample_transfer, diamond_transfer = soller_correction.transfer_function_dac(sample_thickness, initial_thickness)
+
+    result = _minimize_soller_dac(data_pattern, bkg_pattern, composition, sample_transfer, diamond_transfer,
+                                  initial_density, initial_bkg_scaling, initial_carbon_content, r_cutoff, iterations,
+                                  use_modification_fcn, vary, normalization_method, tolerance, tolerance_criterion,
+                                  stop_condition)
+
+    if verbose:
+        lmfit.report_fit(result)
+
+    return result.chisqr, \
+        result.params['density'].value, result.params['density'].stderr, \
+        result.params['bkg_scaling'].value, result.params['bkg_scaling'].stderr, \
+        result.params['diamond_content'].value, result.params['diamond_content'].stderr
+
+
+soller_sweep_dtype = np.dtype([('sample_thickness', 'f8'), ('chi2', 'f8'),
+                               ('density', 'f8'), ('density_error', 'f8'),
+                               ('bkg_scaling', 'f8'), ('bkg_scaling_error', 'f8'),
+                               ('diamond_content', 'f8'), ('diamond_content_error', 'f8')])
+
+
+def optimize_soller_dac_sweep(data_pattern, bkg_pattern, composition, initial_density, initial_bkg_scaling,
+                              initial_thickness, sample_thicknesses, wavelength,
+                              initial_carbon_content=1, r_cutoff=2.28, iterations=1,
+                              use_modification_fcn=False, vary=(True, True, True),
+                              normalization_method='int', tolerance=None, tolerance_criterion='fr',
+                              workers=None, use_processes=False):
+    """
+    Runs optimize_soller_dac(...) for a list of sample thicknesses, e.g. to find the sample thickness with the lowest
+    chi2. The dispersion angle map of the soller slit is calculated only once for the largest thickness (the initial
+    gasket thickness) and the optimizations of the different thicknesses are distributed over a pool of threads or
+    processes.
+
+    :param data_pattern: original data pattern
+    :param bkg_pattern: original background pattern
+    :param composition: composition as a dictionary with the elements as keys and the abundances as values
+    :param initial_density: number density starting point for the optimization procedure
+    :param initial_bkg_scaling: background scaling starting point for the optimization procedure
+    :param initial_thickness: gasket thickness with which the background was measured in mm
+    :param sample_thicknesses: list of sample thicknesses in mm, which need to be smaller than the initial thickness
+    :param wavelength: wavelength of the radiation used - needed for calculation of soller slit transfer function in
+                       q-space in Angstrom
+    :param initial_carbon_content: carbon content starting point for the optimization
+    :param r_cutoff: cutoff value below which there is no signal expected (below the first peak in g(r)
+    :param iterations: number of iterations for optimization, described in equations 47-49 in Eggert et al. 2002
+    :param use_modification_fcn: Whether or not to use the Lorch modification function during the Fourier transform.
+    :param vary: 3 boolean flags whether to vary: density, bkg_scaling, carbon_content during the optimization
+    :param normalization_method: determines the method used for estimating the normalization method. possible values are
+                                 'int' for an integral or 'fit' for fitting the high q region form factors.
+    :param tolerance: tolerance for stopping the iterations early (see optimize_sq(...))
+    :param tolerance_criterion: residual used for the tolerance check, 'fr' or 'sq' (see optimize_sq(...))
+    :param workers: maximum number of worker threads or processes, None uses the default of concurrent.futures, 1
+                    optimizes all thicknesses in the calling thread
+    :param use_processes: use a process pool instead of a thread pool
+    :return: structured array with one row per sample thickness and the fields (see soller_sweep_dtype):
+             sample_thickness, chi2, density, density_error, bkg_scaling, bkg_scaling_error, diamond_content,
+             diamond_content_error (errors are nan if not available)
+    """
+    check_tolerance_criterion(tolerance_criterion)
+    sample_thicknesses = np.atleast_1d(np.asarray(sample_thicknesses, dtype=float))
+    composition = as_composition(composition)
+
+    if np.any(sample_thicknesses >= initial_thickness):
+        # there would be no diamond in the diffraction volume, giving an infinite diamond transfer function
+        raise ValueError("The sample thicknesses need to be smaller than the initial thickness ({} mm).".format(
+            initial_thickness))
+
+    soller = SollerCorrection(_calculate_two_theta(data_pattern.x, wavelength), initial_thickness)
+    transfer_functions = [soller.transfer_function_dac(thickness, initial_thickness)
+                          for thickness in sample_thicknesses]
+
+    fit_args = (initial_density, initial_bkg_scaling, initial_carbon_content, r_cutoff, iterations,
+                use_modification_fcn, vary, normalization_method, tolerance, tolerance_criterion)
+
+    def submit_all(submit):
+        return [submit(_minimize_soller_dac, data_pattern, bkg_pattern, composition, sample_transfer,
+                       diamond_transfer, *fit_args) for sample_transfer, diamond_transfer in transfer_functions]
 
-    f_squared_mean = calculate_f_squared_mean(composition, q)
-    f_mean_squared = calculate_f_mean_squared(composition, q)
-    incoherent_scattering = calculate_incoherent_scattering(composition, q)
+    if workers == 1:
+        results = submit_all(lambda fcn, *args: fcn(*args))
+    else:
+        executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+        with executor_class(workers) as executor:
+            results = [future.result() for future in submit_all(executor.submit)]
 
-    tth = 2 * np.arcsin(data_pattern.x * wavelength / (4 * np.pi)) / np.pi * 180
-    soller = SollerCorrection(tth, initial_thickness)
-    sample_transfer, diamond_transfer = soller.transfer_function_dac(sample_thickness, initial_thickness)
+    sweep = np.zeros(len(sample_thicknesses), dtype=soller_sweep_dtype)
+    for ind, (thickness, result) in enumerate(zip(sample_thicknesses, results)):
+        params = result.params
+        sweep[ind] = (thickness, result.chisqr,
+                      params['density'].value, _stderr(params['density']),
+                      params['bkg_scaling'].value, _stderr(params['bkg_scaling']),
+                      params['diamond_content'].value, _stderr(params['diamond_content']))
+    return sweep
+
+
+def _calculate_two_theta(q: np.ndarray, wavelength: float) -> np.ndarray:
+    return 2 * np.arcsin(q * wavelength / (4 * np.pi)) / np.pi * 180
+
+
+_diamond_composition = Composition({'C': 1})
+
+
+def _minimize_soller_dac(data_pattern, bkg_pattern, composition, sample_transfer, diamond_transfer,
+                         initial_density, initial_bkg_scaling, initial_carbon_content, r_cutoff, iterations,
+                         use_modification_fcn, vary, normalization_method, tolerance, tolerance_criterion,
+                         stop_condition=None) -> lmfit.minimizer.MinimizerResult:
+    q = data_pattern.extend_to(0, 0).x
+
+    composition = as_composition(composition)
+    diamond_composition = _diamond_composition
+    _, f_mean_squared, f_squared_mean, incoherent_scattering = composition.form_factors(q)
 
     def optimization_fcn(params):
         diamond_content = params['diamond_content'].value
@@ -289,8 +1040,8 @@ def optimize_soller_dac(data_pattern, bkg_pattern, composition, initial_density,
         _, bkg_int = bkg_pattern.data
 
         diamond_background = diamond_content * Pattern(q,
-                                                       calculate_incoherent_scattering({'C': 1},
-                                                                                       q) / diamond_transfer)
+                                                       diamond_composition.incoherent_scattering(q) /
+                                                       diamond_transfer)
 
         sample_pattern = data_pattern - bkg_scaling * bkg_pattern
         sample_pattern = sample_pattern - diamond_background
@@ -319,9 +1070,11 @@ def optimize_soller_dac(data_pattern, bkg_pattern, composition, initial_density,
         delta_fr = fr_int + 4 * np.pi * r * density
 
         for iteration in range(iterations):
-            in_integral = np.array(np.sin(np.outer(q.T, r))) * delta_fr
+            fr_residual = residual_rms(delta_fr)
+            in_integral = get_sine_kernel(q, r) * delta_fr
             integral = np.trapz(in_integral, r)
-            iq_optimized = iq_int - 1. / q * (iq_int + 1) * integral
+            iq_update = 1. / q * (iq_int + 1) * integral
+            iq_optimized = iq_int - iq_update
 
             iq_pattern = Pattern(q, iq_optimized)
             fr_pattern = calculate_fr(Pattern(q, iq_optimized + 1), r)
@@ -331,21 +1084,16 @@ def optimize_soller_dac(data_pattern, bkg_pattern, composition, initial_density,
 
             delta_fr = fr_int + 4 * np.pi * r * density
 
-        return delta_fr / len(delta_fr)
+            if tolerance is not None:
+                residual = fr_residual if tolerance_criterion == 'fr' else residual_rms(iq_update)
+                if residual < tolerance:
+                    break
 
-    from lmfit import Parameters, minimize, report_fit
+        return delta_fr / len(delta_fr)
 
-    params = Parameters()
+    params = lmfit.Parameters()
     params.add('density', value=initial_density, min=0, vary=vary[0])
     params.add('bkg_scaling', value=initial_bkg_scaling, vary=vary[1])
     params.add('diamond_content', value=initial_carbon_content, min=0, vary=vary[2])
 
-    result = minimize(optimization_fcn, params)
-
-    if verbose:
-        report_fit(result)
-
-    return result.chisqr, \
-        result.params['density'].value, result.params['density'].stderr, \
-        result.params['bkg_scaling'].value, result.params['bkg_scaling'].stderr, \
-        result.params['diamond_content'].value, result.params['diamond_content'].stderr
+    return minimize_until_stopped(optimization_fcn, params, stop_condition)
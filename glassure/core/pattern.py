@@ -1,11 +1,15 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 import os
+from itertools import count
 
 import numpy as np
 from scipy.interpolate import interp1d
 from scipy.ndimage import gaussian_filter1d
 
+# every change of a data relevant attribute of a Pattern gets a new unique id from this counter
+_modification_ids = count()
+
 
 class Pattern(object):
     """
@@ -19,10 +23,14 @@ class Pattern(object):
     :param name: name of the pattern
     """
 
+    # attributes which affect the result of the data property, changing them invalidates the cached data
+    _data_attributes = frozenset(('_x', '_y', '_scaling', 'offset', 'smoothing', 'bkg_pattern'))
+
     def __init__(self, x: np.ndarray = None, y: np.ndarray = None, name: str = ''):
         """
         Creates a new Pattern object, x and y should have the same shape.
         """
+        self._data_cache = None
         if x is None:
             self._x = np.linspace(0.1, 15, 100)
         else:
@@ -37,6 +45,22 @@ class Pattern(object):
         self.smoothing = 0.0
         self.bkg_pattern = None
 
+    def __setattr__(self, name, value):
+        if name in Pattern._data_attributes:
+            object.__setattr__(self, '_modification_id', next(_modification_ids))
+        object.__setattr__(self, name, value)
+
+    @property
+    def state(self) -> tuple:
+        """
+        Returns a hashable state of the pattern, which changes whenever the pattern or its background pattern
+        (recursively) is modified. Equal states mean that the data of the pattern is unchanged, so it can be used as
+        a key for caching results calculated from the pattern.
+        """
+        if self.bkg_pattern is None:
+            return self._modification_id, None
+        return self._modification_id, self.bkg_pattern.state
+
     def load(self, filename: str, skiprows: int = 0):
         """
         Loads a pattern from a file. The file can be either a .xy or a .chi file. The .chi file will be loaded with
@@ -136,6 +160,21 @@ class Pattern(object):
         Returns the data of the pattern. If a background pattern is set, the background will be subtracted from the
         pattern. If smoothing is set, the pattern will be smoothed.
 
+        The result is cached and only recalculated when x, y, scaling, offset, smoothing or the background pattern
+        change. In-place modifications of the x or y arrays are not detected, the arrays should be reassigned instead.
+        The returned arrays should not be modified in-place.
+
+        :return: Tuple of x and y values
+        """
+        state = self.state
+        if self._data_cache is None or self._data_cache[0] != state:
+            self._data_cache = (state, self._calculate_data())
+        return self._data_cache[1]
+
+    def _calculate_data(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Calculates the background subtracted and smoothed data of the pattern.
+
         :return: Tuple of x and y values
         """
         if self.bkg_pattern is not None:
@@ -402,6 +441,173 @@ class Pattern(object):
         return False
 
 
+class PatternStack(object):
+    """
+    A PatternStack is a series of patterns which share the same x values, e.g. a pressure or temperature series
+    measured on the same detector geometry. The y values are stored in a 2-dimensional array with the shape
+    (n_patterns, n_points), which allows the functions in calc and utility to process the whole series in one
+    vectorized pass instead of looping over single Patterns.
+
+    :param x: x values shared by all patterns
+    :param y: y values of the patterns with shape (n_patterns, n_points)
+    :param names: names of the patterns
+    """
+
+    def __init__(self, x: np.ndarray, y: np.ndarray, names: list[str] = None):
+        """
+        Creates a new PatternStack object, the last dimension of y should have the same length as x.
+        """
+        x = np.asarray(x)
+        y = np.atleast_2d(y)
+        if y.ndim != 2 or y.shape[1] != len(x):
+            raise ValueError('y needs to have the shape (n_patterns, {}), got {}'.format(len(x), y.shape))
+        self._x = x
+        self._y = y
+        if names is None:
+            names = [''] * len(y)
+        self.names = list(names)
+
+    @staticmethod
+    def from_patterns(patterns: list[Pattern]) -> PatternStack:
+        """
+        Creates a new PatternStack from a list of Patterns. The data (background subtracted and smoothed) of the
+        patterns will be used and all patterns need to have the same x values.
+
+        :param patterns: list of Patterns
+        :return: new PatternStack
+        """
+        x = patterns[0].data[0]
+        y = np.empty((len(patterns), len(x)))
+        for ind, pattern in enumerate(patterns):
+            pattern_x, pattern_y = pattern.data
+            if not np.array_equal(pattern_x, x):
+                raise ValueError('All patterns of a PatternStack need to have the same x values. ({})'.format(
+                    pattern.name))
+            y[ind] = pattern_y
+        return PatternStack(x, y, [pattern.name for pattern in patterns])
+
+    @staticmethod
+    def from_files(filenames: list[str], skip_rows: int = 0) -> PatternStack:
+        """
+        Loads a PatternStack from a list of files. All files need to have the same x values.
+
+        :param filenames: list of paths to the files
+        :param skip_rows: number of rows to skip when loading the data (header)
+        :return: new PatternStack
+        """
+        return PatternStack.from_patterns([Pattern.from_file(filename, skip_rows) for filename in filenames])
+
+    def to_patterns(self) -> list[Pattern]:
+        """
+        Returns a list of single Patterns, one for each pattern in the stack.
+        """
+        return [self[ind] for ind in range(len(self))]
+
+    @property
+    def data(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the data of the pattern stack.
+
+        :return: Tuple of x values with shape (n_points,) and y values with shape (n_patterns, n_points)
+        """
+        return self._x, self._y
+
+    @property
+    def x(self) -> np.ndarray:
+        """ Returns the x values of the pattern stack """
+        return self._x
+
+    @property
+    def y(self) -> np.ndarray:
+        """ Returns the y values of the pattern stack with shape (n_patterns, n_points) """
+        return self._y
+
+    @y.setter
+    def y(self, new_y: np.ndarray):
+        """ Sets the y values of the pattern stack """
+        self._y = np.atleast_2d(new_y)
+
+    def limit(self, x_min: float, x_max: float) -> PatternStack:
+        """
+        Limits the pattern stack to a specific x-range. Does not modify inplace but returns a new limited PatternStack
+
+        :param x_min: lower limit of the x-range
+        :param x_max: upper limit of the x-range
+        :return: limited PatternStack
+        """
+        ind = (x_min < self._x) & (self._x < x_max)
+        return PatternStack(self._x[ind], self._y[:, ind], self.names)
+
+    def extend_to(self, x_value: float, y_value: float) -> PatternStack:
+        """
+        Extends all patterns to a specific x_value by filling them with the y_value. Does not modify inplace but
+        returns a new filled PatternStack
+
+        :param x_value: Point to which extending the patterns should be smaller than the lowest x-value or vice versa
+        :param y_value: number to fill the patterns with
+        :return: extended PatternStack
+        """
+        x_step = np.mean(np.diff(self._x))
+        x_min = np.min(self._x)
+        x_max = np.max(self._x)
+        if x_value < x_min:
+            x_fill = np.arange(x_min - x_step, x_value - x_step * 0.5, -x_step)[::-1]
+            y_fill = np.full((len(self), len(x_fill)), y_value, dtype=float)
+            return PatternStack(np.concatenate((x_fill, self._x)), np.hstack((y_fill, self._y)), self.names)
+        elif x_value > x_max:
+            x_fill = np.arange(x_max + x_step, x_value + x_step * 0.5, x_step)
+            y_fill = np.full((len(self), len(x_fill)), y_value, dtype=float)
+            return PatternStack(np.concatenate((self._x, x_fill)), np.hstack((self._y, y_fill)), self.names)
+        return self
+
+    def __len__(self) -> int:
+        return len(self._y)
+
+    def __getitem__(self, ind: int) -> Pattern:
+        """
+        Returns the pattern at the given index as a single Pattern.
+        """
+        return Pattern(self._x, self._y[ind], self.names[ind])
+
+    def __iter__(self):
+        return iter(self.to_patterns())
+
+    def __sub__(self, other: Pattern | PatternStack) -> PatternStack:
+        """
+        Subtracts a Pattern (e.g. a common background) or a PatternStack with the same length from all patterns. A
+        Pattern with different x values will be interpolated onto the overlapping x values of the stack.
+
+        :param other: Pattern or PatternStack to be subtracted
+        :return: new PatternStack
+        """
+        other_x, other_y = other.data
+        if np.array_equal(other_x, self._x):
+            return PatternStack(self._x, self._y - other_y, self.names)
+        if isinstance(other, PatternStack):
+            raise ValueError('PatternStacks need to have the same x values for subtraction.')
+
+        ind = (self._x <= np.max(other_x)) & (self._x >= np.min(other_x))
+        x = self._x[ind]
+        if len(x) == 0:
+            raise BkgNotInRangeError('PatternStack')
+        return PatternStack(x, self._y[:, ind] - interp1d(other_x, other_y, kind='linear')(x), self.names)
+
+
+def create_pattern_like(pattern: Pattern | PatternStack, x: np.ndarray, y: np.ndarray) -> Pattern | PatternStack:
+    """
+    Creates a new Pattern or PatternStack, depending on the type of the given pattern. This is used by functions
+    which accept both, single patterns and pattern stacks, to return a result of the same type.
+
+    :param pattern: Pattern or PatternStack which determines the type of the result
+    :param x: x values of the new pattern
+    :param y: y values of the new pattern
+    :return: new Pattern or PatternStack
+    """
+    if isinstance(pattern, PatternStack):
+        return PatternStack(x, y, pattern.names)
+    return Pattern(x, y)
+
+
 class BkgNotInRangeError(Exception):
     def __init__(self, pattern_name: str):
         self.pattern_name = pattern_name
@@ -2,17 +2,43 @@
 import os
 import re
 from abc import ABC, abstractmethod
+from functools import cached_property, lru_cache
 
 import numpy as np
-import scipy
-import pandas
+from scipy.interpolate import BSpline
 from . import _module_path
 
 module_data_path = os.path.join(_module_path(), 'data')
 
-atomic_weights = pandas.read_csv(os.path.join(
-    module_data_path, 'atomic_weights.csv'),
-    index_col=0)
+
+def _load_table(filename: str, name: str) -> np.ndarray:
+    """
+    Loads a table saved as NumPy structured array from an .npz file in the data folder. The .npz files are created
+    from the csv tables by data/create_binary_tables.py.
+
+    :param filename: path of the .npz file relative to the data folder
+    :param name: name of the table in the .npz file
+    :return: structured array, the column names are the field names
+    """
+    with np.load(os.path.join(module_data_path, filename)) as data:
+        return data[name]
+
+
+def _stack_columns(table: np.ndarray, names: list[str]) -> np.ndarray:
+    """
+    Returns the given columns of a structured array as 2-dimensional float array with the shape (len(table), len(names))
+    """
+    return np.stack([table[name] for name in names], axis=1).astype(float)
+
+
+@lru_cache(maxsize=None)
+def get_atomic_weights() -> dict[str, float]:
+    """
+    Returns a dictionary with the element symbols as keys and the atomic weights in g/mol as values. The table is
+    loaded on first use.
+    """
+    table = _load_table('atomic_weights.npz', 'atomic_weights')
+    return dict(zip(table['Element'].tolist(), table['AW'].tolist()))
 
 
 class ScatteringFactorCalculator(ABC):
@@ -28,23 +54,89 @@ class ScatteringFactorCalculator(ABC):
     def get_incoherent_intensity(self, element: str, q):
         raise NotImplementedError
 
+    @abstractmethod
+    def get_coherent_scattering_factors(self, elements: list[str], q) -> np.ndarray:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_incoherent_intensities(self, elements: list[str], q,
+                                   coherent_scattering_factors: np.ndarray = None) -> np.ndarray:
+        raise NotImplementedError
+
     @property
     def elements(self):
         raise NotImplementedError
 
+    def calculate_form_factors(self, composition: dict[str, float], q) \
+            -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Calculates the form factors of all elements of a composition at once and the composition averages derived
+        from them.
+
+        :param composition: dictionary with elements as key and abundances as relative numbers
+        :param q: q array in A^-1
+        :return: tuple of
+                    - coherent scattering factors f with the shape (n_elements, len(q)), ordered as the composition
+                    - square of the mean form factor <f>^2
+                    - mean of the squared form factors <f^2>
+                    - mean incoherent scattering intensity
+        """
+        elements = list(composition.keys())
+        abundances = _normalized_abundances(composition, np.ndim(q))
+
+        f = self.get_coherent_scattering_factors(elements, q)
+        incoherent = self.get_incoherent_intensities(elements, q, f)
+
+        f_mean_squared = np.sum(abundances * f, axis=0) ** 2
+        f_squared_mean = np.sum(abundances * f ** 2, axis=0)
+        incoherent_mean = np.sum(abundances * incoherent, axis=0)
+        return f, f_mean_squared, f_squared_mean, incoherent_mean
+
 
 class ScatteringFactorCalculatorHajdu(ScatteringFactorCalculator):
     """
     Scattering factor calculator based on the work of Hajdu et al. (Acta Cryst. (1992). A48, 344-352).
     """
 
-    def __init__(self):
-        self.coherent_param = pandas.read_csv(
-            os.path.join(module_data_path, 'hajdu', 'param_coherent_scattering_factors.csv'),
-            index_col=0)
-        self.incoherent_param = pandas.read_csv(
-            os.path.join(module_data_path, 'hajdu', 'param_incoherent_scattering_intensities.csv'),
-            index_col=0)
+    @cached_property
+    def coherent_param(self) -> np.ndarray:
+        """
+        Parameters of the coherent scattering factors as structured array with the columns Element, Z, A1-A4, B1-B4,
+        C and EPS1. The table is loaded on first use.
+        """
+        return _load_table(os.path.join('hajdu', 'scattering_factors.npz'), 'coherent')
+
+    @cached_property
+    def incoherent_param(self) -> np.ndarray:
+        """
+        Parameters of the incoherent scattering intensities as structured array with the columns Element, Z, M, K, L,
+        EPS2 and SIGMA. The table is loaded on first use.
+        """
+        return _load_table(os.path.join('hajdu', 'scattering_factors.npz'), 'incoherent')
+
+    @cached_property
+    def _coherent_a(self) -> np.ndarray:
+        return _stack_columns(self.coherent_param, ['A1', 'A2', 'A3', 'A4'])
+
+    @cached_property
+    def _coherent_b(self) -> np.ndarray:
+        return _stack_columns(self.coherent_param, ['B1', 'B2', 'B3', 'B4'])
+
+    @cached_property
+    def _coherent_c(self) -> np.ndarray:
+        return self.coherent_param['C'].astype(float)
+
+    @cached_property
+    def _coherent_index(self) -> dict[str, int]:
+        return {element: ind for ind, element in enumerate(self.coherent_param['Element'].tolist())}
+
+    @cached_property
+    def _incoherent_zmkl(self) -> np.ndarray:
+        return _stack_columns(self.incoherent_param, ['Z', 'M', 'K', 'L'])
+
+    @cached_property
+    def _incoherent_index(self) -> dict[str, int]:
+        return {element: ind for ind, element in enumerate(self.incoherent_param['Element'].tolist())}
 
     def get_coherent_scattering_factor(self, element: str, q):
         """
@@ -54,18 +146,18 @@ class ScatteringFactorCalculatorHajdu(ScatteringFactorCalculator):
         :param q: q array
         :return: coherent scattering factor array
         """
-        if element not in self.coherent_param.index.values:
-            raise ElementNotImplementedException(element)
-        fs_coh = 0
-        s = q / (4 * np.pi)
-        for ind in range(1, 5):
-            A = self.coherent_param['A' + str(ind)][element]
-            B = self.coherent_param['B' + str(ind)][element]
-            fs_coh += A * np.exp(-B * s ** 2)
+        return self.get_coherent_scattering_factors([element], q)[0]
 
-        C = self.coherent_param['C'][element]
-        fs_coh += C
-        return fs_coh
+    def get_coherent_scattering_factors(self, elements: list[str], q) -> np.ndarray:
+        """
+        Calculates the coherent scattering factors for several elements at once.
+
+        :param elements: list of element symbols
+        :param q: q array
+        :return: coherent scattering factor array with the shape (len(elements), len(q))
+        """
+        ind = _get_indices(self._coherent_index, elements)
+        return _calculate_gaussian_form_factors(self._coherent_a[ind], self._coherent_b[ind], self._coherent_c[ind], q)
 
     def get_incoherent_intensity(self, element: str, q):
         """
@@ -75,22 +167,34 @@ class ScatteringFactorCalculatorHajdu(ScatteringFactorCalculator):
         :param q: q array
         :return: incoherent scattering intensity array
         """
-        fs_coherent = self.get_coherent_scattering_factor(element, q)
-        intensity_coherent = fs_coherent ** 2
-        s = q / (4 * np.pi)
-        Z = float(self.incoherent_param['Z'][element])
-        M = float(self.incoherent_param['M'][element])
-        K = float(self.incoherent_param['K'][element])
-        L = float(self.incoherent_param['L'][element])
-        intensity_incoherent = (Z - intensity_coherent / Z) * (1 - M * (np.exp(-K * s) - np.exp(-L * s)))
-        return intensity_incoherent
+        return self.get_incoherent_intensities([element], q)[0]
+
+    def get_incoherent_intensities(self, elements: list[str], q,
+                                   coherent_scattering_factors: np.ndarray = None) -> np.ndarray:
+        """
+        Calculates the incoherent scattering intensities for several elements at once.
+
+        :param elements: list of element symbols
+        :param q: q array
+        :param coherent_scattering_factors: already calculated coherent scattering factors of the elements for q, they
+                                            are calculated if not given
+        :return: incoherent scattering intensity array with the shape (len(elements), len(q))
+        """
+        ind = _get_indices(self._incoherent_index, elements)
+        if coherent_scattering_factors is None:
+            coherent_scattering_factors = self.get_coherent_scattering_factors(elements, q)
+        intensity_coherent = coherent_scattering_factors ** 2
+        s = np.asarray(q, dtype=float) / (4 * np.pi)
+
+        Z, M, K, L = (param.reshape((-1,) + (1,) * s.ndim) for param in self._incoherent_zmkl[ind].T)
+        return (Z - intensity_coherent / Z) * (1 - M * (np.exp(-K * s) - np.exp(-L * s)))
 
     @property
     def elements(self):
         """
         Returns a list of available elements.
         """
-        return self.coherent_param.index.values
+        return self.coherent_param['Element']
 
 
 class ScatteringFactorCalculatorBrownHubbell(ScatteringFactorCalculator):
@@ -98,13 +202,45 @@ class ScatteringFactorCalculatorBrownHubbell(ScatteringFactorCalculator):
     Scattering factor calculator based on the work of Brown et al., 2006 and Hubbell et al., 1975.
     """
 
-    def __init__(self):
-        self.coherent_params = pandas.read_csv(
-            os.path.join(module_data_path, 'brown_hubbell', 'param_coherent_scattering_factors.csv'),
-            index_col=0)
+    @cached_property
+    def coherent_params(self) -> np.ndarray:
+        """
+        Parameters of the coherent scattering factors as structured array with the columns Element, a1-a4, b1-b4 and
+        c. The table is loaded on first use.
+        """
+        return _load_table(os.path.join('brown_hubbell', 'scattering_factors.npz'), 'coherent')
+
+    @cached_property
+    def incoherent_intensities(self) -> np.ndarray:
+        """
+        Tabulated incoherent scattering intensities as structured array with the column q and one column per element.
+        The table is loaded on first use.
+        """
+        return _load_table(os.path.join('brown_hubbell', 'scattering_factors.npz'), 'incoherent')
+
+    @cached_property
+    def _incoherent_spline_knots(self) -> np.ndarray:
+        return _load_table(os.path.join('brown_hubbell', 'scattering_factors.npz'), 'incoherent_spline_knots')
+
+    @cached_property
+    def _incoherent_spline_coefficients(self) -> np.ndarray:
+        return _load_table(os.path.join('brown_hubbell', 'scattering_factors.npz'), 'incoherent_spline_coefficients')
+
+    @cached_property
+    def _coherent_a(self) -> np.ndarray:
+        return _stack_columns(self.coherent_params, ['a1', 'a2', 'a3', 'a4'])
+
+    @cached_property
+    def _coherent_b(self) -> np.ndarray:
+        return _stack_columns(self.coherent_params, ['b1', 'b2', 'b3', 'b4'])
 
-        self.incoherent_intensities = pandas.read_csv(
-            os.path.join(module_data_path, 'brown_hubbell', 'incoherent_scattering_intensities.csv'))
+    @cached_property
+    def _coherent_c(self) -> np.ndarray:
+        return self.coherent_params['c'].astype(float)
+
+    @cached_property
+    def _coherent_index(self) -> dict[str, int]:
+        return {element: ind for ind, element in enumerate(self.coherent_params['Element'].tolist())}
 
     def get_coherent_scattering_factor(self, element: str, q):
         """
@@ -114,18 +250,18 @@ class ScatteringFactorCalculatorBrownHubbell(ScatteringFactorCalculator):
         :param q: q array
         :return: coherent scattering factor array
         """
-        if element not in self.coherent_params.index.values:
-            raise ElementNotImplementedException(element)
-        fs_coh = 0
-        s = q / (4 * np.pi)
-        for ind in range(1, 5):
-            A = self.coherent_params['a' + str(ind)][element]
-            B = self.coherent_params['b' + str(ind)][element]
-            fs_coh += A * np.exp(-B * s ** 2)
+        return self.get_coherent_scattering_factors([element], q)[0]
+
+    def get_coherent_scattering_factors(self, elements: list[str], q) -> np.ndarray:
+        """
+        Calculates the coherent scattering factors for several elements at once.
 
-        C = self.coherent_params['c'][element]
-        fs_coh += C
-        return fs_coh
+        :param elements: list of element symbols
+        :param q: q array
+        :return: coherent scattering factor array with the shape (len(elements), len(q))
+        """
+        ind = _get_indices(self._coherent_index, elements)
+        return _calculate_gaussian_form_factors(self._coherent_a[ind], self._coherent_b[ind], self._coherent_c[ind], q)
 
     def get_incoherent_intensity(self, element: str, q):
         """
@@ -135,20 +271,77 @@ class ScatteringFactorCalculatorBrownHubbell(ScatteringFactorCalculator):
         :param q: q array
         :return: incoherent scattering intensity array
         """
+        return self.get_incoherent_intensities([element], q)[0]
+
+    def get_incoherent_intensities(self, elements: list[str], q,
+                                   coherent_scattering_factors: np.ndarray = None) -> np.ndarray:
+        """
+        Calculates the incoherent scattering intensities for several elements at once by cubic interpolation of the
+        tabulated values. The splines are precomputed and saved with the tables, so that only the spline evaluation
+        is needed.
+
+        :param elements: list of element symbols, charges of ions are ignored
+        :param q: q array
+        :param coherent_scattering_factors: not needed for this calculator, only for compatibility
+        :return: incoherent scattering intensity array with the shape (len(elements), len(q))
+        """
         # use regular expression to find element string of input
-        element = re.findall('[A-zA-Z]*', element)[0]
-        if element not in self.incoherent_intensities.keys():
-            raise ElementNotImplementedException(element)
-        interp = scipy.interpolate.interp1d(self.incoherent_intensities['q'], self.incoherent_intensities[element],
-                                            kind='cubic')
-        return interp(q)
+        elements = [re.findall('[A-zA-Z]*', element)[0] for element in elements]
+        coefficients = self._incoherent_spline_coefficients
+        for element in elements:
+            if element not in coefficients.dtype.names:
+                raise ElementNotImplementedException(element)
+
+        knots = self._incoherent_spline_knots
+        q = np.asarray(q, dtype=float)
+        if np.any(q < knots[0]) or np.any(q > knots[-1]):
+            raise ValueError("q values need to be within {} and {} A^-1 for the incoherent scattering intensities "
+                             "of the brown_hubbell source.".format(knots[0], knots[-1]))
+        spline = BSpline(knots, _stack_columns(coefficients, elements), 3, extrapolate=False)
+        return np.moveaxis(spline(q), -1, 0)
 
     @property
     def elements(self):
         """
         Returns a list of available elements.
         """
-        return self.coherent_params.index.values
+        return self.coherent_params['Element']
+
+
+def _get_indices(index: dict[str, int], elements: list[str]) -> np.ndarray:
+    """
+    Returns the row indices of the elements in a parameter table.
+    """
+    try:
+        return np.array([index[element] for element in elements], dtype=int)
+    except KeyError as e:
+        raise ElementNotImplementedException(e.args[0])
+
+
+def _calculate_gaussian_form_factors(a: np.ndarray, b: np.ndarray, c: np.ndarray, q) -> np.ndarray:
+    """
+    Evaluates the form factors f(s) = sum_i a_i * exp(-b_i * s^2) + c with s = q / (4 * pi) for several elements in one
+    broadcasted (n_elements, 4, n_q) expression.
+
+    :param a: array of the Gaussian amplitudes with the shape (n_elements, 4)
+    :param b: array of the Gaussian widths with the shape (n_elements, 4)
+    :param c: array of the constants with the shape (n_elements,)
+    :param q: q array
+    :return: form factor array with the shape (n_elements, len(q))
+    """
+    s_squared = (np.asarray(q, dtype=float) / (4 * np.pi)) ** 2
+    new_axes = (np.newaxis,) * s_squared.ndim
+    gaussians = a[(...,) + new_axes] * np.exp(-b[(...,) + new_axes] * s_squared)
+    return np.sum(gaussians, axis=1) + c[(...,) + new_axes]
+
+
+def _normalized_abundances(composition: dict[str, float], q_ndim: int = 1) -> np.ndarray:
+    """
+    Returns the abundances of a composition normalized to 1 with trailing axes for q, to be broadcasted with
+    (n_elements, n_q) arrays.
+    """
+    abundances = np.array(list(composition.values()), dtype=float)
+    return (abundances / sum(composition.values())).reshape((-1,) + (1,) * q_ndim)
 
 
 calculators = {
@@ -187,6 +380,20 @@ def calculate_coherent_scattering_factor(element: str, q: np.array, source: str
     return get_calculator(source).get_coherent_scattering_factor(element, q)
 
 
+def calculate_form_factors(composition: dict[str, float], q: np.array, source: str = 'hajdu') \
+        -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Calculates the coherent scattering factors of all elements of a composition, the square of the mean form factor
+    <f>^2, the mean of the squared form factors <f^2> and the mean incoherent scattering intensity together.
+
+    :param composition: dictionary with elements as key and abundances as relative numbers
+    :param q: q array in A^-1
+    :param source: Source of the scattering factors. Possible sources are 'hajdu' and 'brown_hubbell'.
+    :return: tuple of (f with the shape (n_elements, len(q)), <f>^2, <f^2>, incoherent intensity)
+    """
+    return get_calculator(source).calculate_form_factors(composition, q)
+
+
 def calculate_incoherent_scattered_intensity(element: str, q: np.array, source: str = 'hajdu') -> np.array:
     """
     Calculates the incoherent scattering intensity for a given element and q values.
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+from collections import OrderedDict
+from threading import Lock
+
+import numpy as np
+
+__all__ = ['SineKernelCache', 'sine_kernel_cache', 'get_sine_kernel', 'sine_transform_integral',
+           'trapezoid_weights']
+
+
+class SineKernelCache(object):
+    """
+    Least recently used cache for the sine kernels sin(q*r) used by the integral Fourier transforms between S(Q)
+    and F(r). The q and r grids usually do not change during an optimization, therefore the expensive evaluation of
+    the kernel only needs to be done once per grid.
+
+    The kernels are stored read-only with the shape (len(q), len(r)). The least recently used kernels are evicted
+    when the memory used by all cached kernels exceeds max_memory. Kernels which are larger than max_memory are not
+    cached at all.
+
+    :param max_memory: maximum memory in bytes used by the cached kernels
+    """
+
+    def __init__(self, max_memory: int = 512 * 1024 ** 2):
+        self.max_memory = max_memory
+        self._kernels = OrderedDict()
+        self._memory = 0
+        self._lock = Lock()
+
+    def get(self, q: np.ndarray, r: np.ndarray, use_modification_fcn: bool = False) -> np.ndarray:
+        """
+        Returns the sine kernel sin(q*r) for the given grids. If use_modification_fcn is True, the kernel is
+        multiplied with the Lorch modification function m(q) = sin(q*pi/q_max)/(q*pi/q_max).
+
+        :param q: q values in A^-1
+        :param r: r values in A
+        :param use_modification_fcn: whether to include the Lorch modification function in the kernel
+        :return: read-only kernel array with the shape (len(q), len(r))
+        """
+        q = np.asarray(q, dtype=float)
+        r = np.asarray(r, dtype=float)
+        key = (_grid_key(q), _grid_key(r), use_modification_fcn)
+
+        with self._lock:
+            kernel = self._kernels.get(key)
+            if kernel is not None:
+                self._kernels.move_to_end(key)
+                return kernel
+
+        kernel = np.sin(np.outer(q, r))
+        if use_modification_fcn:
+            kernel *= (np.sin(q * np.pi / np.max(q)) / (q * np.pi / np.max(q)))[:, np.newaxis]
+        kernel.flags.writeable = False
+
+        with self._lock:
+            if kernel.nbytes <= self.max_memory and key not in self._kernels:
+                self._kernels[key] = kernel
+                self._memory += kernel.nbytes
+                while self._memory > self.max_memory:
+                    _, evicted_kernel = self._kernels.popitem(last=False)
+                    self._memory -= evicted_kernel.nbytes
+        return kernel
+
+    def clear(self):
+        """
+        Removes all kernels from the cache.
+        """
+        with self._lock:
+            self._kernels.clear()
+            self._memory = 0
+
+    @property
+    def memory(self) -> int:
+        """
+        Returns the memory in bytes currently used by the cached kernels.
+        """
+        return self._memory
+
+    def __len__(self) -> int:
+        return len(self._kernels)
+
+
+def _grid_key(values: np.ndarray) -> tuple:
+    """
+    Creates a hashable key for a grid. Uses the shape, start and step of the grid and a hash of the values, so that
+    non-uniform grids are distinguished as well.
+    """
+    if len(values) < 2:
+        return values.shape, values.tobytes()
+    return values.shape, float(values[0]), float(values[1] - values[0]), hash(values.tobytes())
+
+
+sine_kernel_cache = SineKernelCache()
+
+
+def get_sine_kernel(q: np.ndarray, r: np.ndarray, use_modification_fcn: bool = False) -> np.ndarray:
+    """
+    Returns the sine kernel sin(q*r) with the shape (len(q), len(r)) from the global sine_kernel_cache. The returned
+    array is read-only.
+
+    :param q: q values in A^-1
+    :param r: r values in A
+    :param use_modification_fcn: whether to include the Lorch modification function in the kernel
+    :return: sine kernel array
+    """
+    return sine_kernel_cache.get(q, r, use_modification_fcn)
+
+
+def trapezoid_weights(x: np.ndarray) -> np.ndarray:
+    """
+    Calculates the weights of the trapezoidal rule for the (not necessarily uniform) grid x, such that
+    np.trapz(y, x) == np.dot(trapezoid_weights(x), y).
+
+    :param x: sampling points
+    :return: quadrature weights with the same shape as x
+    """
+    dx = np.diff(x)
+    weights = np.zeros(len(x))
+    weights[:-1] += 0.5 * dx
+    weights[1:] += 0.5 * dx
+    return weights
+
+
+def sine_transform_integral(x: np.ndarray, y: np.ndarray, k: np.ndarray, max_memory: int = None) -> np.ndarray:
+    """
+    Calculates the integral of y(x) * sin(k * x) over x with the trapezoidal rule for all values in k. The quadrature
+    weights are folded into y, so that the integral is a matrix-vector product with the sine kernel.
+
+    If the sine kernel for the full grids needs more than max_memory bytes, the integral is evaluated in blocks of k
+    values with kernels of at most max_memory bytes, which are not cached. Otherwise the kernel is taken from the
+    global sine_kernel_cache.
+
+    :param x: integration variable (e.g. q), 1-dimensional
+    :param y: values to be transformed, the last axis corresponds to x (e.g. a 2-dimensional PatternStack y)
+    :param k: values for which the transform is calculated (e.g. r)
+    :param max_memory: maximum memory in bytes for the sine kernel, defaults to the max_memory of the
+                       sine_kernel_cache
+    :return: transformed values with the shape y.shape[:-1] + (len(k),)
+    """
+    if max_memory is None:
+        max_memory = sine_kernel_cache.max_memory
+    weighted_y = y * trapezoid_weights(x)
+
+    block_size = max(1, int(max_memory // (8 * len(x))))
+    if block_size >= len(k):
+        return np.dot(weighted_y, get_sine_kernel(x, k))
+
+    result = np.empty(np.shape(weighted_y)[:-1] + (len(k),))
+    for start in range(0, len(k), block_size):
+        kernel = np.sin(np.outer(x, k[start:start + block_size]))
+        result[..., start:start + block_size] = np.dot(weighted_y, kernel)
+    return result
@@ -1,14 +1,80 @@
 # -*- coding: utf-8 -*-
 
+import os
+import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 
+# version of the dispersion angle map calculation, part of the cache key, needs to be increased whenever the
+# calculation changes, so that maps of a previous version are not loaded from the cache anymore
+_CACHE_VERSION = 1
+
+# default maximum total size of the dispersion angle map cache in bytes, the least recently used tables are deleted when
+# the cache grows larger
+DEFAULT_MAX_CACHE_SIZE = 512 * 1024 ** 2
+
+
+def default_cache_dir():
+    """
+    Returns the default directory of the dispersion angle map cache, which is the GLASSURE_CACHE_DIR environment
+    variable or ~/.glassure/cache.
+    """
+    return os.environ.get('GLASSURE_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.glassure', 'cache'))
+
+
+def limit_cache_size(cache_dir, max_size=DEFAULT_MAX_CACHE_SIZE):
+    """
+    Deletes the least recently used lookup tables from the dispersion angle map cache until its total size is at most
+    max_size bytes. The most recently used table is always kept, even if it is larger than max_size. Files which cannot
+    be read or deleted (e.g. because they are used by another process) are skipped.
+
+    :param cache_dir: directory of the cache
+    :param max_size: maximum total size of the cached files in bytes
+    """
+    tables = {}
+    try:
+        filenames = os.listdir(cache_dir)
+    except OSError:
+        return
+    for filename in filenames:
+        if not (filename.startswith('soller_') and filename.endswith('.npy')):
+            continue
+        name = filename.rsplit('_', 1)[0]
+        try:
+            stat = os.stat(os.path.join(cache_dir, filename))
+        except OSError:
+            continue
+        size, last_used, table_filenames = tables.get(name, (0, 0, []))
+        tables[name] = (size + stat.st_size, max(last_used, stat.st_mtime), table_filenames + [filename])
+
+    tables = sorted(tables.values(), key=lambda table: table[1], reverse=True)
+    total_size = sum(table[0] for table in tables)
+    for size, _, table_filenames in tables[1:][::-1]:
+        if total_size <= max_size:
+            break
+        for filename in table_filenames:
+            try:
+                os.remove(os.path.join(cache_dir, filename))
+            except OSError:
+                pass
+        total_size -= size
+
 
 class SollerCorrection(object):
+    # default number of elements of the intermediate arrays when calculating the dispersion angle map in chunks, small
+    # enough for the arrays to stay in the CPU cache
+    max_chunk_elements = 2 ** 16
+
     def __init__(self, two_theta, max_thickness, inner_radius=62, outer_radius=210,
-                 inner_width=0.05, outer_width=0.2, inner_length=8, outer_length=6):
+                 inner_width=0.05, outer_width=0.2, inner_length=8, outer_length=6, chunk_size=None, workers=1,
+                 dtype=np.float64, cache_dir=None, max_cache_size=DEFAULT_MAX_CACHE_SIZE):
         """
         This class handles the calculation of the intensity correction when using soller slits. Upon initialization it
         creates a lookup table for the dispersion angles for each two theta angle and thickness of the sample.
+        Additionally, the cumulative sum of the lookup table along the distance axis is stored, so that the sum over
+        any sample region only needs two rows of the cumulative sum.
 
         Corrections are then calculated
 
@@ -20,6 +86,17 @@ class SollerCorrection(object):
         :param outer_width: width of the outer slits (in mm)
         :param inner_length: length of the slit blades (in mm)
         :param outer_length: length of the slit blades (in mm)
+        :param chunk_size: number of two theta values calculated at once for the lookup table (see
+                           calculate_dispersion_angle_map)
+        :param workers: number of threads used for calculating the lookup table
+        :param dtype: data type of the lookup table and its cumulative sum, np.float32 halves the memory needed (the
+                      transfer functions are still calculated in double precision from the stored values)
+        :param cache_dir: directory of a disk cache for the lookup table (e.g. default_cache_dir()), None disables the
+                          cache. The cached tables are identified by the slit geometry, the maximum thickness, the two
+                          theta values and the dtype and are loaded memory-mapped (read-only), so that they can be
+                          shared by several processes.
+        :param max_cache_size: maximum total size of the cache directory in bytes, the least recently used tables are
+                               deleted after a new table has been saved (see limit_cache_size)
         """
 
         self._two_theta = two_theta / 180. * np.pi
@@ -31,138 +108,307 @@ class SollerCorrection(object):
         self._inner_length = inner_length
         self._outer_length = outer_length
 
-        self.dispersion_angle_map = self.calculate_dispersion_angle_map()
+        if cache_dir is None or not self._load_from_cache(cache_dir, dtype):
+            self.dispersion_angle_map = self.calculate_dispersion_angle_map(chunk_size, workers)
+            self.dispersion_angle_map.data = self.dispersion_angle_map.data.astype(dtype, copy=False)
+            self.update_cumulative_dispersion_angles()
+            if cache_dir is not None:
+                self._save_to_cache(cache_dir, dtype)
+                limit_cache_size(cache_dir, max_cache_size)
 
-    def calculate_dispersion_angle_map(self):
+    def update_cumulative_dispersion_angles(self):
+        """
+        Recalculates the cumulative sum of the dispersion angle map along the distance axis, needs to be called after
+        modifying dispersion_angle_map.
+        """
+        data = self.dispersion_angle_map.data
+        # the first row is zero, so that the sum over the rows i to j - 1 is cumulative_angles[j] - cumulative_angles[i]
+        cumulative_angles = np.zeros((data.shape[0] + 1, data.shape[1]), dtype=data.dtype)
+        np.cumsum(data, axis=0, dtype=np.float64, out=cumulative_angles[1:])
+        self._cumulative_angles = cumulative_angles
+
+    def calculate_dispersion_angle_map(self, chunk_size=None, workers=1):
         """
         Creates a lookup table of dispersion angles for each two theta value and distance from the center of the
-        soller slit rotation center
+        soller slit rotation center. The angles are calculated for all positions and a chunk of two theta values at
+        once, the chunks can be distributed over several threads.
+
+        :param chunk_size: number of two theta values per chunk, by default the chunks are chosen so that each
+                           intermediate array has about max_chunk_elements elements
+        :param workers: number of threads calculating the chunks, 1 calculates all chunks in the calling thread
         :return: a map of the dispersion anges, out.X = two theta array, out.Y = distance array, out.data = dispersion
         angle
         """
-        p_x = np.arange(-self._max_thickness * 0.5, self._max_thickness * 0.5, 0.001)
-        p_y = np.zeros(p_x.shape)
-        p = np.array([p_x, p_y])
-        phi_array = []
-        for two_theta_value in self._two_theta:
-            # calculate fix points for the ther outer parts of the slits
-            q1_1, q1_2 = calculate_rectangular_side_points(self._inner_radius + self._inner_length,
-                                                           two_theta_value, self._inner_width)
+        p_x = self._positions()
+        if chunk_size is None:
+            chunk_size = max(1, self.max_chunk_elements // max(len(p_x), 1))
 
-            q2_1, q2_2 = calculate_rectangular_side_points(self._outer_radius + self._outer_length,
-                                                           two_theta_value, self._outer_width)
+        chunks = [self._two_theta[start:start + chunk_size] for start in range(0, len(self._two_theta), chunk_size)]
+        if workers == 1 or len(chunks) <= 1:
+            phi_chunks = [self._calculate_dispersion_angles(two_theta, p_x) for two_theta in chunks]
+        else:
+            with ThreadPoolExecutor(workers) as executor:
+                phi_chunks = list(executor.map(self._calculate_dispersion_angles, chunks, [p_x] * len(chunks)))
 
-            # calculate fix points for the inner parts of the slits
-            s1_1, s1_2 = calculate_rectangular_side_points(self._inner_radius, two_theta_value, self._inner_width)
+        if len(phi_chunks) == 0:
+            return self._create_map(np.zeros((len(p_x), 0)))
+        return self._create_map(np.concatenate(phi_chunks, axis=1))
 
-            # calculate the angles to the outer points of the slits
-            phi1 = calculate_angles(q1_1, q1_2, p)
-            phi2 = calculate_angles(q2_1, q2_2, p)
-            phi3 = calculate_angles(q2_1, q1_2, p)
-            phi4 = calculate_angles(q1_1, q2_2, p)
+    def _positions(self):
+        return np.arange(-self._max_thickness * 0.5, self._max_thickness * 0.5, 0.001)
 
-            # take the smallest angle for each point
-            phi = np.where(phi1 < phi2, phi1, phi2)
-            phi = np.where(phi3 < phi, phi3, phi)
-            phi = np.where(phi4 < phi, phi4, phi)
+    def _create_map(self, phi):
+        # create the real grid
+        two_theta_array_deg = self._two_theta / np.pi * 180
+        X, Y = np.meshgrid(two_theta_array_deg, self._positions())
+        return Map(X, Y, phi)
 
-            # getting geometry
-            intercept_s1_2_q1_1 = calculate_x_axis_intercept(s1_2, q1_1)
-            intercept_s1_2_q2_1 = calculate_x_axis_intercept(s1_2, q2_1)
-            intercept_q1_2_q2_2 = calculate_x_axis_intercept(q1_2, q2_2)
+    def _cache_filenames(self, cache_dir, dtype):
+        """
+        Returns the filenames of the cached lookup table and of its cumulative sum, the name contains a hash of all
+        parameters the lookup table depends on.
+        """
+        key = hashlib.sha256()
+        key.update(repr((_CACHE_VERSION, np.dtype(dtype).str, float(self._max_thickness),
+                         float(self._inner_radius), float(self._outer_radius),
+                         float(self._inner_width), float(self._outer_width),
+                         float(self._inner_length), float(self._outer_length))).encode())
+        key.update(np.ascontiguousarray(self._two_theta, dtype=np.float64).tobytes())
+        name = key.hexdigest()
+        return os.path.join(cache_dir, 'soller_{}_map.npy'.format(name)), \
+            os.path.join(cache_dir, 'soller_{}_cumulative.npy'.format(name))
+
+    def _load_from_cache(self, cache_dir, dtype):
+        """
+        Loads the lookup table and its cumulative sum memory-mapped from the cache.
 
-            intercept_s1_1_q2_2 = calculate_x_axis_intercept(s1_1, q2_2)
-            intercept_q1_1_q2_1 = calculate_x_axis_intercept(q1_1, q2_1)
+        :return: whether the lookup table was found in the cache
+        """
+        map_filename, cumulative_filename = self._cache_filenames(cache_dir, dtype)
+        try:
+            phi = np.load(map_filename, mmap_mode='r')
+            cumulative_angles = np.load(cumulative_filename, mmap_mode='r')
+        except (OSError, ValueError):
+            return False
+        if phi.shape != (len(self._positions()), len(self._two_theta)) or \
+                cumulative_angles.shape != (phi.shape[0] + 1, phi.shape[1]):
+            return False
+
+        # mark the table as recently used, so that it is not the first one removed by limit_cache_size
+        for filename in [map_filename, cumulative_filename]:
+            try:
+                os.utime(filename)
+            except OSError:
+                pass
+
+        self.dispersion_angle_map = self._create_map(phi)
+        self._cumulative_angles = cumulative_angles
+        return True
+
+    def _save_to_cache(self, cache_dir, dtype):
+        """
+        Saves the lookup table and its cumulative sum to the cache. Each file is written to a temporary file first and
+        then renamed, so that other processes never load partially written files. The cache is only an optimization,
+        therefore errors when writing it are ignored.
+        """
+        map_filename, cumulative_filename = self._cache_filenames(cache_dir, dtype)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            # the cumulative sum is written last, a table is only loaded when both files exist
+            for filename, values in [(map_filename, self.dispersion_angle_map.data),
+                                     (cumulative_filename, self._cumulative_angles)]:
+                file_descriptor, temp_filename = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+                try:
+                    with os.fdopen(file_descriptor, 'wb') as f:
+                        np.save(f, values)
+                    os.replace(temp_filename, filename)
+                except BaseException:
+                    os.remove(temp_filename)
+                    raise
+        except OSError:
+            pass
+
+    def _calculate_dispersion_angles(self, two_theta, p_x):
+        """
+        Calculates the dispersion angles for the positions p_x (first axis of the result) and the two theta values in
+        radians (second axis of the result).
+        """
+        # the slit points are arrays of shape (2, 1, len(two_theta)) and the positions (on the x-axis) are of shape
+        # (len(p_x), 1), so that all calculations broadcast to (len(p_x), len(two_theta))
+        two_theta = two_theta[np.newaxis, :]
+        x = p_x[:, np.newaxis]
 
-            pos_cutoff = 0 if intercept_q1_2_q2_2 < 0 else intercept_q1_2_q2_2
-            neg_cutoff = 0 if intercept_q1_1_q2_1 > 0 else intercept_q1_1_q2_1
+        # calculate fix points for the ther outer parts of the slits
+        q1_1, q1_2 = calculate_rectangular_side_points(self._inner_radius + self._inner_length,
+                                                       two_theta, self._inner_width)
 
-            #####################
-            # correcting for positive side:
+        q2_1, q2_2 = calculate_rectangular_side_points(self._outer_radius + self._outer_length,
+                                                       two_theta, self._outer_width)
 
-            intermediate_region_ind = np.logical_and(p_x > pos_cutoff, p_x < intercept_s1_2_q1_1)
-            points_in_intermediate_region = p[:, intermediate_region_ind]
+        # calculate fix points for the inner parts of the slits
+        s1_1, s1_2 = calculate_rectangular_side_points(self._inner_radius, two_theta, self._inner_width)
 
-            if np.sum(intermediate_region_ind):
-                phi1 = calculate_angles(s1_2, q2_1, points_in_intermediate_region)
-                phi2 = calculate_angles(q2_2, q2_1, points_in_intermediate_region)
-                phi[intermediate_region_ind] = np.where(phi1 < phi2, phi1, phi2)
+        # calculate the angles to the outer points of the slits and take the smallest angle for each point, the angles
+        # are small, so that the smallest angle can be found by the tangents and only one arctan is needed at the end
+        tan_phi = np.minimum(_angle_tangents(q1_1, q1_2, x), _angle_tangents(q2_1, q2_2, x))
+        tan_phi = np.minimum(tan_phi, _angle_tangents(q2_1, q1_2, x))
+        tan_phi = np.minimum(tan_phi, _angle_tangents(q1_1, q2_2, x))
 
-            # cut the angle
-            phi[p[0] > intercept_s1_2_q1_1] = 0
-            phi[p[0] > intercept_s1_2_q2_1] = 0
+        # getting geometry
+        intercept_s1_2_q1_1 = calculate_x_axis_intercept(s1_2, q1_1)
+        intercept_s1_2_q2_1 = calculate_x_axis_intercept(s1_2, q2_1)
+        intercept_q1_2_q2_2 = calculate_x_axis_intercept(q1_2, q2_2)
 
-            ########################
-            # correcting for negative side:
+        intercept_s1_1_q2_2 = calculate_x_axis_intercept(s1_1, q2_2)
+        intercept_q1_1_q2_1 = calculate_x_axis_intercept(q1_1, q2_1)
 
-            intermediate_region_ind = np.logical_and(p_x < neg_cutoff, p_x > intercept_s1_1_q2_2)
-            points_in_intermediate_region = p[:, intermediate_region_ind]
+        pos_cutoff = np.where(intercept_q1_2_q2_2 < 0, 0, intercept_q1_2_q2_2)
+        neg_cutoff = np.where(intercept_q1_1_q2_1 > 0, 0, intercept_q1_1_q2_1)
 
-            if np.sum(intermediate_region_ind):
-                phi1 = calculate_angles(s1_1, q2_2, points_in_intermediate_region)
-                phi2 = calculate_angles(q2_1, q2_2, points_in_intermediate_region)
-                phi[intermediate_region_ind] = np.where(phi1 < phi2, phi1, phi2)
+        #####################
+        # correcting for positive side:
 
-            intercept_s1_1_q2_2 = calculate_x_axis_intercept(s1_1, q2_2)
-            phi[p[0] < intercept_s1_1_q2_2] = 0
+        intermediate_region_ind = np.logical_and(x > pos_cutoff, x < intercept_s1_2_q1_1)
+        if np.any(intermediate_region_ind):
+            tan_phi_intermediate = np.minimum(_angle_tangents(s1_2, q2_1, x),
+                                              _angle_tangents(q2_2, q2_1, x))
+            tan_phi = np.where(intermediate_region_ind, tan_phi_intermediate, tan_phi)
 
-            phi_array.append(phi)
+        # cut the angle
+        tan_phi[np.logical_or(x > intercept_s1_2_q1_1, x > intercept_s1_2_q2_1)] = 0
 
-        # create the real grid
-        two_theta_array_deg = self._two_theta / np.pi * 180
-        X, Y = np.meshgrid(two_theta_array_deg, p[0])
-        phi_array = np.array(phi_array).transpose()
+        ########################
+        # correcting for negative side:
+
+        intermediate_region_ind = np.logical_and(x < neg_cutoff, x > intercept_s1_1_q2_2)
+        if np.any(intermediate_region_ind):
+            tan_phi_intermediate = np.minimum(_angle_tangents(s1_1, q2_2, x),
+                                              _angle_tangents(q2_1, q2_2, x))
+            tan_phi = np.where(intermediate_region_ind, tan_phi_intermediate, tan_phi)
+
+        tan_phi[x < intercept_s1_1_q2_2] = 0
 
-        return Map(X, Y, phi_array)
+        return np.arctan(tan_phi)
+
+    @property
+    def two_theta(self):
+        """
+        Returns the two theta values of the lookup table in degree.
+        """
+        return self._two_theta / np.pi * 180
 
-    def transfer_function_from_region(self, d1, d2):
+    def covers_two_theta(self, two_theta):
+        """
+        Returns whether the two theta values (in degree) are within the range of the lookup table, so that transfer
+        functions for them can be interpolated.
+        """
+        return np.min(two_theta) >= np.min(self.two_theta) and np.max(two_theta) <= np.max(self.two_theta)
+
+    def _region_sum(self, d1, d2):
+        distance = self.dispersion_angle_map.Y[:, 0]
+        # rows with d1 < distance < d2
+        start = np.searchsorted(distance, d1, side='right')
+        stop = max(start, np.searchsorted(distance, d2, side='left'))
+        return np.subtract(self._cumulative_angles[stop], self._cumulative_angles[start], dtype=np.float64)
+
+    def _interval_indices(self, two_theta):
+        """
+        Returns the indices of the lookup table two theta values below each of the given two theta values (in degree).
+        """
+        if not self.covers_two_theta(two_theta):
+            raise ValueError("The two theta values ({:.3f} - {:.3f} degree) are outside of the range of the soller "
+                             "correction lookup table ({:.3f} - {:.3f} degree).".format(
+                                 np.min(two_theta), np.max(two_theta), np.min(self.two_theta),
+                                 np.max(self.two_theta)))
+        return np.clip(np.searchsorted(self.two_theta, two_theta, side='right') - 1, 0, len(self._two_theta) - 2)
+
+    def transfer_function_from_region(self, d1, d2, two_theta=None):
         """
         Calculates the transfer function for a sample region within d1 and d2
         :param d1: lower bound of the sample region
         :param d2: upper bound of the sample region
+        :param two_theta: two theta values (in degree) for which the transfer function is calculated. By default the
+                          two theta values of the lookup table are used, otherwise the dispersion angles summed over
+                          the region are linearly interpolated from the lookup table (see interpolation_error)
         :return: transfer function with same dimensions as two_theta
         """
-        distance = self.dispersion_angle_map.Y[:, 0]
-        region_ind = np.logical_and(distance > d1, distance < d2)
-        transfer_function = 1. / np.sum(self.dispersion_angle_map.data[region_ind, :], 0)
+        angle_sum = self._region_sum(d1, d2)
+        if two_theta is not None:
+            self._interval_indices(two_theta)
+            angle_sum = np.interp(two_theta, self.two_theta, angle_sum)
+        transfer_function = 1. / angle_sum
         transfer_function = transfer_function / np.min(transfer_function)
         return transfer_function
 
-    def transfer_function_sample(self, sample_thickness, shift=0):
+    def interpolation_error(self, d1, d2, two_theta):
+        """
+        Estimates the relative error of the dispersion angles summed over the region within d1 and d2 when linearly
+        interpolating them from the lookup table onto the given two theta values, using the error term of the linear
+        interpolation with the second derivative estimated from the lookup table. The relative error of the
+        interpolated transfer function is of the same order.
+
+        :param d1: lower bound of the sample region
+        :param d2: upper bound of the sample region
+        :param two_theta: two theta values in degree
+        :return: estimated maximum relative error
+        """
+        two_theta = np.asarray(two_theta, dtype=float)
+        interval_ind = self._interval_indices(two_theta)
+        nodes = self.two_theta
+        angle_sum = self._region_sum(d1, d2)
+        if len(nodes) < 3:
+            return np.nan
+
+        # second divided differences at the inner nodes, for each interval the larger one of its two nodes is used
+        slopes = np.diff(angle_sum) / np.diff(nodes)
+        second_derivative = np.abs(2 * np.diff(slopes) / (nodes[2:] - nodes[:-2]))
+        second_derivative = np.concatenate(([second_derivative[0]], second_derivative, [second_derivative[-1]]))
+        interval_second_derivative = np.maximum(second_derivative[interval_ind], second_derivative[interval_ind + 1])
+
+        error = 0.5 * np.abs((two_theta - nodes[interval_ind]) * (two_theta - nodes[interval_ind + 1])) * \
+            interval_second_derivative
+        return float(np.max(error / np.interp(two_theta, nodes, angle_sum)))
+
+    def transfer_function_sample(self, sample_thickness, shift=0, two_theta=None):
         """
         Calculates the transfer function for a specific sample thickness, assuming the sample is centered, to the
         rotation center of the soller slit
         :param sample_thickness: sample thickness in mm
         :param shift: shift of the sample relative to rotation center of the soller slit in beam direction (x)
+        :param two_theta: two theta values in degree, by default the ones of the lookup table (see
+                          transfer_function_from_region)
         :return: transfer function with same dimensions as two_theta
         """
         return self.transfer_function_from_region(-sample_thickness * 0.5 + shift,
-                                                  +sample_thickness * 0.5 + shift)
+                                                  +sample_thickness * 0.5 + shift, two_theta)
 
-    def transfer_function_dac(self, sample_thickness, initial_thickness):
+    def transfer_function_dac(self, sample_thickness, initial_thickness, two_theta=None):
         """
         Calculates two transfer function specific to diamond anvil cell (DAC) correction. It calculates the transfer
         function for the sample and also for the Compton scattering of diamonds which came into the diffraction volume
         due to the compression.
         :param sample_thickness: current sample thickness in mm
         :param initial_thickness: initial sample chamber thickness when background was measured, in mm
+        :param two_theta: two theta values in degree, by default the ones of the lookup table (see
+                          transfer_function_from_region)
         :return: tuple of (sample transfer function, diamond transfer function), both with same dimensions as two_theta
         """
-        sample_transfer_function = self.transfer_function_sample(sample_thickness)
+        sample_transfer_function = self.transfer_function_sample(sample_thickness, two_theta=two_theta)
         d1 = sample_thickness * 0.5
         d2 = initial_thickness * 0.5
-        diamond_transfer_function = self.transfer_function_from_region(d1, d2)
-        diamond_transfer_function += self.transfer_function_from_region(-d2, -d1)
+        diamond_transfer_function = self.transfer_function_from_region(d1, d2, two_theta)
+        diamond_transfer_function += self.transfer_function_from_region(-d2, -d1, two_theta)
         diamond_transfer_function /= 2
         return sample_transfer_function, diamond_transfer_function
-    
+
+
 class SollerCorrectionGui(SollerCorrection):
     def __init__(self,  q, wavelength, max_thickness, inner_radius=62, outer_radius=210,
-                 inner_width=0.05, outer_width=0.2, inner_length=8, outer_length=6):
+                 inner_width=0.05, outer_width=0.2, inner_length=8, outer_length=6, cache_dir=None):
 
         two_theta = np.arcsin(q * wavelength / (4 * np.pi)) * 360 / np.pi
         super(SollerCorrectionGui, self).__init__(two_theta, max_thickness, inner_radius, outer_radius,
-                 inner_width, outer_width, inner_length, outer_length)
+                 inner_width, outer_width, inner_length, outer_length, cache_dir=cache_dir)
         self.wavelength = wavelength
         self.q = q
 
@@ -189,6 +435,20 @@ def calculate_angles(point1, point2, p):
                          (point2[0] - p[0]) ** 2 + (point2[1] - p[1]) ** 2)))
 
 
+def _angle_tangents(point1, point2, x):
+    """
+    calculates the tangent of the angle between vectors going from the two points (point1, point2) to central points
+    on the x-axis (y = 0) as ratio of the cross and dot product. Unlike the arccos in calculate_angles, this is accurate
+    for small angles, but it is only valid for angles smaller than 90 degree.
+    """
+    # cross and dot product written as polynomials in x, so that only the coefficients depend on the points
+    cross_0 = point1[0] * point2[1] - point1[1] * point2[0]
+    cross_1 = point1[1] - point2[1]
+    dot_0 = point1[0] * point2[0] + point1[1] * point2[1]
+    dot_1 = point1[0] + point2[0]
+    return np.abs(cross_0 + cross_1 * x) / (dot_0 - (dot_1 - x) * x)
+
+
 def calculate_x_axis_intercept(p1, p2):
     """
     obtains the x-axis intercept of a line defined by two points.
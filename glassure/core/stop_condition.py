@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+import time
+from threading import Event
+
+import numpy as np
+import lmfit
+
+__all__ = ['StopCondition', 'check_tolerance_criterion', 'residual_rms', 'minimize_until_stopped']
+
+
+class StopCondition(object):
+    """
+    Stop condition for the iterative optimizations (optimize_sq, optimize_density, optimize_soller_dac, ...). An
+    optimization using the stop condition stops and returns the best result found so far as soon as:
+
+        - cancel() was called, e.g. from another thread (the GUI) or from a callback function
+        - a callback function of the optimization returned False
+        - the wall-clock time since the start of the optimization exceeds max_time
+        - the number of objective function evaluations (or iterations for optimize_sq) reaches max_evaluations
+
+    A StopCondition can be reused for several optimizations. The time and the evaluations are counted from the start
+    of each optimization, while a cancellation persists until reset() is called.
+
+    :param max_time: wall-clock budget in seconds, None for no limit
+    :param max_evaluations: maximum number of objective function evaluations or iterations, None for no limit
+    """
+
+    def __init__(self, max_time: float = None, max_evaluations: int = None):
+        self.max_time = max_time
+        self.max_evaluations = max_evaluations
+        self._cancelled = Event()
+        self.start()
+
+    def start(self):
+        """
+        Restarts the clock and the evaluation counter, called at the start of each optimization.
+        """
+        self._start_time = time.perf_counter()
+        self.evaluations = 0
+
+    def reset(self):
+        """
+        Clears a previous cancellation and restarts the clock and the evaluation counter.
+        """
+        self._cancelled.clear()
+        self.start()
+
+    def cancel(self):
+        """
+        Requests the optimization to stop. Thread-safe.
+        """
+        self._cancelled.set()
+
+    def count_evaluation(self):
+        """
+        Counts one objective function evaluation (or iteration).
+        """
+        self.evaluations += 1
+
+    def check_callback_result(self, result):
+        """
+        Cancels the optimization if the result of a callback function is False. Any other result (including None)
+        continues the optimization.
+
+        :param result: return value of the callback function
+        """
+        if result is False:
+            self.cancel()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def elapsed_time(self) -> float:
+        """
+        Returns the wall-clock time in seconds since the start of the current optimization.
+        """
+        return time.perf_counter() - self._start_time
+
+    @property
+    def reason(self) -> str | None:
+        """
+        Returns the reason why the optimization should stop ('cancelled', 'max_time' or 'max_evaluations') or None if
+        it should continue.
+        """
+        if self.cancelled:
+            return 'cancelled'
+        if self.max_time is not None and self.elapsed_time >= self.max_time:
+            return 'max_time'
+        if self.max_evaluations is not None and self.evaluations >= self.max_evaluations:
+            return 'max_evaluations'
+        return None
+
+    @property
+    def stopped(self) -> bool:
+        """
+        Returns whether the optimization should stop.
+        """
+        return self.reason is not None
+
+
+def check_tolerance_criterion(tolerance_criterion: str):
+    """
+    Checks the criterion of a tolerance based stopping, which is either 'fr' (residual of F(r) below r_cutoff) or 'sq'
+    (change of S(Q) or i(Q) between two iterations).
+    """
+    if tolerance_criterion not in ('fr', 'sq'):
+        raise NotImplementedError("{} is not an allowed tolerance criterion".format(tolerance_criterion))
+
+
+def residual_rms(values: np.ndarray) -> float | np.ndarray:
+    """
+    Returns the root mean square of the values along the last axis, used as residual for the tolerance criteria.
+    """
+    return np.sqrt(np.mean(np.square(values), axis=-1))
+
+
+def minimize_until_stopped(optimization_fcn, params: lmfit.Parameters, stop_condition: StopCondition = None,
+                           **kwargs) -> lmfit.minimizer.MinimizerResult:
+    """
+    Minimizes optimization_fcn with lmfit.minimize until it converges or the stop_condition is met. If the
+    minimization was stopped (result.aborted is True), the parameters of the evaluation with the lowest chi2 are
+    restored in result.params (without standard errors) and result.chisqr is set accordingly.
+
+    :param optimization_fcn: objective function returning the residual array
+    :param params: lmfit parameters
+    :param stop_condition: StopCondition, None only stops on convergence
+    :param kwargs: further keyword arguments for lmfit.minimize
+    :return: lmfit MinimizerResult
+    """
+    if stop_condition is None:
+        stop_condition = StopCondition()
+    stop_condition.start()
+    best = {'chisqr': np.inf, 'values': None}
+    last = {'residual': None, 'aborted': False}
+
+    def objective(params, *args, **kws):
+        if last['aborted']:
+            # lmfit evaluates the last parameters once more after an abort, no need to recalculate the residual
+            return last['residual']
+        return optimization_fcn(params, *args, **kws)
+
+    def iteration_callback(params, iteration, residual, *args, **kws):
+        if not last['aborted']:
+            stop_condition.count_evaluation()
+        chisqr = float(np.sum(np.square(residual)))
+        if chisqr < best['chisqr']:
+            best['chisqr'] = chisqr
+            best['values'] = params.valuesdict()
+        last['residual'] = residual
+        last['aborted'] = stop_condition.stopped
+        return last['aborted']
+
+    result = lmfit.minimize(objective, params, iter_cb=iteration_callback, **kwargs)
+
+    if result.aborted and best['values'] is not None:
+        for name, value in best['values'].items():
+            result.params[name].value = value
+            result.params[name].stderr = None
+        result.chisqr = best['chisqr']
+    return result
@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-import re
+from __future__ import annotations
 from typing import Optional
 from copy import copy
 
@@ -7,9 +7,9 @@ import numpy as np
 from scipy import interpolate
 import lmfit
 
-from .scattering_factors import calculate_coherent_scattering_factor, calculate_incoherent_scattered_intensity
+from .composition import Composition, as_composition
 from . import Pattern
-from . import scattering_factors
+from .pattern import PatternStack, create_pattern_like
 
 __all__ = ['calculate_f_mean_squared', 'calculate_f_squared_mean', 'calculate_incoherent_scattering',
            'extrapolate_to_zero_linear', 'extrapolate_to_zero_poly', 'extrapolate_to_zero_spline', 'calculate_s0',
@@ -25,12 +25,7 @@ def calculate_f_mean_squared(composition: dict, q: np.ndarray, sf_source='hajdu'
     :param q: Q value or numpy array with a unit of A^-1
     :param sf_source: source of the scattering factors. Possible sources are 'hajdu' and 'brown_hubbell'.
     """
-    norm_elemental_abundances = normalize_composition(composition)
-
-    res = 0
-    for element, amount in norm_elemental_abundances.items():
-        res += amount * calculate_coherent_scattering_factor(element, q, sf_source)
-    return res ** 2
+    return as_composition(composition).f_mean_squared(q, sf_source)
 
 
 def calculate_f_squared_mean(composition: dict[str, float], q: np.ndarray, sf_source: str = 'hajdu') -> np.ndarray:
@@ -43,12 +38,7 @@ def calculate_f_squared_mean(composition: dict[str, float], q: np.ndarray, sf_so
 
     :return: mean of the squared form factors
     """
-    norm_elemental_abundances = normalize_composition(composition)
-
-    res = 0
-    for key, value in norm_elemental_abundances.items():
-        res += value * calculate_coherent_scattering_factor(key, q, sf_source) ** 2
-    return res
+    return as_composition(composition).f_squared_mean(q, sf_source)
 
 
 def calculate_incoherent_scattering(composition: dict[str, float], q: np.ndarray, sf_source: str = 'hajdu') \
@@ -62,12 +52,7 @@ def calculate_incoherent_scattering(composition: dict[str, float], q: np.ndarray
 
     :return: incoherent scattering array
     """
-    norm_elemental_abundances = normalize_composition(composition)
-
-    res = 0
-    for key, value in norm_elemental_abundances.items():
-        res += value * calculate_incoherent_scattered_intensity(key, q, sf_source)
-    return res
+    return as_composition(composition).incoherent_scattering(q, sf_source)
 
 
 def calculate_s0(composition: dict[str, float], sf_source: str = 'hajdu') -> float:
@@ -104,19 +89,12 @@ def calculate_weighting_factor(composition: dict[str, float], element_1: str, el
     else:
         factor = 2
 
-    num_atoms = sum([val for _, val in composition.items()])
-    f = {}  # form factors
-    c = {}  # concentrations
-    for element, val in composition.items():
-        f[element] = calculate_coherent_scattering_factor(element, q, sf_source)
-        c[element] = val / num_atoms
+    composition = as_composition(composition)
+    f, f_sum_squared, _, _ = composition.form_factors(q, sf_source)  # form factors and <f>^2
+    c = composition.fractions  # concentrations
 
-    f_sum_squared = np.zeros_like(q)
-    for element, conc in c.items():
-        f_sum_squared += f[element] * conc
-    f_sum_squared = f_sum_squared ** 2
-
-    return factor * c[element_1] * c[element_2] * f[element_1] * f[element_2] / f_sum_squared
+    ind_1, ind_2 = composition.elements.index(element_1), composition.elements.index(element_2)
+    return factor * c[ind_1] * c[ind_2] * f[ind_1] * f[ind_2] / f_sum_squared
 
 
 def normalize_composition(composition):
@@ -126,6 +104,9 @@ def normalize_composition(composition):
     :param composition: dictionary with elements as key and abundances as relative numbers
     :return: normalized elemental abundances dictionary
     """
+    if isinstance(composition, Composition):
+        return Composition(composition.normalized)
+
     sum = 0.0
     for key, val in composition.items():
         sum += val
@@ -147,61 +128,57 @@ def convert_density_to_atoms_per_cubic_angstrom(composition, density):
     :return: density in atoms/A^3
     """
 
-    # get_smallest abundance
-    norm_elemental_abundances = normalize_composition(composition)
-    mean_z = 0.0
-    for element, concentration in norm_elemental_abundances.items():
-        element = re.findall('[A-zA-Z]*', element)[0]
-        mean_z += concentration * scattering_factors.atomic_weights['AW'][element]
-    return density / mean_z * .602214129
+    return density / as_composition(composition).mean_atomic_weight * .602214129
 
 
-def extrapolate_to_zero_step(pattern: Pattern, y0=0) -> Pattern:
+def extrapolate_to_zero_step(pattern: Pattern | PatternStack, y0=0) -> Pattern | PatternStack:
     """
     Extrapolates a pattern to (0, y0) by setting everything below the q_min of the pattern to y0 (default=0)
 
-    :param pattern: input Pattern
+    :param pattern: input Pattern or PatternStack
     :param y0: y value at x = 0
 
-    :return: extrapolated Pattern
+    :return: extrapolated Pattern (PatternStack if a PatternStack was given)
     """
     x, y = pattern.data
     step = x[1] - x[0]
     low_x = np.arange(min(x), 0 - step / 2, -step)[::-1]
-    low_y = np.zeros(low_x.shape) + y0
+    low_y = np.zeros(y.shape[:-1] + low_x.shape) + y0
 
-    return Pattern(np.concatenate((low_x, x)),
-                   np.concatenate((low_y, y)))
+    return create_pattern_like(pattern,
+                               np.concatenate((low_x, x)),
+                               np.concatenate((low_y, y), axis=-1))
 
 
-def extrapolate_to_zero_linear(pattern: Pattern, y0=0) -> Pattern:
+def extrapolate_to_zero_linear(pattern: Pattern | PatternStack, y0=0) -> Pattern | PatternStack:
     """
     Extrapolates a pattern to (0, y0) using a linear function from the leftest point in the pattern
 
-    :param pattern: input Pattern
+    :param pattern: input Pattern or PatternStack
     :param y0: y value at x = 0
 
-    :return: new extrapolated Pattern (includes the original data)
+    :return: new extrapolated Pattern (includes the original data), PatternStack if a PatternStack was given
     """
     x, y = pattern.data
     step = x[1] - x[0]
     low_x = np.arange(min(x), 0 - step / 2, -step)[::-1]
-    low_y = (y[0] - y0) / x[0] * low_x + y0
-    return Pattern(np.concatenate((low_x, x)),
-                   np.concatenate((low_y, y)))
+    low_y = (y[..., :1] - y0) / x[0] * low_x + y0
+    return create_pattern_like(pattern,
+                               np.concatenate((low_x, x)),
+                               np.concatenate((low_y, y), axis=-1))
 
 
-def extrapolate_to_zero_spline(pattern: Pattern,
+def extrapolate_to_zero_spline(pattern: Pattern | PatternStack,
                                x_max: float,
                                smooth_factor: Optional[float] = None,
                                replace: bool = False,
-                               y0: float = 0) -> Pattern:
+                               y0: float = 0) -> Pattern | PatternStack:
     """
     Extrapolates a pattern to (0, y0) using a spline function.
     If the spline hits zero on the y-axis at an x value higher than 0 all values below this intersection
     will be set to zero
 
-    :param pattern: input pattern
+    :param pattern: input pattern or PatternStack, for a PatternStack a spline is fitted to each pattern
     :param x_max: defines the maximum x value within the spline will be fitted to the input pattern, This parameter
     should be larger than the minimum of the pattern x
     :param smooth_factor: defines the smoothing of the spline extrapolation please see numpy.UnivariateSpline manual for
@@ -209,7 +186,7 @@ def extrapolate_to_zero_spline(pattern: Pattern,
     :param replace: boolean flag whether to replace the data values in the fitted region (default = False)
     :param y0: y value at x = 0
 
-    :return: extrapolated Pattern (includes the original one)
+    :return: extrapolated Pattern (includes the original one), PatternStack if a PatternStack was given
     """
 
     x, y = pattern.data
@@ -217,27 +194,33 @@ def extrapolate_to_zero_spline(pattern: Pattern,
     x_low = np.arange(min(x), 0 - x_step / 2, -x_step)[::-1]
 
     x_intersection = np.concatenate(([0], x[x < x_max]))
-    y_intersection = np.concatenate(([y0], y[x < x_max]))
+    y_intersection = y[..., x < x_max]
 
     if replace:
         x_low = np.concatenate((x_low, x_intersection[1:]))
         ind = x > x_max
         x = x[ind]
-        y = y[ind]
+        y = y[..., ind]
 
-    spl = interpolate.UnivariateSpline(x_intersection, y_intersection, s=smooth_factor)
-    y_low = spl(x_low)
+    def evaluate_spline(y_row):
+        spl = interpolate.UnivariateSpline(x_intersection, np.concatenate(([y0], y_row)), s=smooth_factor)
+        return spl(x_low)
 
-    ind_below_zero = np.where(y_low < y0)[0]
+    y_low = np.apply_along_axis(evaluate_spline, -1, y_intersection)
 
-    if len(ind_below_zero) > 0:
-        y_low[:ind_below_zero[-1]] = y0
+    # set everything below the last intersection with y0 to y0
+    below_y0 = y_low < y0
+    last_ind_below_y0 = y_low.shape[-1] - 1 - np.argmax(below_y0[..., ::-1], axis=-1)
+    last_ind_below_y0 = np.where(np.any(below_y0, axis=-1), last_ind_below_y0, 0)
+    y_low[np.arange(y_low.shape[-1]) < last_ind_below_y0[..., np.newaxis]] = y0
 
-    return Pattern(np.concatenate((x_low, x)),
-                   np.concatenate((y_low, y)))
+    return create_pattern_like(pattern,
+                               np.concatenate((x_low, x)),
+                               np.concatenate((y_low, y), axis=-1))
 
 
-def extrapolate_to_zero_poly(pattern: Pattern, x_max: float, replace: bool = False, y0: float = 0) -> Pattern:
+def extrapolate_to_zero_poly(pattern: Pattern | PatternStack, x_max: float, replace: bool = False,
+                             y0: float = 0) -> Pattern | PatternStack:
     """
     Extrapolates a pattern to (0, y0) using a 2nd order polynomial:
 
@@ -248,36 +231,40 @@ def extrapolate_to_zero_poly(pattern: Pattern, x_max: float, replace: bool = Fal
     if the polynomial extrapolation hits the value of y0 (default=0) at an x value higher than zero all y values below
     this intersection will be set to y0.
 
-    :param pattern: input pattern
+    :param pattern: input pattern or PatternStack, for a PatternStack the polynomial is fitted to each pattern
     :param x_max: defines the maximum x value within the polynomial will be fit
     :param replace: boolean flag whether to replace the data values in the fitted region (default = False)
     :param y0: y value at x = 0
 
-    :return: extrapolated Pattern
+    :return: extrapolated Pattern (PatternStack if a PatternStack was given)
     """
 
     x, y = pattern.data
     x_step = x[1] - x[0]
 
     x_fit = x[x < x_max]
-    y_fit = y[x < x_max]
+    y_fit = y[..., x < x_max]
+
+    def fit_polynomial(y_fit_row):
+        params = lmfit.Parameters()
+        params.add("a", value=1, min=0)
+        params.add("b", value=1, min=0)
+        params.add("c", value=1)
 
-    params = lmfit.Parameters()
-    params.add("a", value=1, min=0)
-    params.add("b", value=1, min=0)
-    params.add("c", value=1)
+        def optimization_fcn(params):
+            a = params['a'].value
+            b = params['b'].value
+            c = params['c'].value
 
-    def optimization_fcn(params):
-        a = params['a'].value
-        b = params['b'].value
-        c = params['c'].value
+            return y_fit_row - (x_fit - c) * a - (x_fit - c) ** 2 * b + y0
 
-        return y_fit - (x_fit - c) * a - (x_fit - c) ** 2 * b + y0
+        result = lmfit.minimize(optimization_fcn, params)
+        return [result.params['a'].value, result.params['b'].value, result.params['c'].value]
 
-    result = lmfit.minimize(optimization_fcn, params)
-    a = result.params['a'].value
-    b = result.params['b'].value
-    c = result.params['c'].value
+    poly_params = np.apply_along_axis(fit_polynomial, -1, y_fit)
+    a = poly_params[..., 0, np.newaxis]
+    b = poly_params[..., 1, np.newaxis]
+    c = poly_params[..., 2, np.newaxis]
 
     x_low = np.arange(min(x), 0, -x_step)[::-1]
 
@@ -285,13 +272,14 @@ def extrapolate_to_zero_poly(pattern: Pattern, x_max: float, replace: bool = Fal
         x_low = np.concatenate((x_low, x_fit[1:]))
         ind = x > x_max
         x = x[ind]
-        y = y[ind]
+        y = y[..., ind]
 
     y_low = a * (x_low - c) + b * (x_low - c) ** 2 - y0
     y_low[y_low < y0] = y0
 
-    return Pattern(np.concatenate((x_low, x)),
-                   np.concatenate((y_low, y)))
+    return create_pattern_like(pattern,
+                               np.concatenate((x_low, x)),
+                               np.concatenate((y_low, y), axis=-1))
 
 
 def convert_two_theta_to_q_space_raw(two_theta, wavelength):
@@ -306,5 +294,5 @@ def convert_two_theta_to_q_space(pattern, wavelength):
     Returns a new pattern with the x-axis converted from two theta into q space
     """
     q_pattern = copy(pattern)
-    q_pattern._x = convert_two_theta_to_q_space_raw(q_pattern.x, wavelength)
+    q_pattern.x = convert_two_theta_to_q_space_raw(q_pattern.x, wavelength)
     return q_pattern
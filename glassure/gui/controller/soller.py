@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
 
+from qtpy import QtCore
+
 from ..widgets.glassure_widget import GlassureWidget
 from ..model.glassure_model import GlassureModel
+from ...core.soller_correction import default_cache_dir
 
 
 class SollerController(object):
@@ -16,15 +19,24 @@ class SollerController(object):
         self.widget = widget
         self.soller_widget = widget.soller_widget
         self.model = glassure_model
+        self.settings = QtCore.QSettings('Glassure', 'Glassure')
 
         self.connect_signals()
+        self.soller_widget.cache_cb.setChecked(self.settings.value('soller_cache', False, type=bool))
+        self.cache_cb_state_changed()
 
     def connect_signals(self):
         self.soller_widget.soller_parameters_changed.connect(self.parameters_changed)
         self.soller_widget.activate_cb.stateChanged.connect(self.active_cb_state_changed)
+        self.soller_widget.cache_cb.stateChanged.connect(self.cache_cb_state_changed)
 
     def parameters_changed(self):
         self.model.soller_parameters = self.soller_widget.get_parameters()
 
     def active_cb_state_changed(self):
         self.model.use_soller_correction = self.soller_widget.activate_cb.isChecked()
+
+    def cache_cb_state_changed(self):
+        use_cache = self.soller_widget.cache_cb.isChecked()
+        self.settings.setValue('soller_cache', use_cache)
+        self.model.soller_cache_dir = default_cache_dir() if use_cache else None
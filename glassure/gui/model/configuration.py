@@ -202,6 +202,9 @@ class GlassureConfiguration(object):
         self.fr_pattern = None
         self.gr_pattern = None
 
+        # cached results of the transform pipeline stages, see GlassureModel._stage
+        self.stage_cache = {}
+
         # initialize all parameters
         self.sample = Sample()
         self.transform_config = TransformConfiguration()
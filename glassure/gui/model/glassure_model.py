@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
 
+from contextlib import contextmanager
 from datetime import date, datetime, timedelta
 from .configuration import GlassureConfiguration, ExtrapolationConfiguration, TransformConfiguration, Sample
+from .transform_pipeline import TransformPipeline
+from .transform_worker import TransformRequest, TransformWorker
 import numpy as np
 import json
 from lmfit import Parameters, minimize
@@ -9,14 +12,8 @@ from qtpy import QtGui, QtCore
 
 from ...core.pattern import Pattern
 from ...core.utility import calculate_incoherent_scattering, convert_density_to_atoms_per_cubic_angstrom
-from ...core import calculate_sq, calculate_gr, calculate_fr
-from ...core.optimization import optimize_sq
-from ...core.soller_correction import SollerCorrectionGui
 from ...core.transfer_function import calculate_transfer_function
 
-from ...core.utility import extrapolate_to_zero_linear, extrapolate_to_zero_step, extrapolate_to_zero_spline, \
-    extrapolate_to_zero_poly, calculate_s0
-
 from ...core.scattering_factors import get_available_elements
 
 
@@ -28,15 +25,26 @@ class GlassureModel(QtCore.QObject):
     fr_changed = QtCore.Signal(Pattern)
     gr_changed = QtCore.Signal(Pattern)
 
-    def __init__(self):
+    def __init__(self, configuration: GlassureConfiguration = None):
         super(GlassureModel, self).__init__()
 
         self.configurations = []
-        self.configurations.append(GlassureConfiguration())
+        self.configurations.append(GlassureConfiguration() if configuration is None else configuration)
         self.configuration_ind = 0
 
         self.auto_update = True
         self.optimization_callback = None
+        self.soller_interpolation_error = None
+        # directory of the disk cache for the soller correction lookup tables, None disables the cache
+        self.soller_cache_dir = None
+
+        # when enabled, calculate_transforms only submits a request to a background thread and the results are
+        # emitted (sq_changed, fr_changed, gr_changed and data_changed) after the calculation finished
+        self.background_calculation = False
+        self._transform_request = None
+        self._transform_worker = TransformWorker()
+        self._transform_worker.finished.connect(self._transform_request_finished)
+        self._transform_worker.progress.connect(self._transform_request_progress)
 
     def load_data(self, filename):
         self.original_pattern.load(filename)
@@ -491,116 +499,84 @@ class GlassureModel(QtCore.QObject):
         if not self.auto_update:
             return
 
-        if len(self.composition) != 0 and self.original_pattern:
-            self.calculate_sq()
-
-            if self.optimize:
-                self.sq_pattern = optimize_sq(
-                    self.sq_pattern, self.r_cutoff,
-                    iterations=self.optimization_iterations,
-                    atomic_density=convert_density_to_atoms_per_cubic_angstrom(
-                        self.composition,
-                        self.density),
-                    use_modification_fcn=False,
-                    attenuation_factor=self.optimization_attenuation,
-                    fcn_callback=self.optimization_callback,
-                    fourier_transform_method=self.transform_config.fourier_transform_method)
-            self.calculate_fr()
-            self.calculate_gr()
+        if self.background_calculation:
+            self._transform_request = TransformRequest(self.current_configuration, self.soller_cache_dir,
+                                                       self.optimization_callback is not None)
+            self._transform_worker.submit(self._transform_request)
+            return
+
+        self.cancel_transforms()
+        self._calculate_transforms()
+
+    def _calculate_transforms(self):
+        """
+        Calculates S(Q), F(r) and g(r) of the current configuration in the calling thread.
+        """
+        pipeline = TransformPipeline(self.current_configuration, self.soller_cache_dir, self.optimization_callback)
+        if pipeline.run():
+            self.soller_interpolation_error = pipeline.soller_interpolation_error
+            self.sq_pattern = self.current_configuration.sq_pattern
+            self.fr_pattern = self.current_configuration.fr_pattern
+            self.gr_pattern = self.current_configuration.gr_pattern
         self.data_changed.emit()
 
-    def calculate_sq(self):
-        if self.background_pattern is not None:
-            sample_pattern = (self.original_pattern - self.background_pattern) \
-                .limit(self.q_min, self.q_max)
-        else:
-            sample_pattern = self.original_pattern.limit(
-                self.q_min, self.q_max)
-
-        if self.use_transfer_function and self.transfer_function is not None:
-            sample_pattern.y = sample_pattern.y * \
-                               self.transfer_function(sample_pattern.x)
-
-        if self.use_soller_correction:
-            q, intensity = sample_pattern.data
-            if self.soller_correction is None or \
-                    self.soller_correction._max_thickness < self.soller_parameters['sample_thickness'] or \
-                    self.soller_correction.wavelength != self.soller_parameters['wavelength'] or \
-                    self.soller_correction._inner_radius != self.soller_parameters['inner_radius'] or \
-                    self.soller_correction._outer_radius != self.soller_parameters['outer_radius'] or \
-                    self.soller_correction._inner_width != self.soller_parameters['inner_width'] or \
-                    self.soller_correction._outer_width != self.soller_parameters['outer_width'] or \
-                    self.soller_correction._inner_length != self.soller_parameters['inner_length'] or \
-                    self.soller_correction._outer_length != self.soller_parameters['outer_length']:
-
-                if 2 > self.soller_parameters['sample_thickness']:
-                    max_thickness = 2
-                else:
-                    max_thickness = self.soller_parameters["sample_thickness"] * 1.5
-
-                self.soller_correction = SollerCorrectionGui(
-                    q=q,
-                    wavelength=self.soller_parameters['wavelength'],
-                    max_thickness=max_thickness,
-                    inner_radius=self.soller_parameters['inner_radius'],
-                    outer_radius=self.soller_parameters['outer_radius'],
-                    inner_width=self.soller_parameters['inner_width'],
-                    outer_width=self.soller_parameters['outer_width'],
-                    inner_length=self.soller_parameters['inner_length'],
-                    outer_length=self.soller_parameters['outer_length'])
-
-            sample_pattern = Pattern(
-                q, self.soller_correction.transfer_function_sample(
-                    self.soller_parameters['sample_thickness']) * intensity)
-
-        self.sq_pattern = calculate_sq(
-            sample_pattern,
-            density=self.density,
-            composition=self.composition,
-            normalization_method=self.normalization_method,
-            method=self.sq_method,
-            sf_source=self.sf_source,
-        )
-        self.perform_extrapolation()
-
-    def perform_extrapolation(self):
-        if not self.extrapolation_config.activate:
-            return
+    @property
+    def transforms_pending(self):
+        """
+        Returns whether a background calculation of the transforms has not been applied yet.
+        """
+        return self._transform_request is not None
 
-        extrapolation_method = self.extrapolation_config.method
-        if self.extrapolation_config.s0_auto:
-            self.extrapolation_config.s0 = calculate_s0(self.composition, self.sf_source)
-
-        s0 = self.extrapolation_config.s0
-
-        if extrapolation_method == 'step':
-            self.sq_pattern = extrapolate_to_zero_step(self.sq_pattern, y0=s0)
-        elif extrapolation_method == 'linear':
-            self.sq_pattern = extrapolate_to_zero_linear(self.sq_pattern, y0=s0)
-        elif extrapolation_method == 'spline':
-            self.sq_pattern = extrapolate_to_zero_spline(
-                self.sq_pattern,
-                self.extrapolation_config.fit_q_max,
-                y0=s0,
-                replace=self.extrapolation_config.fit_replace)
-        elif extrapolation_method == 'poly':
-            self.sq_pattern = extrapolate_to_zero_poly(
-                self.sq_pattern,
-                self.extrapolation_config.fit_q_max,
-                y0=s0,
-                replace=self.extrapolation_config.fit_replace)
-
-    def calculate_fr(self):
-        self.fr_pattern = calculate_fr(
-            self.sq_pattern,
-            r=np.arange(self.r_min, self.r_max + self.r_step * 0.5, self.r_step),
-            method=self.transform_config.fourier_transform_method,
-            use_modification_fcn=self.use_modification_fcn)
-
-    def calculate_gr(self):
-        self.gr_pattern = calculate_gr(
-            self.fr_pattern, self.density, self.composition)
+    def cancel_transforms(self):
+        """
+        Cancels the background calculation of the transforms, its results will not be applied.
+        """
+        self._transform_request = None
+        self._transform_worker.cancel()
+
+    @contextmanager
+    def synchronous_transforms(self):
+        """
+        Context in which calculate_transforms calculates the transforms directly, e.g. for optimizations needing the
+        results right away. Running background calculations are cancelled.
+        """
+        background_calculation = self.background_calculation
+        self.background_calculation = False
+        try:
+            yield
+        finally:
+            self.background_calculation = background_calculation
+
+    def _transform_request_progress(self, progress):
+        request, sq_pattern, fr_pattern, gr_pattern = progress
+        if request is self._transform_request and self.optimization_callback is not None:
+            self.optimization_callback(sq_pattern, fr_pattern, gr_pattern)
+
+    def _transform_request_finished(self, request: TransformRequest):
+        # superseded and cancelled requests are discarded
+        if request is not self._transform_request:
+            return
+        self._transform_request = None
+        if request.error is not None:
+            return
 
+        configuration, snapshot = request.configuration, request.snapshot
+        if request.calculated:
+            configuration.stage_cache = snapshot.stage_cache
+            configuration.soller_config.correction = snapshot.soller_config.correction
+            self.soller_interpolation_error = request.soller_interpolation_error
+            if configuration.extrapolation_config.s0_auto:
+                configuration.extrapolation_config.s0 = snapshot.extrapolation_config.s0
+
+            if configuration is self.current_configuration:
+                self.sq_pattern = snapshot.sq_pattern
+                self.fr_pattern = snapshot.fr_pattern
+                self.gr_pattern = snapshot.gr_pattern
+            else:
+                configuration.sq_pattern = snapshot.sq_pattern
+                configuration.fr_pattern = snapshot.fr_pattern
+                configuration.gr_pattern = snapshot.gr_pattern
+        self.data_changed.emit()
 
     def optimize_density_and_scaling(self, density_min, density_max, bkg_min, bkg_max, iterations, callback_fcn=None,
                                      output_txt=None):
@@ -630,7 +606,8 @@ class GlassureModel(QtCore.QObject):
             self.iteration += 1
             return output
 
-        res = minimize(optimization_fcn, params, method='least_squares', xtol=1e-3)
+        with self.synchronous_transforms():
+            res = minimize(optimization_fcn, params, method='least_squares', xtol=1e-3)
         self.write_fit_results(res.params, output_txt)
         return res.params
 
@@ -683,7 +660,8 @@ class GlassureModel(QtCore.QObject):
                 callback_fcn(diamond_content)
             return low_r_pattern.data[1]
 
-        result = minimize(optimization_fcn, params)
+        with self.synchronous_transforms():
+            result = minimize(optimization_fcn, params)
         print(result)
 
     def update_transfer_function(self):
@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import numpy as np
+
+from .configuration import GlassureConfiguration
+from ...core.pattern import Pattern
+from ...core import calculate_sq, calculate_gr, calculate_fr
+from ...core.optimization import optimize_sq
+from ...core.soller_correction import SollerCorrection
+from ...core.stop_condition import StopCondition
+from ...core.utility import convert_density_to_atoms_per_cubic_angstrom, extrapolate_to_zero_linear, \
+    extrapolate_to_zero_step, extrapolate_to_zero_spline, extrapolate_to_zero_poly, calculate_s0
+
+
+class TransformPipeline(object):
+    """
+    Calculates the transforms of a configuration (sample pattern -> S(Q) -> extrapolated S(Q) -> optimized S(Q) ->
+    F(r) -> g(r)). The pipeline only works on the configuration and does not depend on Qt, so that it can run in a
+    background thread on a snapshot of the configuration.
+
+    The result of every stage is cached in configuration.stage_cache and only recalculated when the inputs of the stage
+    changed. The inputs of every stage include the inputs of the upstream stage, so that a change is propagated
+    downstream, while changing e.g. only the r range just recalculates F(r) and g(r).
+
+    :param configuration: configuration to calculate, the patterns and stage results are stored in it
+    :param soller_cache_dir: directory of the disk cache for the soller correction lookup tables, None disables the
+                             cache
+    :param optimization_callback: function called with the S(Q), F(r) and g(r) patterns of every optimization step
+    :param stop_condition: stop condition for interrupting the optimization of S(Q)
+    """
+
+    def __init__(self, configuration: GlassureConfiguration, soller_cache_dir: str = None,
+                 optimization_callback=None, stop_condition: StopCondition = None):
+        self.configuration = configuration
+        self.soller_cache_dir = soller_cache_dir
+        self.optimization_callback = optimization_callback
+        self.stop_condition = stop_condition
+        self.soller_interpolation_error = None
+
+    def run(self) -> bool:
+        """
+        Calculates S(Q), F(r) and g(r) and stores them in the configuration.
+
+        :return: whether the transforms were calculated, which needs a composition and a data pattern and fails when
+                 the optimization was stopped
+        """
+        configuration = self.configuration
+        if len(configuration.sample.composition) == 0 or not configuration.original_pattern:
+            return False
+
+        self.calculate_sample_pattern()
+        self.calculate_sq()
+        self.perform_extrapolation()
+        sq_pattern = self.calculate_optimized_sq()
+        if self.stop_condition is not None and self.stop_condition.stopped:
+            return False
+        fr_pattern = self.calculate_fr()
+        gr_pattern = self.calculate_gr()
+
+        configuration.sq_pattern = sq_pattern
+        configuration.fr_pattern = fr_pattern
+        configuration.gr_pattern = gr_pattern
+        return True
+
+    def _stage(self, name, inputs, calculate):
+        """
+        Returns the result of a stage of the pipeline, either from the stage cache or calculated.
+
+        :param name: name of the stage
+        :param inputs: tuple of all values the stage depends on, needs to be comparable with ==
+        :param calculate: function calculating the result of the stage
+        :return: result of the stage
+        """
+        cache = self.configuration.stage_cache
+        if name in cache and cache[name][0] == inputs:
+            return cache[name][1]
+        result = calculate()
+        cache[name] = (inputs, result)
+        return result
+
+    def _stage_inputs(self, name):
+        return self.configuration.stage_cache[name][0]
+
+    def _stage_result(self, name):
+        return self.configuration.stage_cache[name][1]
+
+    @property
+    def background_pattern(self):
+        configuration = self.configuration
+        if configuration.diamond_bkg_pattern is None:
+            return configuration.background_pattern
+        if configuration.background_pattern is None:
+            return configuration.diamond_bkg_pattern
+        return configuration.background_pattern + configuration.diamond_bkg_pattern
+
+    def calculate_sample_pattern(self) -> Pattern:
+        """
+        Returns the background subtracted sample pattern in the q range, corrected with the transfer function and the
+        soller slit transfer function.
+        """
+        configuration = self.configuration
+        transfer_config = configuration.transfer_config
+        soller_config = configuration.soller_config
+        inputs = (_pattern_state(configuration.original_pattern),
+                  _pattern_state(configuration.background_pattern),
+                  _pattern_state(configuration.diamond_bkg_pattern),
+                  configuration.transform_config.q_min, configuration.transform_config.q_max,
+                  transfer_config.enable, transfer_config.function,
+                  soller_config.enable, sorted(soller_config.parameters.items()))
+        sample_pattern, self.soller_interpolation_error = self._stage(
+            'sample', inputs, self._calculate_sample_pattern)
+        return sample_pattern
+
+    def _calculate_sample_pattern(self):
+        configuration = self.configuration
+        q_min, q_max = configuration.transform_config.q_min, configuration.transform_config.q_max
+        soller_interpolation_error = None
+        if self.background_pattern is not None:
+            sample_pattern = (configuration.original_pattern - self.background_pattern).limit(q_min, q_max)
+        else:
+            sample_pattern = configuration.original_pattern.limit(q_min, q_max)
+
+        transfer_function = configuration.transfer_config.function
+        if configuration.transfer_config.enable and transfer_function is not None:
+            sample_pattern.y = sample_pattern.y * transfer_function(sample_pattern.x)
+
+        if configuration.soller_config.enable:
+            soller_parameters = configuration.soller_config.parameters
+            q, intensity = sample_pattern.data
+            two_theta = np.arcsin(q * soller_parameters['wavelength'] / (4 * np.pi)) * 360 / np.pi
+            # the lookup table is calculated for a wider two theta range than needed and only needs to be
+            # recalculated when the geometry changes or the two theta values are not covered anymore, otherwise the
+            # transfer function is interpolated (e.g. after changing the q range or the wavelength)
+            soller_correction = configuration.soller_config.correction
+            if soller_correction is None or \
+                    soller_correction._max_thickness < soller_parameters['sample_thickness'] or \
+                    not soller_correction.covers_two_theta(two_theta) or \
+                    soller_correction._inner_radius != soller_parameters['inner_radius'] or \
+                    soller_correction._outer_radius != soller_parameters['outer_radius'] or \
+                    soller_correction._inner_width != soller_parameters['inner_width'] or \
+                    soller_correction._outer_width != soller_parameters['outer_width'] or \
+                    soller_correction._inner_length != soller_parameters['inner_length'] or \
+                    soller_correction._outer_length != soller_parameters['outer_length']:
+
+                if 2 > soller_parameters['sample_thickness']:
+                    max_thickness = 2
+                else:
+                    max_thickness = soller_parameters["sample_thickness"] * 1.5
+
+                soller_correction = configuration.soller_config.correction = SollerCorrection(
+                    two_theta=_lookup_two_theta(two_theta),
+                    max_thickness=max_thickness,
+                    inner_radius=soller_parameters['inner_radius'],
+                    outer_radius=soller_parameters['outer_radius'],
+                    inner_width=soller_parameters['inner_width'],
+                    outer_width=soller_parameters['outer_width'],
+                    inner_length=soller_parameters['inner_length'],
+                    outer_length=soller_parameters['outer_length'],
+                    cache_dir=self.soller_cache_dir)
+
+            sample_thickness = soller_parameters['sample_thickness']
+            soller_interpolation_error = soller_correction.interpolation_error(
+                -sample_thickness * 0.5, sample_thickness * 0.5, two_theta)
+            sample_pattern = Pattern(
+                q, soller_correction.transfer_function_sample(sample_thickness, two_theta=two_theta) * intensity)
+
+        return sample_pattern, soller_interpolation_error
+
+    def calculate_sq(self) -> Pattern:
+        sample = self.configuration.sample
+        transform_config = self.configuration.transform_config
+        sample_pattern = self._stage_result('sample')[0]
+        inputs = (self._stage_inputs('sample'), sample.density, dict(sample.composition),
+                  transform_config.normalization_method, transform_config.sq_method, sample.sf_source)
+        return self._stage('sq', inputs, lambda: calculate_sq(
+            sample_pattern,
+            density=sample.density,
+            composition=sample.composition,
+            normalization_method=transform_config.normalization_method,
+            method=transform_config.sq_method,
+            sf_source=sample.sf_source,
+        ))
+
+    def perform_extrapolation(self) -> Pattern:
+        config = self.configuration.extrapolation_config
+        if config.activate and config.s0_auto:
+            config.s0 = calculate_s0(self.configuration.sample.composition, self.configuration.sample.sf_source)
+
+        sq_pattern = self._stage_result('sq')
+        inputs = (self._stage_inputs('sq'), config.activate, config.method, config.s0, config.fit_q_max,
+                  config.fit_replace)
+        return self._stage('extrapolated_sq', inputs, lambda: self._extrapolate(sq_pattern))
+
+    def _extrapolate(self, sq_pattern):
+        config = self.configuration.extrapolation_config
+        if not config.activate:
+            return sq_pattern
+
+        if config.method == 'step':
+            sq_pattern = extrapolate_to_zero_step(sq_pattern, y0=config.s0)
+        elif config.method == 'linear':
+            sq_pattern = extrapolate_to_zero_linear(sq_pattern, y0=config.s0)
+        elif config.method == 'spline':
+            sq_pattern = extrapolate_to_zero_spline(sq_pattern, config.fit_q_max, y0=config.s0,
+                                                    replace=config.fit_replace)
+        elif config.method == 'poly':
+            sq_pattern = extrapolate_to_zero_poly(sq_pattern, config.fit_q_max, y0=config.s0,
+                                                  replace=config.fit_replace)
+        return sq_pattern
+
+    def calculate_optimized_sq(self) -> Pattern:
+        sq_pattern = self._stage_result('extrapolated_sq')
+        config = self.configuration.optimize_config
+        if not config.enable:
+            return self._stage('optimized_sq', (self._stage_inputs('extrapolated_sq'), False), lambda: sq_pattern)
+
+        sample = self.configuration.sample
+        fourier_transform_method = self.configuration.transform_config.fourier_transform_method
+        inputs = (self._stage_inputs('extrapolated_sq'), True, config.r_cutoff, config.iterations, config.attenuation,
+                  sample.density, dict(sample.composition), fourier_transform_method)
+
+        def optimize():
+            return optimize_sq(
+                sq_pattern, config.r_cutoff,
+                iterations=config.iterations,
+                atomic_density=convert_density_to_atoms_per_cubic_angstrom(sample.composition, sample.density),
+                use_modification_fcn=False,
+                attenuation_factor=config.attenuation,
+                fcn_callback=self.optimization_callback,
+                fourier_transform_method=fourier_transform_method,
+                stop_condition=self.stop_condition)
+
+        optimized_sq_pattern = self._stage('optimized_sq', inputs, optimize)
+        if self.stop_condition is not None and self.stop_condition.stopped:
+            # an interrupted optimization is not a valid result of the stage
+            del self.configuration.stage_cache['optimized_sq']
+        return optimized_sq_pattern
+
+    def calculate_fr(self) -> Pattern:
+        transform_config = self.configuration.transform_config
+        r_min, r_max, r_step = transform_config.r_min, transform_config.r_max, transform_config.r_step
+        sq_pattern = self._stage_result('optimized_sq')
+        inputs = (self._stage_inputs('optimized_sq'), r_min, r_max, r_step,
+                  transform_config.fourier_transform_method, transform_config.use_modification_fcn)
+        return self._stage('fr', inputs, lambda: calculate_fr(
+            sq_pattern,
+            r=np.arange(r_min, r_max + r_step * 0.5, r_step),
+            method=transform_config.fourier_transform_method,
+            use_modification_fcn=transform_config.use_modification_fcn))
+
+    def calculate_gr(self) -> Pattern:
+        sample = self.configuration.sample
+        fr_pattern = self._stage_result('fr')
+        inputs = (self._stage_inputs('fr'), sample.density, dict(sample.composition))
+        return self._stage('gr', inputs, lambda: calculate_gr(fr_pattern, sample.density, sample.composition))
+
+
+def _pattern_state(pattern):
+    """
+    Returns a comparable state of a pattern (or None), which changes whenever the data of the pattern change.
+    """
+    return None if pattern is None else pattern.state
+
+
+def _lookup_two_theta(two_theta):
+    """
+    Creates the two theta values (in degree) for the soller correction lookup table, which cover the given two theta
+    values with a margin of 25 % and have the smallest step of the given two theta values.
+    """
+    step = np.min(np.diff(two_theta)) if len(two_theta) > 1 else 0.01
+    lower = 0.8 * np.min(two_theta)
+    upper = max(np.max(two_theta), min(1.25 * np.max(two_theta), 175))
+    return np.append(np.arange(lower, upper, step), upper)
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+import threading
+import traceback
+from copy import copy, deepcopy
+
+from qtpy import QtCore
+
+from .configuration import GlassureConfiguration
+from .transform_pipeline import TransformPipeline
+from ...core.stop_condition import StopCondition
+
+
+class TransformRequest(object):
+    """
+    A single request for calculating the transforms of a configuration in the background. The calculation works on a
+    snapshot of the configuration, so that the parameters can be changed in the GUI while the calculation is running.
+
+    :param configuration: configuration the results belong to
+    :param soller_cache_dir: directory of the disk cache for the soller correction lookup tables, None disables the
+                             cache
+    :param report_progress: whether the worker emits the patterns of every optimization step
+    """
+
+    def __init__(self, configuration: GlassureConfiguration, soller_cache_dir: str = None,
+                 report_progress: bool = False):
+        self.configuration = configuration
+        self.snapshot = snapshot_configuration(configuration)
+        self.soller_cache_dir = soller_cache_dir
+        self.report_progress = report_progress
+        self.stop_condition = StopCondition()
+        self.calculated = False
+        self.soller_interpolation_error = None
+        self.error = None
+
+
+class TransformWorker(QtCore.QObject):
+    """
+    Calculates the transforms of the submitted requests with a TransformPipeline in a QThreadPool. Only the latest
+    submitted request is calculated: a new request cancels the running one (through its stop condition) and replaces a
+    request which is still waiting, so that rapid parameter changes are coalesced into a single calculation.
+
+    The pipeline only works on the snapshot of the request. The finished request (with the patterns in its snapshot)
+    and the patterns of the optimization steps are emitted from the pool thread and are therefore delivered as queued
+    signals to receivers living in the GUI thread.
+    """
+    finished = QtCore.Signal(object)
+    progress = QtCore.Signal(object)
+
+    def __init__(self):
+        super(TransformWorker, self).__init__()
+        self._lock = threading.Lock()
+        self._pending = None
+        self._running = None
+        self._active = False
+        # a single thread, the requests are calculated one after another
+        self._thread_pool = QtCore.QThreadPool()
+        self._thread_pool.setMaxThreadCount(1)
+
+    def submit(self, request: TransformRequest):
+        """
+        Submits a new request and supersedes all previously submitted requests.
+        """
+        with self._lock:
+            self._pending = request
+            if self._running is not None:
+                self._running.stop_condition.cancel()
+            if not self._active:
+                self._active = True
+                self._thread_pool.start(_TransformRunnable(self))
+
+    def cancel(self):
+        """
+        Cancels the running request and discards a waiting request.
+        """
+        with self._lock:
+            self._pending = None
+            if self._running is not None:
+                self._running.stop_condition.cancel()
+
+    @property
+    def busy(self) -> bool:
+        with self._lock:
+            return self._active
+
+    def wait(self, timeout: float = None) -> bool:
+        """
+        Blocks until all submitted requests are calculated. The finished signals are delivered afterwards by the event
+        loop.
+
+        :param timeout: maximum time to wait in seconds, None waits without limit
+        :return: whether all requests were calculated
+        """
+        return self._thread_pool.waitForDone(-1 if timeout is None else int(timeout * 1000))
+
+    def _run(self):
+        while True:
+            with self._lock:
+                request = self._running = self._pending
+                self._pending = None
+                if request is None:
+                    self._active = False
+                    return
+            try:
+                self._calculate(request)
+            except Exception as e:
+                traceback.print_exc()
+                request.error = e
+            with self._lock:
+                self._running = None
+            self.finished.emit(request)
+
+    def _calculate(self, request: TransformRequest):
+        optimization_callback = None
+        if request.report_progress:
+            def optimization_callback(sq_pattern, fr_pattern, gr_pattern):
+                self.progress.emit((request, sq_pattern, fr_pattern, gr_pattern))
+
+        pipeline = TransformPipeline(request.snapshot, request.soller_cache_dir, optimization_callback,
+                                     request.stop_condition)
+        request.calculated = pipeline.run()
+        request.soller_interpolation_error = pipeline.soller_interpolation_error
+
+
+class _TransformRunnable(QtCore.QRunnable):
+    """
+    Runs the calculation loop of a TransformWorker in its thread pool.
+    """
+
+    def __init__(self, worker: TransformWorker):
+        super(_TransformRunnable, self).__init__()
+        self._worker = worker
+
+    def run(self):
+        self._worker._run()
+
+
+def snapshot_configuration(configuration: GlassureConfiguration) -> GlassureConfiguration:
+    """
+    Creates a copy of a configuration with copies of all patterns and parameters used by the transform calculations.
+    The lookup tables (soller correction and transfer function) and the cached stage results are only read and
+    therefore shared with the original configuration.
+    """
+    snapshot = copy(configuration)
+    for name in ['original_pattern', 'background_pattern', 'diamond_bkg_pattern', 'sample', 'transform_config',
+                 'optimize_config', 'extrapolation_config']:
+        setattr(snapshot, name, deepcopy(getattr(configuration, name)))
+    snapshot.soller_config = copy(configuration.soller_config)
+    snapshot.soller_config.parameters = dict(configuration.soller_config.parameters)
+    snapshot.transfer_config = copy(configuration.transfer_config)
+    snapshot.stage_cache = dict(configuration.stage_cache)
+    return snapshot
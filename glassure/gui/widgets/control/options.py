@@ -33,6 +33,12 @@ class OptionsWidget(QtWidgets.QWidget):
         self.fft_cb = QtWidgets.QCheckBox("Use FFT")
         self.fft_cb.setToolTip(
             "Use FFT for Fourier Transform. If not checked, the Fourier integral is solver numerically.")
+        self.fft_method_cb = QtWidgets.QComboBox()
+        self.fft_method_cb.addItems(['FFT', 'DST', 'CZT'])
+        self.fft_method_cb.setToolTip(
+            "FFT: complex fast Fourier transform\n"
+            "DST: real discrete sine transform, about twice as fast as the FFT\n"
+            "CZT: chirp-z transform, evaluates the transform directly on the r grid without interpolation")
 
         self.normalization_method_gb = QtWidgets.QGroupBox("Normalization")
         self.normalization_method_integral = QtWidgets.QRadioButton("Integral")
@@ -101,7 +107,11 @@ class OptionsWidget(QtWidgets.QWidget):
 
         self.main_layout.addLayout(self.choice_layout)
         self.main_layout.addWidget(self.modification_fcn_cb)
-        self.main_layout.addWidget(self.fft_cb)
+        self._fft_layout = QtWidgets.QHBoxLayout()
+        self._fft_layout.setSpacing(5)
+        self._fft_layout.addWidget(self.fft_method_cb)
+        self._fft_layout.addWidget(self.fft_cb)
+        self.main_layout.addLayout(self._fft_layout)
 
         self.setLayout(self.main_layout)
 
@@ -114,6 +124,8 @@ class OptionsWidget(QtWidgets.QWidget):
 
         self.modification_fcn_cb.stateChanged.connect(self.options_changed)
         self.fft_cb.stateChanged.connect(self.options_changed)
+        self.fft_cb.stateChanged.connect(self.update_fft_method_cb)
+        self.fft_method_cb.currentIndexChanged.connect(self.options_changed)
         self.sq_method_FZ.toggled.connect(self.options_changed)
         self.normalization_method_integral.toggled.connect(self.options_changed)
 
@@ -133,6 +145,9 @@ class OptionsWidget(QtWidgets.QWidget):
         self.q_max_txt.setText(f"{factor * q_max:.2f}")
         self.options_changed()
 
+    def update_fft_method_cb(self):
+        self.fft_method_cb.setEnabled(self.fft_cb.isChecked())
+
     def options_changed(self):
         self.options_parameters_changed.emit()
 
@@ -160,16 +175,28 @@ class OptionsWidget(QtWidgets.QWidget):
             return None
 
     def get_fourier_transform_method(self):
-        if self.fft_cb.isChecked():
-            return FourierTransformMethod.FFT
-        else:
+        if not self.fft_cb.isChecked():
             return FourierTransformMethod.INTEGRAL
+        elif self.fft_method_cb.currentText() == 'DST':
+            return FourierTransformMethod.DST
+        elif self.fft_method_cb.currentText() == 'CZT':
+            return FourierTransformMethod.CZT
+        else:
+            return FourierTransformMethod.FFT
 
     def set_fourier_transform_method(self, method):
         if method == 'fft' or method == FourierTransformMethod.FFT:
+            self.fft_method_cb.setCurrentText('FFT')
+            self.fft_cb.setChecked(True)
+        elif method == 'dst' or method == FourierTransformMethod.DST:
+            self.fft_method_cb.setCurrentText('DST')
+            self.fft_cb.setChecked(True)
+        elif method == 'czt' or method == FourierTransformMethod.CZT:
+            self.fft_method_cb.setCurrentText('CZT')
             self.fft_cb.setChecked(True)
         else:
             self.fft_cb.setChecked(False)
+        self.update_fft_method_cb()
 
     def get_transform_configuration(self) -> TransformConfiguration:
         config = TransformConfiguration()
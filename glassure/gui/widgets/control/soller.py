@@ -35,6 +35,12 @@ class SollerWidget(QtWidgets.QWidget):
         self.outer_width_txt = ValueLabelTxtPair("Outer width:", '', "mm", self.param_layout, 7)
         self.inner_length_txt = ValueLabelTxtPair("Inner length:", '', "mm", self.param_layout, 8)
         self.outer_length_txt = ValueLabelTxtPair("Inner length:", '', "mm", self.param_layout, 9)
+        self.param_layout.addWidget(HorizontalLine(), 10, 0, 1, 3)
+        self.cache_cb = QtWidgets.QCheckBox("cache lookup tables on disk")
+        self.cache_cb.setToolTip("Saves the lookup tables to the glassure cache directory (~/.glassure/cache or the\n"
+                                 "GLASSURE_CACHE_DIR environment variable), the least recently used tables are\n"
+                                 "deleted when the cache exceeds 512 MB.")
+        self.param_layout.addWidget(self.cache_cb, 11, 0, 1, 3)
 
         self.param_widget = QtWidgets.QWidget()
         self.param_widget.setLayout(self.param_layout)
@@ -26,6 +26,7 @@ def main():
     if _platform != "Darwin":
         app.setStyle('plastique')
     controller = GlassureController()
+    controller.model.background_calculation = True
     controller.show_window()
     app.exec_()
     del app
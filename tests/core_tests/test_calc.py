@@ -3,12 +3,16 @@
 import os
 import unittest
 import numpy as np
+from scipy.optimize import nnls
 
-from glassure.core import Pattern, calculate_sq
+from glassure.core import Pattern, PatternStack, calculate_sq
 from glassure.core.optimization import optimize_sq
+from glassure.core.methods import FourierTransformMethod
 from glassure.core.calc import calculate_normalization_factor, fit_normalization_factor, calculate_fr, \
-    calculate_sq_from_fr, calculate_gr, calculate_sq_from_gr
-from glassure.core.utility import convert_density_to_atoms_per_cubic_angstrom
+    calculate_sq_from_fr, calculate_gr, calculate_sq_from_gr, calculate_normalization_factor_raw, calculate_sq_raw, \
+    calculate_gr_raw, _nonnegative_least_squares_2d, _sine_transform_operator
+from glassure.core.utility import convert_density_to_atoms_per_cubic_angstrom, calculate_f_squared_mean, \
+    calculate_f_mean_squared, calculate_incoherent_scattering
 from .. import unittest_data_path
 
 sample_path = os.path.join(unittest_data_path, 'Mg2SiO4_ambient.xy')
@@ -38,6 +42,27 @@ class CalcTest(unittest.TestCase):
 
         self.assertAlmostEqual(n_integral, n_fit, places=2)
 
+    def test_fit_normalization_factor_solvers(self):
+        fe_s_pattern = Pattern.from_file(os.path.join(unittest_data_path, 'Fe81S19.chi')) - \
+            0.97 * Pattern.from_file(os.path.join(unittest_data_path, 'Fe81S19_bkg.chi'))
+        for sample_pattern, composition in [(self.sample_pattern.limit(0, 20), self.composition),
+                                            (fe_s_pattern, {'Fe': 0.81, 'S': 0.19})]:
+            for method in ['linear', 'squared']:
+                n_lstsq = fit_normalization_factor(sample_pattern, composition, method=method, solver='lstsq')
+                n_lmfit = fit_normalization_factor(sample_pattern, composition, method=method, solver='lmfit')
+                self.assertAlmostEqual(n_lstsq / n_lmfit, 1, places=5)
+
+        with self.assertRaises(NotImplementedError):
+            fit_normalization_factor(self.sample_pattern.limit(0, 20), self.composition, solver='unknown')
+
+    def test_nonnegative_least_squares_2d(self):
+        x = np.linspace(1, 10, 100)
+        for c1, c2 in [(2, 3), (2, -3), (-2, 3), (-2, -3)]:
+            target = c1 * np.sin(x) + c2 * x + 0.01 * np.cos(5 * x)
+            result = _nonnegative_least_squares_2d(np.sin(x), x, target)
+            expected, _ = nnls(np.stack((np.sin(x), x), axis=1), target)
+            self.assertTrue(np.allclose(result, expected))
+
     def test_fft_implementation_of_calculate_fr(self):
         atomic_density = convert_density_to_atoms_per_cubic_angstrom(self.composition, self.density)
         sq = calculate_sq(self.sample_pattern.limit(0, 20), self.density, self.composition).extend_to(0, 0)
@@ -65,6 +90,66 @@ class CalcTest(unittest.TestCase):
 
         self.assertAlmostEqual(np.mean((sq_fft - sq).limit(5, 20).y ** 2), 0, places=5)
 
+    def test_dst_implementation_of_calculate_fr(self):
+        sq = calculate_sq(self.sample_pattern.limit(0, 20), self.density, self.composition).extend_to(0, 0)
+
+        fr_int = calculate_fr(sq, method='integral')
+        fr_dst = calculate_fr(sq, method='dst')
+        self.assertAlmostEqual(np.mean((fr_int.y - fr_dst.y) ** 2), 0, places=5)
+
+        fr_stack = calculate_fr(PatternStack.from_patterns([sq, sq]), method='dst')
+        self.assertTrue(np.allclose(fr_stack.y[0], fr_dst.y))
+
+    def test_dst_on_offset_q_grid(self):
+        sq = calculate_sq(self.sample_pattern.limit(0, 20), self.density, self.composition).extend_to(0, 0)
+        q_step = 0.02
+        for q_min in [0.5 * q_step, 0.37, 0.3]:
+            q = np.arange(q_min, 20, q_step)
+            sq_offset = Pattern(q, np.interp(q, *sq.data))
+
+            fr_int = calculate_fr(sq_offset, method='integral')
+            fr_dst = calculate_fr(sq_offset, method='dst')
+            np.testing.assert_allclose(fr_dst.y, fr_int.y, atol=1e-4 * np.max(np.abs(fr_int.y)))
+
+    def test_calculate_sq_from_fr_using_dst(self):
+        sq = calculate_sq(self.sample_pattern.limit(0, 20), self.density, self.composition).extend_to(0, 0)
+
+        fr_dst = calculate_fr(sq, r=np.arange(0, 100, 0.01), method=FourierTransformMethod.DST)
+        sq_dst = calculate_sq_from_fr(fr_dst, sq.x, method=FourierTransformMethod.DST)
+
+        self.assertAlmostEqual(np.mean((sq_dst - sq).limit(5, 20).y ** 2), 0, places=5)
+
+    def test_sine_transform_operator(self):
+        sq = calculate_sq(self.sample_pattern.limit(0, 20), self.density, self.composition).extend_to(0, 0)
+        q, sq_y = sq.data
+        for r in [np.arange(0, 1.4, 0.02), self.r]:
+            operator = _sine_transform_operator(q, r, 'integral')
+            self.assertEqual(operator.shape, (len(q), len(r)))
+            np.testing.assert_allclose(np.dot(q * (sq_y - 1), operator),
+                                       calculate_fr(sq, r, method='integral').y, rtol=1e-10, atol=1e-10)
+        for method in ['fft', 'dst', 'czt']:
+            self.assertIsNone(_sine_transform_operator(q, self.r, method))
+
+    def test_czt_implementation_of_calculate_fr(self):
+        sq = calculate_sq(self.sample_pattern.limit(0, 20), self.density, self.composition).extend_to(0, 0)
+
+        for r in [self.r, np.arange(1, 3, 0.001)]:
+            fr_int = calculate_fr(sq, r, method='integral')
+            fr_czt = calculate_fr(sq, r, method='czt')
+            self.assertTrue(np.allclose(fr_int.y, fr_czt.y))
+
+        fr_stack = calculate_fr(PatternStack.from_patterns([sq, sq]), self.r, method=FourierTransformMethod.CZT)
+        self.assertTrue(np.allclose(fr_stack.y[1], calculate_fr(sq, self.r).y))
+
+    def test_calculate_sq_from_fr_using_czt(self):
+        sq = calculate_sq(self.sample_pattern.limit(0, 20), self.density, self.composition).extend_to(0, 0)
+
+        fr = calculate_fr(sq, r=np.arange(0, 100, 0.01), method='integral')
+        sq_int = calculate_sq_from_fr(fr, sq.x[1:], method='integral')
+        sq_czt = calculate_sq_from_fr(fr, sq.x[1:], method='czt')
+
+        self.assertTrue(np.allclose(sq_int.y, sq_czt.y))
+
     def test_calculate_sq_from_gr_using_fft(self):
         atomic_density = convert_density_to_atoms_per_cubic_angstrom(self.composition, self.density)
         sq = calculate_sq(self.sample_pattern.limit(0, 20), self.density, self.composition).extend_to(0, 0)
@@ -76,3 +161,45 @@ class CalcTest(unittest.TestCase):
         sq_fft = calculate_sq_from_gr(gr_fft, sq.x, self.density, self.composition, method='fft')
 
         self.assertAlmostEqual(np.mean((sq_fft - sq).limit(5, 20).y ** 2), 0, places=4)
+
+    def test_pattern_stack_processing(self):
+        q = self.sample_pattern.limit(0, 20).x
+        patterns = [Pattern(q, self.sample_pattern.limit(0, 20).y * scaling) for scaling in [0.8, 1.0, 1.3]]
+        stack = PatternStack.from_patterns(patterns)
+
+        atomic_density = convert_density_to_atoms_per_cubic_angstrom(self.composition, self.density)
+        f_squared_mean = calculate_f_squared_mean(self.composition, q)
+        f_mean_squared = calculate_f_mean_squared(self.composition, q)
+        incoherent_scattering = calculate_incoherent_scattering(self.composition, q)
+
+        n_stack = calculate_normalization_factor_raw(stack, atomic_density, f_squared_mean, f_mean_squared,
+                                                     incoherent_scattering)
+        sq_stack = calculate_sq_raw(stack, f_squared_mean, f_mean_squared, incoherent_scattering, n_stack)
+        self.assertIsInstance(sq_stack, PatternStack)
+
+        for method in ['integral', 'fft']:
+            fr_stack = calculate_fr(sq_stack.extend_to(0, 0), self.r, method=method)
+            gr_stack = calculate_gr_raw(fr_stack, atomic_density)
+            self.assertEqual(gr_stack.y.shape, (3, len(self.r)))
+
+            for ind, pattern in enumerate(patterns):
+                n = calculate_normalization_factor_raw(pattern, atomic_density, f_squared_mean, f_mean_squared,
+                                                       incoherent_scattering)
+                self.assertAlmostEqual(n_stack[ind], n)
+                sq = calculate_sq_raw(pattern, f_squared_mean, f_mean_squared, incoherent_scattering, n)
+                self.assertTrue(np.allclose(sq_stack.y[ind], sq.y))
+
+                fr = calculate_fr(sq.extend_to(0, 0), self.r, method=method)
+                self.assertTrue(np.allclose(fr_stack.y[ind], fr.y))
+                gr = calculate_gr_raw(fr, atomic_density)
+                self.assertTrue(np.allclose(gr_stack.y[ind], gr.y))
+
+    def test_blocked_integral_calculation_of_fr(self):
+        sq = calculate_sq(self.sample_pattern.limit(0, 20), self.density, self.composition).extend_to(0, 0)
+
+        fr = calculate_fr(sq, self.r, method='integral')
+        fr_blocked = calculate_fr(sq, self.r, method='integral', max_memory=8 * len(sq.x) * 100)
+        self.assertTrue(np.allclose(fr.y, fr_blocked.y))
+
+        fr_trapz = 2.0 / np.pi * np.trapz(sq.x * (sq.y - 1) * np.sin(np.outer(self.r, sq.x)), sq.x)
+        self.assertTrue(np.allclose(fr.y, fr_trapz))
@@ -9,6 +9,7 @@ from glassure.core.calc_eggert import calculate_effective_form_factors, calculat
     calculate_incoherent_scattering, calculate_j, calculate_s_inf, calculate_alpha, \
     calculate_coherent_scattering, calculate_sq, calculate_fr, optimize_iq, \
     calculate_chi2_map, optimize_density_and_bkg_scaling, optimize_soller_dac
+from glassure.core.stop_condition import StopCondition
 
 from glassure.core import convert_density_to_atoms_per_cubic_angstrom
 from .. import unittest_data_path
@@ -173,6 +174,20 @@ class CalcEggertTest(unittest.TestCase):
         iq_pattern_optimized = optimize_iq(iq_pattern, 2.4, 10, 0.026, j, s_inf)
         self.assertLess(np.abs(np.mean(iq_pattern_optimized.limit(5, 20).y)), 0.1)
 
+        _, n_iterations, residuals = optimize_iq(iq_pattern, 2.4, 10, 0.026, j, s_inf, return_info=True)
+        self.assertEqual(n_iterations, 10)
+        self.assertEqual(len(residuals), 10)
+
+        tolerance = residuals[3]
+        iq_pattern_converged, n_iterations, converged_residuals = \
+            optimize_iq(iq_pattern, 2.4, 100, 0.026, j, s_inf, tolerance=tolerance * 1.0001, return_info=True)
+        self.assertEqual(n_iterations, 4)
+        np.testing.assert_allclose(converged_residuals, residuals[:4])
+
+        _, n_iterations, _ = optimize_iq(iq_pattern, 2.4, 10, 0.026, j, s_inf, return_info=True,
+                                         stop_condition=StopCondition(max_evaluations=2))
+        self.assertEqual(n_iterations, 2)
+
     def test_calculate_chi2_map(self):
         densities = np.arange(0.02, 0.031, 0.002)
         bkg_scalings = np.arange(0.5, 0.6, 0.02)
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+import unittest
+import pickle
+from copy import copy, deepcopy
+
+import numpy as np
+
+from glassure.core.composition import Composition, as_composition
+from glassure.core.scattering_factors import calculate_form_factors
+from glassure.core.utility import calculate_f_mean_squared, convert_density_to_atoms_per_cubic_angstrom, \
+    normalize_composition
+
+
+class CompositionTest(unittest.TestCase):
+    def setUp(self):
+        self.composition = Composition({'Mg': 2, 'Si': 1, 'O': 4})
+        self.q = np.linspace(0, 20, 1000)
+
+    def test_is_dict(self):
+        self.assertEqual(self.composition, {'Mg': 2, 'Si': 1, 'O': 4})
+        self.assertEqual(self.composition.elements, ['Mg', 'Si', 'O'])
+        self.assertEqual(self.composition.normalized, normalize_composition({'Mg': 2, 'Si': 1, 'O': 4}))
+
+    def test_validation(self):
+        with self.assertRaises(ValueError):
+            Composition({'Si': -1, 'O': 2})
+        with self.assertRaises(ValueError):
+            Composition({'Si': 'a'})
+        with self.assertRaises(ValueError):
+            Composition({'Si': 0, 'O': 0})
+        with self.assertRaises(ValueError):
+            self.composition['O'] = -2
+
+    def test_atomic_weights_and_numbers(self):
+        self.assertTrue(np.allclose(self.composition.atomic_weights, [24.305, 28.0855, 15.9994], atol=1e-3))
+        self.assertTrue(np.array_equal(self.composition.atomic_numbers, [12, 14, 8]))
+        self.assertEqual(self.composition.atomic_number_sum, 2 * 12 + 14 + 4 * 8)
+        self.assertEqual(convert_density_to_atoms_per_cubic_angstrom(self.composition, 2.9),
+                         convert_density_to_atoms_per_cubic_angstrom({'Mg': 2, 'Si': 1, 'O': 4}, 2.9))
+
+    def test_form_factors_are_memoized(self):
+        form_factors = self.composition.form_factors(self.q)
+        self.assertIs(self.composition.form_factors(self.q.copy()), form_factors)
+        self.assertIsNot(self.composition.form_factors(self.q, 'brown_hubbell'), form_factors)
+        self.assertIsNot(self.composition.form_factors(self.q[1:]), form_factors)
+
+        for cached, expected in zip(form_factors, calculate_form_factors(dict(self.composition), self.q)):
+            self.assertTrue(np.array_equal(cached, expected))
+            self.assertFalse(cached.flags.writeable)
+
+        self.assertIs(calculate_f_mean_squared(self.composition, self.q), form_factors[1])
+
+    def test_modification_clears_cache(self):
+        f_mean_squared = self.composition.f_mean_squared(self.q)
+        self.composition['O'] = 3
+        self.assertFalse(np.array_equal(self.composition.f_mean_squared(self.q), f_mean_squared))
+        self.assertTrue(np.array_equal(self.composition.f_mean_squared(self.q),
+                                       calculate_f_mean_squared({'Mg': 2, 'Si': 1, 'O': 3}, self.q)))
+
+        del self.composition['Mg']
+        self.assertEqual(self.composition.elements, ['Si', 'O'])
+        self.assertEqual(self.composition.atomic_number_sum, 14 + 3 * 8)
+
+    def test_copy_and_pickle(self):
+        self.composition.form_factors(self.q)
+        for new_composition in [copy(self.composition), deepcopy(self.composition),
+                                pickle.loads(pickle.dumps(self.composition))]:
+            self.assertIsInstance(new_composition, Composition)
+            self.assertEqual(new_composition, self.composition)
+            new_composition['O'] = 1
+            self.assertEqual(self.composition['O'], 4)
+
+    def test_as_composition(self):
+        self.assertIs(as_composition(self.composition), self.composition)
+        composition = as_composition({'Si': 1, 'O': 2})
+        self.assertIsInstance(composition, Composition)
+        self.assertEqual(composition, {'Si': 1, 'O': 2})
@@ -6,12 +6,16 @@ import numpy as np
 
 from glassure.core import Pattern, convert_density_to_atoms_per_cubic_angstrom
 from glassure.core.utility import extrapolate_to_zero_poly
-from glassure.core.calc import calculate_sq
-from glassure.core.optimization import optimize_sq, optimize_soller_dac
+from glassure.core.calc import calculate_sq, calculate_fr
+from glassure.core.optimization import optimize_sq, optimize_density, optimize_soller_dac, DensityObjective, \
+    calculate_chi2_map, optimize_density_series, optimize_soller_dac_sweep, SqOptimizer
+from glassure.core.stop_condition import StopCondition
 from .. import unittest_data_path
 
 data_path = os.path.join(unittest_data_path, 'Fe81S19.chi')
 background_path = os.path.join(unittest_data_path, 'Fe81S19_bkg.chi')
+mg2sio4_data_path = os.path.join(unittest_data_path, 'Mg2SiO4_ambient.xy')
+mg2sio4_background_path = os.path.join(unittest_data_path, 'Mg2SiO4_ambient_bkg.xy')
 
 
 class OptimizationTest(unittest.TestCase):
@@ -34,6 +38,254 @@ class OptimizationTest(unittest.TestCase):
         sq_optimized = optimize_sq(sq, 1.6, 5, self.atomic_density)
         self.assertFalse(np.allclose(sq.y, sq_optimized.y))
 
+    def test_optimize_sq_matches_straightforward_iteration(self):
+        sq = calculate_sq(self.sample_pattern, self.density, self.composition)
+        sq = extrapolate_to_zero_poly(sq, np.min(sq.x) + 0.3)
+        r_cutoff, iterations = 1.6, 5
+
+        def reference_optimize_sq(sq_pattern, use_modification_fcn, attenuation_factor, method):
+            r = np.arange(0, r_cutoff, 0.02)
+            q, sq_values = sq_pattern.data
+            for _ in range(iterations):
+                fr = calculate_fr(Pattern(q, sq_values), r, use_modification_fcn, method=method).y
+                delta_fr = fr + 4 * np.pi * r * self.atomic_density
+                integral = np.trapz(np.sin(np.outer(q, r)) * delta_fr, r) / attenuation_factor
+                sq_values = sq_values * (1 - 1. / q * integral)
+            return sq_values
+
+        for method in ['integral', 'fft', 'dst', 'czt']:
+            for use_modification_fcn in [False, True]:
+                sq_reference = reference_optimize_sq(sq, use_modification_fcn, 2, method)
+                sq_optimized = optimize_sq(sq, r_cutoff, iterations, self.atomic_density,
+                                           use_modification_fcn=use_modification_fcn, attenuation_factor=2,
+                                           fourier_transform_method=method)
+                np.testing.assert_allclose(sq_optimized.y, sq_reference, rtol=1e-8, atol=1e-10)
+        np.testing.assert_array_equal(sq.x, sq_optimized.x)
+
+    def test_sq_optimizer_uses_fft_for_fft_method(self):
+        sq = calculate_sq(self.sample_pattern, self.density, self.composition)
+        q, sq_values = sq.data
+        r = np.arange(0, 1.6, 0.02)
+
+        optimizer = SqOptimizer(q, r, self.atomic_density, fourier_transform_method='fft')
+        self.assertIsNone(optimizer.forward_operator)
+        np.testing.assert_array_equal(optimizer.calculate_fr(sq_values), calculate_fr(sq, r, method='fft').y)
+        self.assertIsNotNone(SqOptimizer(q, r, self.atomic_density, fourier_transform_method='integral')
+                             .forward_operator)
+
+    def test_optimize_sq_with_tolerance(self):
+        composition = {'Mg': 2, 'Si': 1, 'O': 4}
+        density = 2.9
+        atomic_density = convert_density_to_atoms_per_cubic_angstrom(composition, density)
+        sample_pattern = Pattern.from_file(mg2sio4_data_path) - Pattern.from_file(mg2sio4_background_path)
+        sq = calculate_sq(sample_pattern.limit(0, 20), density, composition).extend_to(0, 0)
+
+        _, n_iterations, fr_residuals = optimize_sq(sq, 1.4, 20, atomic_density, return_info=True)
+        self.assertEqual(n_iterations, 20)
+        self.assertEqual(len(fr_residuals), 20)
+        self.assertTrue(np.all(np.diff(fr_residuals) < 0))
+
+        tolerance = 0.05
+        sq_converged, n_iterations, residuals = optimize_sq(sq, 1.4, 1000, atomic_density, tolerance=tolerance,
+                                                            return_info=True)
+        self.assertEqual(n_iterations, np.argmax(fr_residuals < tolerance) + 1)
+        self.assertLess(residuals[-1], tolerance)
+        np.testing.assert_allclose(residuals, fr_residuals[:n_iterations])
+        np.testing.assert_allclose(sq_converged.y, optimize_sq(sq, 1.4, n_iterations, atomic_density).y)
+
+        _, n_iterations, sq_residuals = optimize_sq(sq, 1.4, 1000, atomic_density, tolerance=1e-3,
+                                                    tolerance_criterion='sq', return_info=True)
+        self.assertLess(n_iterations, 10)
+        self.assertLess(sq_residuals[-1], 1e-3)
+        self.assertGreater(sq_residuals[-2], 1e-3)
+
+        with self.assertRaises(NotImplementedError):
+            optimize_sq(sq, 1.4, 5, atomic_density, tolerance_criterion='gr')
+
+    def test_optimize_sq_with_anderson_acceleration(self):
+        composition = {'Mg': 2, 'Si': 1, 'O': 4}
+        density = 2.9
+        atomic_density = convert_density_to_atoms_per_cubic_angstrom(composition, density)
+        sample_pattern = Pattern.from_file(mg2sio4_data_path) - Pattern.from_file(mg2sio4_background_path)
+        sq = calculate_sq(sample_pattern.limit(0, 20), density, composition).extend_to(0, 0)
+
+        tolerance = 0.01
+        _, n_plain, plain_residuals = optimize_sq(sq, 1.4, 200, atomic_density, tolerance=tolerance,
+                                                  return_info=True)
+        sq_accelerated, n_accelerated, accelerated_residuals = \
+            optimize_sq(sq, 1.4, 200, atomic_density, tolerance=tolerance, anderson_history=5, return_info=True)
+
+        self.assertLess(accelerated_residuals[-1], tolerance)
+        self.assertLess(n_accelerated, n_plain / 3)
+
+        r = np.arange(0, 1.4, 0.02)
+        fr = calculate_fr(sq_accelerated, r).y
+        self.assertLess(np.sqrt(np.mean((fr + 4 * np.pi * r * atomic_density) ** 2)), tolerance)
+
+        with self.assertRaises(ValueError):
+            optimize_sq(sq, 1.4, 5, atomic_density, anderson_history=-1)
+
+    def test_optimize_sq_with_stop_condition(self):
+        sq = calculate_sq(self.sample_pattern, self.density, self.composition)
+        sq = extrapolate_to_zero_poly(sq, np.min(sq.x) + 0.3)
+
+        stop_condition = StopCondition(max_evaluations=3)
+        sq_stopped, n_iterations, _ = optimize_sq(sq, 1.6, 10, self.atomic_density, stop_condition=stop_condition,
+                                                  return_info=True)
+        self.assertEqual(n_iterations, 3)
+        self.assertEqual(stop_condition.reason, 'max_evaluations')
+        np.testing.assert_array_equal(sq_stopped.y, optimize_sq(sq, 1.6, 3, self.atomic_density).y)
+
+        _, n_iterations, _ = optimize_sq(sq, 1.6, 10, self.atomic_density, fcn_callback=lambda *args: False,
+                                         return_info=True)
+        self.assertEqual(n_iterations, 1)
+
+        _, n_iterations, _ = optimize_sq(sq, 1.6, 10, self.atomic_density, fcn_callback=lambda *args: None,
+                                         return_info=True)
+        self.assertEqual(n_iterations, 10)
+
+        stop_condition = StopCondition()
+        stop_condition.cancel()
+        sq_stopped, n_iterations, _ = optimize_sq(sq, 1.6, 10, self.atomic_density, stop_condition=stop_condition,
+                                                  return_info=True)
+        self.assertEqual(n_iterations, 0)
+        np.testing.assert_array_equal(sq_stopped.y, sq.y)
+
+    def test_optimize_density_with_stop_condition(self):
+        stop_condition = StopCondition(max_evaluations=6)
+        density, density_err, background_scaling, background_scaling_err = \
+            optimize_density(self.data_pattern, self.background_pattern, self.background_scaling, self.composition,
+                             initial_density=self.density, background_min=0.8, background_max=1.1, density_min=7,
+                             density_max=9, iterations=2, r_cutoff=1.6, stop_condition=stop_condition)
+        self.assertEqual(stop_condition.evaluations, 6)
+        self.assertTrue(7 <= density <= 9)
+        self.assertTrue(0.8 <= background_scaling <= 1.1)
+        self.assertIsNone(density_err)
+        self.assertIsNone(background_scaling_err)
+
+        evaluations = []
+        optimize_density(self.data_pattern, self.background_pattern, self.background_scaling, self.composition,
+                         initial_density=self.density, background_min=0.8, background_max=1.1, density_min=7,
+                         density_max=9, iterations=2, r_cutoff=1.6,
+                         fcn_callback=lambda iteration, *args: evaluations.append(iteration) or iteration < 4)
+        self.assertEqual(evaluations, [1, 2, 3, 4])
+
+    def test_density_objective(self):
+        composition = {'Mg': 2, 'Si': 1, 'O': 4}
+        data_pattern = Pattern.from_file(mg2sio4_data_path).limit(0, 20)
+        background_pattern = Pattern.from_file(mg2sio4_background_path)
+
+        def reference_objective(background, density, background_scaling, iterations, use_modification_fcn):
+            atomic_density = convert_density_to_atoms_per_cubic_angstrom(composition, density)
+            background = Pattern(background.x, background.y)
+            background.scaling = background_scaling
+            sq = calculate_sq(data_pattern - background, density, composition)
+            sq = extrapolate_to_zero_poly(sq, np.min(sq.x) + 0.2)
+            sq = optimize_sq(sq, 1.4, iterations, atomic_density, use_modification_fcn)
+            r = np.arange(0, 1.4 + 0.005, 0.01)
+            fr = calculate_fr(sq, r, use_modification_fcn).y
+            return (fr + 4 * np.pi * atomic_density * r) ** 2 * 0.01
+
+        for background in [background_pattern.limit(0, 20), background_pattern.limit(0.5, 15)]:
+            for iterations in [0, 3]:
+                for use_modification_fcn in [False, True]:
+                    objective = DensityObjective(data_pattern, background, composition, 1.4, iterations,
+                                                 use_modification_fcn)
+                    for density, background_scaling in [(2.7, 1), (3.4, 0.95)]:
+                        np.testing.assert_allclose(
+                            objective(density, background_scaling),
+                            reference_objective(background, density, background_scaling, iterations,
+                                                use_modification_fcn),
+                            rtol=1e-8, atol=1e-12)
+
+    def test_calculate_chi2_map(self):
+        composition = {'Mg': 2, 'Si': 1, 'O': 4}
+        data_pattern = Pattern.from_file(mg2sio4_data_path).limit(0, 20)
+        background_pattern = Pattern.from_file(mg2sio4_background_path).limit(0, 20)
+        densities = [2.5, 2.9, 3.3]
+        background_scalings = [0.9, 1, 1.1, 1.2]
+
+        chi2, sq_stacks = calculate_chi2_map(data_pattern, background_pattern, composition, densities,
+                                             background_scalings, 1.4, iterations=3, workers=1)
+        self.assertEqual(chi2.shape, (3, 4))
+        self.assertEqual(len(sq_stacks), 3)
+
+        objective = DensityObjective(data_pattern, background_pattern, composition, 1.4, 3)
+        for i, density in enumerate(densities):
+            self.assertEqual(sq_stacks[i].y.shape[0], 4)
+            for j, background_scaling in enumerate(background_scalings):
+                self.assertAlmostEqual(chi2[i, j], np.sum(objective(density, background_scaling)))
+
+        for use_processes in [False, True]:
+            parallel_chi2, parallel_sq_stacks = calculate_chi2_map(data_pattern, background_pattern, composition,
+                                                                   densities, background_scalings, 1.4, iterations=3,
+                                                                   workers=2, use_processes=use_processes)
+            np.testing.assert_allclose(parallel_chi2, chi2)
+            for sq_stack, parallel_sq_stack in zip(sq_stacks, parallel_sq_stacks):
+                np.testing.assert_allclose(parallel_sq_stack.y, sq_stack.y)
+
+    def test_density_objective_tolerance_per_scaling(self):
+        composition = {'Mg': 2, 'Si': 1, 'O': 4}
+        data_pattern = Pattern.from_file(mg2sio4_data_path).limit(0, 20)
+        background_pattern = Pattern.from_file(mg2sio4_background_path).limit(0, 20)
+        objective = DensityObjective(data_pattern, background_pattern, composition, 1.4, 50, tolerance=1e-3)
+
+        outputs, _ = objective.evaluate(2.9, [0.8, 1.2])
+        np.testing.assert_allclose(outputs[0], objective(2.9, 0.8))
+        np.testing.assert_allclose(outputs[1], objective(2.9, 1.2))
+
+    def test_optimize_density_series(self):
+        composition = {'Mg': 2, 'Si': 1, 'O': 4}
+        data_pattern = Pattern.from_file(mg2sio4_data_path).limit(0, 20)
+        background_pattern = Pattern.from_file(mg2sio4_background_path).limit(0, 20)
+        data_patterns = [data_pattern + scaling * background_pattern for scaling in [0, 0.05, 0.1]]
+        args = (data_patterns, background_pattern, 1, composition, 2.9, 0, 1.5, 2, 4, 2, 1.2)
+
+        results = optimize_density_series(*args, warm_start=False)
+        self.assertEqual(len(results), 3)
+        for result, pattern in zip(results, data_patterns):
+            density, _, background_scaling, _ = optimize_density(pattern, background_pattern, 1, composition, 2.9,
+                                                                 0, 1.5, 2, 4, 2, 1.2)
+            self.assertAlmostEqual(result['density'], density)
+            self.assertAlmostEqual(result['background_scaling'], background_scaling)
+        self.assertTrue(np.all(results['time'] > 0))
+        # the added background is found by the background scaling
+        np.testing.assert_allclose(np.diff(results['background_scaling']), 0.05, atol=1e-3)
+
+        warm_results = optimize_density_series(*args)
+        np.testing.assert_allclose(warm_results['density'], results['density'], rtol=1e-3)
+        np.testing.assert_allclose(warm_results['background_scaling'], results['background_scaling'], atol=1e-3)
+        np.testing.assert_array_equal(warm_results['initial_density'][1:], warm_results['density'][:-1])
+
+        chunked_results = optimize_density_series(*args, warm_start=False, chunk_size=2, workers=2)
+        np.testing.assert_allclose(chunked_results['density'], results['density'])
+
+        with self.assertRaises(ValueError):
+            optimize_density_series(data_patterns, [background_pattern], *args[2:])
+
+    def test_density_objective_template(self):
+        composition = {'Mg': 2, 'Si': 1, 'O': 4}
+        data_pattern = Pattern.from_file(mg2sio4_data_path).limit(0, 20)
+        background_pattern = Pattern.from_file(mg2sio4_background_path).limit(0, 20)
+        template = DensityObjective(data_pattern, background_pattern, composition, 1.4, 3)
+
+        data_pattern = data_pattern + 0.1 * background_pattern
+        objective = DensityObjective(data_pattern, background_pattern, composition, 1.4, 3, template=template)
+        self.assertIs(objective._optimizer, template._optimizer)
+        np.testing.assert_allclose(objective(2.9, 0.9),
+                                   DensityObjective(data_pattern, background_pattern, composition, 1.4, 3)(2.9, 0.9))
+
+        objective = DensityObjective(data_pattern.limit(0, 15), background_pattern, composition, 1.4, 3,
+                                     template=template)
+        self.assertIsNot(objective._optimizer, template._optimizer)
+
+    def test_optimize_sq_does_not_modify_input(self):
+        sq = calculate_sq(self.sample_pattern, self.density, self.composition)
+        sq = extrapolate_to_zero_poly(sq, np.min(sq.x) + 0.3)
+        sq_y = sq.y.copy()
+        optimize_sq(sq, 1.6, 5, self.atomic_density, fourier_transform_method='integral')
+        np.testing.assert_array_equal(sq.y, sq_y)
+
     def test_optimize_soller_slit_dac(self):
         self.composition = {'Ar': 1}
         self.r = np.linspace(0.1, 10, 1000)
@@ -69,3 +321,53 @@ class OptimizationTest(unittest.TestCase):
         # self.assertAlmostEqual(diamond_content, 0, places=5)
         self.assertAlmostEqual(bkg_scaling, 0.55, places=2)
         self.assertAlmostEqual(density, 0.026, places=2)
+
+        stop_condition = StopCondition(max_time=0)
+        chi2, density, density_err, bkg_scaling, bkg_scaling_err, diamond_content, diamond_content_err = \
+            optimize_soller_dac(
+                self.data_pattern.limit(0.3, 9),
+                self.bkg_pattern.limit(0.3, 9),
+                self.composition,
+                wavelength=0.37,
+                initial_density=0.030,
+                initial_bkg_scaling=0.55,
+                initial_thickness=initial_thickness,
+                sample_thickness=current_thickness,
+                initial_carbon_content=30,
+                r_cutoff=2.28,
+                iterations=2,
+                use_modification_fcn=True,
+                stop_condition=stop_condition
+            )
+        self.assertEqual(stop_condition.reason, 'max_time')
+        self.assertEqual(stop_condition.evaluations, 1)
+        self.assertAlmostEqual(density, 0.030)
+        self.assertAlmostEqual(bkg_scaling, 0.55)
+        self.assertTrue(np.isfinite(chi2))
+        self.assertIsNone(density_err)
+
+    def test_optimize_soller_dac_sweep(self):
+        data_pattern = Pattern.from_file(os.path.join(unittest_data_path, 'Argon_1GPa.chi'))
+        bkg_pattern = Pattern.from_file(os.path.join(unittest_data_path, 'Argon_1GPa_bkg.chi'))
+        data_pattern = Pattern(data_pattern.x / 10., data_pattern.y).limit(0.3, 9)
+        bkg_pattern = Pattern(bkg_pattern.x / 10., bkg_pattern.y).limit(0.3, 9)
+        args = (data_pattern, bkg_pattern, {'Ar': 1}, 0.030, 0.55, 0.1)
+        kwargs = dict(wavelength=0.37, initial_carbon_content=30, r_cutoff=2.28, iterations=2)
+
+        sweep = optimize_soller_dac_sweep(*args, sample_thicknesses=[0.04, 0.05, 0.08], workers=1, **kwargs)
+        np.testing.assert_array_equal(sweep['sample_thickness'], [0.04, 0.05, 0.08])
+
+        chi2, density, _, bkg_scaling, _, diamond_content, _ = optimize_soller_dac(*args, sample_thickness=0.05,
+                                                                                   **kwargs)
+        self.assertAlmostEqual(sweep['chi2'][1], chi2)
+        self.assertAlmostEqual(sweep['density'][1], density, places=4)
+        self.assertAlmostEqual(sweep['bkg_scaling'][1], bkg_scaling, places=3)
+
+        for use_processes in [False, True]:
+            parallel_sweep = optimize_soller_dac_sweep(*args, sample_thicknesses=[0.04, 0.05, 0.08], workers=3,
+                                                       use_processes=use_processes, **kwargs)
+            for name in ['chi2', 'density', 'bkg_scaling', 'diamond_content']:
+                np.testing.assert_allclose(parallel_sweep[name], sweep[name])
+
+        with self.assertRaises(ValueError):
+            optimize_soller_dac_sweep(*args, sample_thicknesses=[0.05, 0.1], **kwargs)
@@ -1,8 +1,9 @@
 # -*- coding: utf-8 -*-
 import numpy as np
+import pytest
 from pytest import approx
 
-from glassure.core import Pattern
+from glassure.core import Pattern, PatternStack
 
 
 def test_plus_and_minus_operators():
@@ -114,3 +115,103 @@ def test_from_dict():
     assert pattern1.smoothing == pattern2.smoothing
     assert np.array_equal(pattern1.bkg_pattern.x, pattern2.bkg_pattern.x)
     assert np.array_equal(pattern1.bkg_pattern.y, pattern2.bkg_pattern.y)
+
+
+def test_data_is_cached():
+    x = np.linspace(0, 10, 100)
+    pattern = Pattern(x, np.sin(x))
+    pattern.bkg_pattern = Pattern(x, np.cos(x))
+    pattern.smoothing = 1
+
+    x1, y1 = pattern.data
+    x2, y2 = pattern.data
+    assert x1 is x2
+    assert y1 is y2
+
+
+def test_state():
+    x = np.linspace(0, 10, 100)
+    pattern = Pattern(x, np.sin(x))
+    state = pattern.state
+    assert pattern.state == state
+    _ = pattern.data
+    assert pattern.state == state
+
+    pattern.offset = 1
+    assert pattern.state != state
+
+    state = pattern.state
+    bkg_pattern = Pattern(x, np.cos(x))
+    pattern.bkg_pattern = bkg_pattern
+    assert pattern.state != state
+
+    state = pattern.state
+    bkg_pattern.scaling = 0.5
+    assert pattern.state != state
+    assert hash(pattern.state) is not None
+
+
+def test_data_cache_is_invalidated():
+    x = np.linspace(0, 10, 100)
+    pattern = Pattern(x, np.sin(x))
+    bkg_pattern = Pattern(x, np.cos(x))
+    pattern.bkg_pattern = bkg_pattern
+
+    _, y = pattern.data
+    assert np.allclose(y, np.sin(x) - np.cos(x))
+
+    pattern.scaling = 2
+    _, y = pattern.data
+    assert np.allclose(y, 2 * np.sin(x) - np.cos(x))
+
+    pattern.offset = 1
+    _, y = pattern.data
+    assert np.allclose(y, 2 * np.sin(x) + 1 - np.cos(x))
+
+    pattern.y = np.sin(2 * x)
+    _, y = pattern.data
+    assert np.allclose(y, 2 * np.sin(2 * x) + 1 - np.cos(x))
+
+    bkg_pattern.scaling = 0.5
+    _, y = pattern.data
+    assert np.allclose(y, 2 * np.sin(2 * x) + 1 - 0.5 * np.cos(x))
+
+    bkg_pattern.bkg_pattern = Pattern(x, np.ones_like(x))
+    _, y = pattern.data
+    assert np.allclose(y, 2 * np.sin(2 * x) + 1 - 0.5 * np.cos(x) + 1)
+
+    pattern.smoothing = 2
+    _, y_smoothed = pattern.data
+    assert not np.allclose(y, y_smoothed)
+
+    pattern.smoothing = 0
+    pattern.reset_background()
+    _, y = pattern.data
+    assert np.allclose(y, 2 * np.sin(2 * x) + 1)
+
+
+def test_pattern_stack():
+    x = np.linspace(0, 10, 100)
+    patterns = [Pattern(x, np.sin(x) * ind, 'p{}'.format(ind)) for ind in range(5)]
+    stack = PatternStack.from_patterns(patterns)
+
+    assert len(stack) == 5
+    assert stack.y.shape == (5, 100)
+    assert stack.names == ['p0', 'p1', 'p2', 'p3', 'p4']
+    assert stack[3] == patterns[3]
+
+    limited_stack = stack.limit(2, 8)
+    assert limited_stack.y.shape[1] == len(patterns[0].limit(2, 8).x)
+
+    bkg_subtracted_stack = stack - Pattern(x, np.ones_like(x))
+    assert np.allclose(bkg_subtracted_stack.y[2], np.sin(x) * 2 - 1)
+
+    extended_stack = stack.limit(2, 8).extend_to(0, 0)
+    assert extended_stack.x[0] == approx(0)
+    assert np.all(extended_stack.y[:, 0] == 0)
+
+
+def test_pattern_stack_with_different_x():
+    patterns = [Pattern(np.linspace(0, 10, 100)), Pattern(np.linspace(0, 10, 101))]
+    with pytest.raises(ValueError):
+        PatternStack.from_patterns(patterns)
@@ -92,3 +92,65 @@ def test_consistency_between_hubbell_and_hajdu_incoherent_intensity():
         # should be within 5 % of each other
         assert all(val > 0.95 for val in incoherent_hubbell / incoherent_hajdu)
         assert all(val < 1.05 for val in incoherent_hubbell / incoherent_hajdu)
+
+
+def test_vectorized_scattering_factors():
+    q = np.linspace(0.5, 20, 500)
+    elements = ['Si', 'O', 'Mg', 'Fe', 'Ti']
+    for calculator in [ScatteringFactorCalculatorHajdu(), ScatteringFactorCalculatorBrownHubbell()]:
+        f = calculator.get_coherent_scattering_factors(elements, q)
+        incoherent = calculator.get_incoherent_intensities(elements, q)
+        assert f.shape == (len(elements), len(q))
+        assert incoherent.shape == (len(elements), len(q))
+        for ind, element in enumerate(elements):
+            np.testing.assert_allclose(f[ind], calculator.get_coherent_scattering_factor(element, q), rtol=1e-14)
+            np.testing.assert_allclose(incoherent[ind], calculator.get_incoherent_intensity(element, q), rtol=1e-14)
+
+
+def test_calculate_form_factors():
+    from glassure.core.utility import calculate_f_mean_squared, calculate_f_squared_mean, \
+        calculate_incoherent_scattering
+
+    q = np.linspace(0.5, 20, 500)
+    composition = {'Mg': 2, 'Si': 1, 'O': 4}
+    for source in sources:
+        f, f_mean_squared, f_squared_mean, incoherent = calculate_form_factors(composition, q, source)
+        assert f.shape == (3, len(q))
+        np.testing.assert_allclose(f_mean_squared, calculate_f_mean_squared(composition, q, source))
+        np.testing.assert_allclose(f_squared_mean, calculate_f_squared_mean(composition, q, source))
+        np.testing.assert_allclose(incoherent, calculate_incoherent_scattering(composition, q, source))
+
+
+def test_unknown_element_in_vectorized_scattering_factors():
+    with pytest.raises(ElementNotImplementedException):
+        ScatteringFactorCalculatorHajdu().get_coherent_scattering_factors(['Si', 'Xx'], np.linspace(0, 10))
+
+
+def test_tables_are_loaded_lazily():
+    calculator = ScatteringFactorCalculatorBrownHubbell()
+    assert 'coherent_params' not in vars(calculator)
+    assert 'incoherent_intensities' not in vars(calculator)
+
+    calculator.get_coherent_scattering_factor('Si', np.linspace(0, 10))
+    assert 'coherent_params' in vars(calculator)
+    assert 'incoherent_intensities' not in vars(calculator)
+
+
+def test_atomic_weights():
+    atomic_weights = get_atomic_weights()
+    assert atomic_weights['Si'] == 28.0855
+    assert atomic_weights['O'] == 15.9994
+
+
+def test_brown_hubbell_incoherent_splines():
+    from scipy.interpolate import interp1d
+
+    calculator = ScatteringFactorCalculatorBrownHubbell()
+    table = calculator.incoherent_intensities
+    q = np.linspace(0, 30, 1000)
+    for element in ['Si', 'O', 'Mg', 'Fe', 'Ti']:
+        expected = interp1d(table['q'], table[element], kind='cubic')(q)
+        np.testing.assert_allclose(calculator.get_incoherent_intensity(element, q), expected, rtol=1e-12)
+
+    with pytest.raises(ValueError):
+        calculator.get_incoherent_intensity('Si', np.linspace(0, 100))
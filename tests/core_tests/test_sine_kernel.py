@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from glassure.core.sine_kernel import SineKernelCache, sine_transform_integral, trapezoid_weights
+
+
+def test_kernel_is_calculated_once_per_grid():
+    cache = SineKernelCache()
+    q = np.linspace(0, 10, 200)
+    r = np.arange(0, 5, 0.01)
+
+    kernel1 = cache.get(q, r)
+    kernel2 = cache.get(np.linspace(0, 10, 200), np.arange(0, 5, 0.01))
+
+    assert kernel1 is kernel2
+    assert kernel1.shape == (len(q), len(r))
+    assert np.allclose(kernel1, np.sin(np.outer(q, r)))
+    assert len(cache) == 1
+
+
+def test_kernel_is_read_only():
+    cache = SineKernelCache()
+    kernel = cache.get(np.linspace(0, 10, 200), np.arange(0, 5, 0.01))
+    with pytest.raises(ValueError):
+        kernel[0, 0] = 1
+
+
+def test_kernel_with_modification_function():
+    cache = SineKernelCache()
+    q = np.linspace(0.1, 10, 200)
+    r = np.arange(0, 5, 0.01)
+
+    kernel = cache.get(q, r, use_modification_fcn=True)
+    modification = np.sin(q * np.pi / np.max(q)) / (q * np.pi / np.max(q))
+    assert np.allclose(kernel, np.sin(np.outer(q, r)) * modification[:, np.newaxis])
+    assert kernel is not cache.get(q, r)
+    assert len(cache) == 2
+
+
+def test_least_recently_used_kernel_is_evicted():
+    q = np.linspace(0, 10, 100)
+    r1 = np.arange(0, 5, 0.01)
+    r2 = np.arange(0, 5, 0.02)
+    r3 = np.arange(0, 5, 0.03)
+    cache = SineKernelCache(max_memory=8 * len(q) * (len(r1) + len(r2)))
+
+    kernel1 = cache.get(q, r1)
+    cache.get(q, r2)
+    assert cache.get(q, r1) is kernel1  # r1 is now the most recently used kernel
+    cache.get(q, r3)
+
+    assert len(cache) == 2
+    assert cache.get(q, r1) is kernel1
+    assert cache.memory <= cache.max_memory
+
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.memory == 0
+
+
+def test_trapezoid_weights():
+    x = np.concatenate((np.linspace(0, 1, 10), np.linspace(1.2, 5, 30)))
+    y = np.sin(x) * x
+    assert np.dot(trapezoid_weights(x), y) == pytest.approx(np.trapz(y, x))
+
+
+def test_blocked_sine_transform_integral():
+    q = np.linspace(0.1, 20, 2000)
+    y = np.stack((np.sin(q * 2.3) * np.exp(-0.1 * q), np.cos(q * 1.1) * np.exp(-0.2 * q)))
+    r = np.arange(0, 10, 0.01)
+
+    reference = np.trapz(y[:, np.newaxis, :] * np.sin(np.outer(r, q)), q)
+    full = sine_transform_integral(q, y, r)
+    blocked = sine_transform_integral(q, y, r, max_memory=8 * len(q) * 37)
+
+    assert full.shape == (2, len(r))
+    assert np.allclose(full, reference)
+    assert np.allclose(blocked, reference)
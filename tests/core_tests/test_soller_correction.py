@@ -1,11 +1,13 @@
 # -*- coding: utf-8 -*-
 
+import os
 import unittest
+from tempfile import TemporaryDirectory
 
 import numpy as np
 
 from glassure.core import SollerCorrection
-from glassure.core.soller_correction import calculate_angles
+from glassure.core.soller_correction import calculate_angles, limit_cache_size
 
 
 class SollerCorrectionTest(unittest.TestCase):
@@ -26,12 +28,133 @@ class SollerCorrectionTest(unittest.TestCase):
         self.assertEqual(np.min(soller.dispersion_angle_map.Y), -0.15)
         self.assertAlmostEqual(np.max(soller.dispersion_angle_map.Y), 0.15, places=2)
 
+    def test_dispersion_angle_map_chunks(self):
+        two_theta = np.linspace(1, 40, 200)
+        angle_map = SollerCorrection(two_theta, 0.3).dispersion_angle_map.data
+        np.testing.assert_array_equal(SollerCorrection(two_theta, 0.3, chunk_size=7).dispersion_angle_map.data,
+                                      angle_map)
+        np.testing.assert_array_equal(SollerCorrection(two_theta, 0.3, chunk_size=16,
+                                                       workers=4).dispersion_angle_map.data,
+                                      angle_map)
+
+    def test_dispersion_angle_map_values(self):
+        two_theta = np.linspace(1, 40, 200)
+        soller = SollerCorrection(two_theta, 0.3)
+        self.assertTrue(np.all(np.isfinite(soller.dispersion_angle_map.data)))
+        self.assertTrue(np.all(soller.dispersion_angle_map.data >= 0))
+
+        center_ind = np.argmin(np.abs(soller.dispersion_angle_map.Y[:, 0]))
+        self.assertAlmostEqual(soller.dispersion_angle_map.data[center_ind, 0], 8.6619e-4, places=8)
+
     def test_calculate_function_for_region(self):
         two_theta = np.linspace(1, 40, 200)
         soller = SollerCorrection(two_theta, 0.1)
         sample_transfer = soller.transfer_function_from_region(-0.025, 0.025)
         self.assertEqual(two_theta.shape, sample_transfer.shape)
 
+    def test_transfer_function_from_region_matches_region_sum(self):
+        two_theta = np.linspace(1, 40, 200)
+        for dtype, rtol in [(np.float64, 1e-10), (np.float32, 1e-4)]:
+            soller = SollerCorrection(two_theta, 0.1, dtype=dtype)
+            self.assertEqual(soller.dispersion_angle_map.data.dtype, dtype)
+
+            distance = soller.dispersion_angle_map.Y[:, 0]
+            data = soller.dispersion_angle_map.data.astype(np.float64)
+            for d1, d2 in [(-0.025, 0.025), (-0.05, 0.05), (0.01, 0.0105), (-0.04, 0.02), (0.02, 0.06)]:
+                region_sum = np.sum(data[np.logical_and(distance > d1, distance < d2)], 0)
+                np.testing.assert_allclose(soller.transfer_function_from_region(d1, d2),
+                                           np.max(region_sum) / region_sum, rtol=rtol)
+
+    def test_dispersion_angle_map_cache(self):
+        two_theta = np.linspace(1, 40, 200)
+        with TemporaryDirectory() as cache_dir:
+            soller = SollerCorrection(two_theta, 0.1, cache_dir=cache_dir)
+            self.assertEqual(len(os.listdir(cache_dir)), 2)
+
+            cached_soller = SollerCorrection(two_theta, 0.1, cache_dir=cache_dir)
+            self.assertIsInstance(cached_soller.dispersion_angle_map.data, np.memmap)
+            np.testing.assert_array_equal(cached_soller.dispersion_angle_map.data, soller.dispersion_angle_map.data)
+            np.testing.assert_array_equal(cached_soller.dispersion_angle_map.X, soller.dispersion_angle_map.X)
+            np.testing.assert_array_equal(cached_soller.dispersion_angle_map.Y, soller.dispersion_angle_map.Y)
+            np.testing.assert_array_equal(cached_soller.transfer_function_dac(0.05, 0.1),
+                                          soller.transfer_function_dac(0.05, 0.1))
+
+            # a different geometry, two theta grid or dtype is a new entry
+            SollerCorrection(two_theta, 0.1, inner_width=0.1, cache_dir=cache_dir)
+            SollerCorrection(two_theta[1:], 0.1, cache_dir=cache_dir)
+            SollerCorrection(two_theta, 0.1, dtype=np.float32, cache_dir=cache_dir)
+            self.assertEqual(len(os.listdir(cache_dir)), 8)
+
+            # broken cache files are replaced
+            for filename in os.listdir(cache_dir):
+                with open(os.path.join(cache_dir, filename), 'wb') as f:
+                    f.write(b'broken')
+            recalculated_soller = SollerCorrection(two_theta, 0.1, cache_dir=cache_dir)
+            np.testing.assert_array_equal(recalculated_soller.dispersion_angle_map.data,
+                                          soller.dispersion_angle_map.data)
+            self.assertIsInstance(SollerCorrection(two_theta, 0.1, cache_dir=cache_dir).dispersion_angle_map.data,
+                                  np.memmap)
+
+    def test_dispersion_angle_map_cache_size_limit(self):
+        two_theta = np.linspace(1, 40, 200)
+        inner_widths = [0.05, 0.1, 0.15]
+        with TemporaryDirectory() as cache_dir:
+            for inner_width in inner_widths:
+                SollerCorrection(two_theta, 0.1, inner_width=inner_width, cache_dir=cache_dir)
+            self.assertEqual(len(os.listdir(cache_dir)), 6)
+            table_size = sum(os.path.getsize(os.path.join(cache_dir, f)) for f in os.listdir(cache_dir)) / 3
+
+            # loading a table marks it as recently used
+            for filename in os.listdir(cache_dir):
+                os.utime(os.path.join(cache_dir, filename), (0, 0))
+            soller = SollerCorrection(two_theta, 0.1, inner_width=0.05, cache_dir=cache_dir)
+            map_filename, cumulative_filename = soller._cache_filenames(cache_dir, np.float64)
+            self.assertGreater(os.path.getmtime(map_filename), 0)
+            self.assertGreater(os.path.getmtime(cumulative_filename), 0)
+
+            # the least recently used tables are deleted first
+            for last_used, inner_width in enumerate([0.1, 0.15, 0.05]):
+                soller = SollerCorrection(two_theta, 0.1, inner_width=inner_width, cache_dir=cache_dir)
+                for filename in soller._cache_filenames(cache_dir, np.float64):
+                    os.utime(filename, (last_used, last_used))
+            limit_cache_size(cache_dir, 2.5 * table_size)
+            self.assertEqual(len(os.listdir(cache_dir)), 4)
+            for inner_width in [0.15, 0.05]:
+                soller = SollerCorrection(two_theta, 0.1, inner_width=inner_width, cache_dir=cache_dir)
+                self.assertIsInstance(soller.dispersion_angle_map.data, np.memmap)
+
+            # the most recently used table is always kept
+            limit_cache_size(cache_dir, 0)
+            self.assertEqual(sorted(os.listdir(cache_dir)),
+                             sorted(os.path.basename(f) for f in soller._cache_filenames(cache_dir, np.float64)))
+
+            # saving a new table evicts the old tables
+            soller = SollerCorrection(two_theta, 0.1, inner_width=0.2, cache_dir=cache_dir, max_cache_size=0)
+            self.assertEqual(sorted(os.listdir(cache_dir)),
+                             sorted(os.path.basename(f) for f in soller._cache_filenames(cache_dir, np.float64)))
+
+    def test_transfer_function_for_new_two_theta_values(self):
+        soller = SollerCorrection(np.linspace(2, 30, 300), 0.2)
+        two_theta = np.linspace(2.05, 29.9, 123)
+        transfer_function = soller.transfer_function_sample(0.1, two_theta=two_theta)
+        reference = SollerCorrection(two_theta, 0.2).transfer_function_sample(0.1)
+
+        error = soller.interpolation_error(-0.05, 0.05, two_theta)
+        self.assertLess(error, 1e-6)
+        np.testing.assert_allclose(transfer_function, reference, rtol=3 * error)
+
+        coarse_soller = SollerCorrection(np.linspace(2, 30, 30), 0.2)
+        self.assertGreater(coarse_soller.interpolation_error(-0.05, 0.05, two_theta), 10 * error)
+
+        # no interpolation needed for the two theta values of the lookup table
+        self.assertEqual(soller.interpolation_error(-0.05, 0.05, soller.two_theta), 0)
+        np.testing.assert_allclose(soller.transfer_function_sample(0.1, two_theta=soller.two_theta),
+                                   soller.transfer_function_sample(0.1))
+
+        self.assertFalse(soller.covers_two_theta([1, 10]))
+        with self.assertRaises(ValueError):
+            soller.transfer_function_dac(0.1, 0.2, two_theta=np.linspace(10, 40))
+
     def test_calculate_sample_transfer_function(self):
         two_theta = np.linspace(1, 40, 200)
         soller = SollerCorrection(two_theta, 0.1)
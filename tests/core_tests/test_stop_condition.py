@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+import unittest
+import time
+from threading import Thread
+
+import numpy as np
+import lmfit
+
+from glassure.core.stop_condition import StopCondition, check_tolerance_criterion, residual_rms, \
+    minimize_until_stopped
+
+
+class StopConditionTest(unittest.TestCase):
+    def test_no_limits(self):
+        stop_condition = StopCondition()
+        for _ in range(100):
+            stop_condition.count_evaluation()
+        self.assertFalse(stop_condition.stopped)
+        self.assertIsNone(stop_condition.reason)
+
+    def test_max_evaluations(self):
+        stop_condition = StopCondition(max_evaluations=3)
+        for _ in range(2):
+            stop_condition.count_evaluation()
+        self.assertFalse(stop_condition.stopped)
+        stop_condition.count_evaluation()
+        self.assertTrue(stop_condition.stopped)
+        self.assertEqual(stop_condition.reason, 'max_evaluations')
+
+        stop_condition.start()
+        self.assertFalse(stop_condition.stopped)
+
+    def test_max_time(self):
+        stop_condition = StopCondition(max_time=0.01)
+        self.assertFalse(stop_condition.stopped)
+        time.sleep(0.02)
+        self.assertTrue(stop_condition.stopped)
+        self.assertEqual(stop_condition.reason, 'max_time')
+
+    def test_cancel(self):
+        stop_condition = StopCondition()
+        thread = Thread(target=stop_condition.cancel)
+        thread.start()
+        thread.join()
+        self.assertTrue(stop_condition.stopped)
+        self.assertEqual(stop_condition.reason, 'cancelled')
+
+        stop_condition.start()
+        self.assertTrue(stop_condition.cancelled)
+        stop_condition.reset()
+        self.assertFalse(stop_condition.stopped)
+
+    def test_check_callback_result(self):
+        stop_condition = StopCondition()
+        stop_condition.check_callback_result(None)
+        stop_condition.check_callback_result(True)
+        self.assertFalse(stop_condition.stopped)
+        stop_condition.check_callback_result(False)
+        self.assertTrue(stop_condition.cancelled)
+
+    def test_minimize_until_stopped(self):
+        params = lmfit.Parameters()
+        params.add('a', value=0)
+        x = np.linspace(0, 1, 10)
+
+        result = minimize_until_stopped(lambda p: p['a'].value - 2 * x, params, StopCondition(max_evaluations=3))
+        self.assertTrue(result.aborted)
+        self.assertAlmostEqual(result.chisqr, np.sum((result.params['a'].value - 2 * x) ** 2))
+
+        result = minimize_until_stopped(lambda p: p['a'].value - 2 * x, params)
+        self.assertFalse(result.aborted)
+        self.assertAlmostEqual(result.params['a'].value, 1)
+
+    def test_tolerance_helpers(self):
+        self.assertAlmostEqual(residual_rms(np.array([3, -3])), 3)
+        check_tolerance_criterion('fr')
+        check_tolerance_criterion('sq')
+        self.assertRaises(NotImplementedError, check_tolerance_criterion, 'gr')
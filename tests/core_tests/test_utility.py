@@ -6,7 +6,7 @@ from glassure.core.utility import normalize_composition, convert_density_to_atom
     calculate_f_mean_squared, calculate_f_squared_mean, calculate_incoherent_scattering, \
     extrapolate_to_zero_linear, extrapolate_to_zero_poly, extrapolate_to_zero_spline, extrapolate_to_zero_step, \
     convert_two_theta_to_q_space, convert_two_theta_to_q_space_raw, calculate_s0
-from glassure.core import Pattern
+from glassure.core import Pattern, PatternStack
 
 
 class UtilityTest(unittest.TestCase):
@@ -190,6 +190,22 @@ class UtilityTest(unittest.TestCase):
         self.assertAlmostEqual(y1[0], -0.2)
         self.assertAlmostEqual(y1[5], -0.2)
 
+    def test_extrapolation_of_pattern_stack(self):
+        x = np.arange(1, 5.05, 0.05)
+        stack = PatternStack(x, [x ** 2 * 0.2 - 0.3, x ** 2 * 0.3, 0.5 * x - 0.1])
+
+        for extrapolate in [lambda p: extrapolate_to_zero_step(p, 0.1),
+                            lambda p: extrapolate_to_zero_linear(p, 0.1),
+                            lambda p: extrapolate_to_zero_spline(p, 2, y0=0.1),
+                            lambda p: extrapolate_to_zero_poly(p, 2, y0=0.1)]:
+            extrapolated_stack = extrapolate(stack)
+            self.assertIsInstance(extrapolated_stack, PatternStack)
+            self.assertEqual(len(extrapolated_stack), 3)
+            for ind, pattern in enumerate(stack):
+                extrapolated_pattern = extrapolate(pattern)
+                self.assertTrue(np.array_equal(extrapolated_stack.x, extrapolated_pattern.x))
+                self.assertTrue(np.allclose(extrapolated_stack.y[ind], extrapolated_pattern.y))
+
 
     def test_convert_two_theta_to_q_space(self):
         data_theta = np.linspace(0, 25)
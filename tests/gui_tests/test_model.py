@@ -9,6 +9,8 @@ from .test_configuration import create_alternative_configuration, compare_config
 from glassure.core import Pattern
 from glassure.core import calculate_sq
 from glassure.gui.model.glassure_model import GlassureModel
+from glassure.gui.model.transform_pipeline import TransformPipeline
+from glassure.gui.model.transform_worker import snapshot_configuration
 from .utility import data_path
 
 
@@ -107,6 +109,11 @@ def test_changing_fourier_transform_method(setup, model: GlassureModel):
     fr2 = model.fr_pattern
     assert not np.allclose(fr1.y, fr2.y)
 
+    model.transform_config.fourier_transform_method = 'dst'
+    model.calculate_transforms()
+    fr3 = model.fr_pattern
+    assert np.mean((fr3.y - fr2.y) ** 2) < 1e-4
+
 
 def test_calculate_spectra(setup, model):
     model.composition = {'Mg': 2.0, 'Si': 1.0, 'O': 4.0}
@@ -322,3 +329,116 @@ def test_to_json_from_json_multiple(setup, model: GlassureModel, tmpdir):
     assert model2.configurations[1].name == 'laliea'
     assert model2.configurations[2].name == 'lalalala'
     assert model2.configurations[3].name == 'lalalalalalala'
+
+
+def test_background_calculation(qtbot, setup, model: GlassureModel):
+    model.composition = {'Mg': 2.0, 'Si': 1.0, 'O': 4.0}
+    model.optimize = True
+    model.background_calculation = True
+
+    sq_patterns = []
+    model.sq_changed.connect(sq_patterns.append)
+    optimization_steps = []
+    model.optimization_callback = lambda sq_pattern, fr_pattern, gr_pattern: optimization_steps.append(sq_pattern)
+
+    # rapid parameter changes are coalesced into the latest request
+    for density in np.linspace(1.5, 2.5, 10):
+        model.density = density
+    assert model.transforms_pending
+    qtbot.waitUntil(lambda: not model.transforms_pending, timeout=10000)
+    assert len(sq_patterns) == 1
+    assert len(optimization_steps) > 0
+    model.optimization_callback = None
+
+    model.background_calculation = False
+    model.calculate_transforms()
+    assert np.allclose(model.sq_pattern.y, sq_patterns[0].y)
+
+
+def test_background_calculation_is_cancelled(qtbot, setup, model: GlassureModel):
+    model.composition = {'Mg': 2.0, 'Si': 1.0, 'O': 4.0}
+    sq_pattern = model.sq_pattern
+
+    model.background_calculation = True
+    model.density = 1.5
+    model.cancel_transforms()
+    model._transform_worker.wait()
+    qtbot.wait(50)
+    assert not model.transforms_pending
+    assert model.sq_pattern is sq_pattern
+
+
+def test_only_downstream_stages_are_recalculated(setup, model: GlassureModel, monkeypatch):
+    from glassure.gui.model import transform_pipeline
+
+    calls = []
+
+    def count_calls(name, function):
+        def wrapper(*args, **kwargs):
+            calls.append(name)
+            return function(*args, **kwargs)
+
+        monkeypatch.setattr(transform_pipeline, name, wrapper)
+
+    for name in ['calculate_sq', 'optimize_sq', 'calculate_fr', 'calculate_gr']:
+        count_calls(name, getattr(transform_pipeline, name))
+
+    model.auto_update = False
+    model.composition = {'Mg': 2.0, 'Si': 1.0, 'O': 4.0}
+    model.optimize = True
+    model.auto_update = True
+    model.calculate_transforms()
+    assert calls == ['calculate_sq', 'optimize_sq', 'calculate_fr', 'calculate_gr']
+
+    del calls[:]
+    model.calculate_transforms()
+    assert calls == []
+
+    model.r_max = 8
+    assert calls == ['calculate_fr', 'calculate_gr']
+    assert model.fr_pattern.x[-1] == pytest.approx(8)
+
+    del calls[:]
+    model.r_cutoff = 1.2
+    assert calls == ['optimize_sq', 'calculate_fr', 'calculate_gr']
+
+    del calls[:]
+    model.background_scaling = 0.9
+    assert calls == ['calculate_sq', 'optimize_sq', 'calculate_fr', 'calculate_gr']
+
+
+def test_stage_results_are_reused_by_background_calculation(qtbot, setup, model: GlassureModel):
+    model.composition = {'Mg': 2.0, 'Si': 1.0, 'O': 4.0}
+    sq_pattern = model.sq_pattern
+
+    model.background_calculation = True
+    model.r_max = 8
+    qtbot.waitUntil(lambda: not model.transforms_pending, timeout=10000)
+    assert model.sq_pattern is sq_pattern
+    assert model.fr_pattern.x[-1] == pytest.approx(8)
+
+
+def test_transform_pipeline_works_on_a_snapshot(setup, model: GlassureModel):
+    model.composition = {'Mg': 2.0, 'Si': 1.0, 'O': 4.0}
+    configuration = model.current_configuration
+    sq_pattern = model.sq_pattern
+
+    snapshot = snapshot_configuration(configuration)
+    snapshot.sample.density = 1.5
+    snapshot.transform_config.r_max = 8
+    assert TransformPipeline(snapshot).run()
+    assert snapshot.fr_pattern.x[-1] == pytest.approx(8)
+    assert not np.allclose(snapshot.sq_pattern.y, sq_pattern.y)
+
+    # the original configuration is not changed by the calculation on the snapshot
+    assert model.sq_pattern is sq_pattern
+    assert model.density == 2.2
+    assert model.r_max == 10
+
+    model.density = 1.5
+    model.r_max = 8
+    assert np.allclose(model.sq_pattern.y, snapshot.sq_pattern.y)
+    assert np.allclose(model.gr_pattern.y, snapshot.gr_pattern.y)
+
+    snapshot.sample.composition = {}
+    assert not TransformPipeline(snapshot).run()
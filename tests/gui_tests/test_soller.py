@@ -21,3 +21,52 @@ def test_activate_soller_correction(main_controller, soller_widget, composition_
     _, new_sq = model.sq_pattern.data
 
     assert not array_almost_equal(prev_sq, new_sq)
+
+
+def test_soller_correction_is_interpolated_for_new_q_range(main_controller, soller_widget, composition_widget, model,
+                                                           tmp_path, monkeypatch):
+    monkeypatch.setenv('GLASSURE_CACHE_DIR', str(tmp_path))
+    composition_widget.add_element('Mg', 2)
+    composition_widget.add_element('Si', 1)
+    composition_widget.add_element('O', 4)
+
+    prepare_file_loading('Mg2SiO4_ambient.xy')
+    main_controller.load_data()
+    click_checkbox(soller_widget.activate_cb)
+    assert model.soller_cache_dir is None
+    assert len(list(tmp_path.iterdir())) == 0
+
+    soller_correction = model.soller_correction
+    model.q_max = model.q_max - 2
+    assert model.soller_correction is soller_correction
+    assert model.soller_interpolation_error < 1e-4
+    assert len(model.sq_pattern.x) > 0
+
+    parameters = dict(model.soller_parameters)
+    parameters['wavelength'] = parameters['wavelength'] * 1.1
+    model.soller_parameters = parameters
+    assert model.soller_correction is soller_correction
+
+    parameters['inner_width'] = parameters['inner_width'] * 2
+    model.soller_parameters = parameters
+    assert model.soller_correction is not soller_correction
+
+
+def test_soller_cache_is_opt_in(main_controller, soller_widget, composition_widget, model, tmp_path, monkeypatch):
+    monkeypatch.setenv('GLASSURE_CACHE_DIR', str(tmp_path))
+    composition_widget.add_element('Si', 1)
+    composition_widget.add_element('O', 2)
+
+    prepare_file_loading('Mg2SiO4_ambient.xy')
+    main_controller.load_data()
+
+    click_checkbox(soller_widget.activate_cb)
+    assert len(list(tmp_path.iterdir())) == 0
+
+    soller_widget.cache_cb.setChecked(True)
+    assert model.soller_cache_dir == str(tmp_path)
+    model.soller_parameters = dict(model.soller_parameters, inner_width=0.1)
+    assert len(list(tmp_path.iterdir())) == 2
+
+    soller_widget.cache_cb.setChecked(False)
+    assert model.soller_cache_dir is None